@@ -0,0 +1,63 @@
+"""Calibrate CPU threads and prompt batch size for a model and print the results
+
+Usage (from the repository root):
+    python -m scripts.autotune [--model NAME] [--threads 2,4,8] [--batch-sizes 8,128] [--no-save]
+
+Runs the same calibration as AUTOTUNE=true does on first load: every thread
+count x batch size generates AUTOTUNE_MAX_TOKENS tokens for a fixed prompt.
+The table shows prompt-eval time, estimated prompt tokens/s, decode
+tokens/s and the time of a reference request; the chosen configuration is
+marked with *. Unless --no-save is given, the result is stored in
+AUTOTUNE_PATH, replacing any earlier tuning for this host and model, and
+the server uses it on its next start with AUTOTUNE=true. The model file
+must already be present in MODEL_DIR.
+"""
+import os
+import sys
+import json
+import argparse
+from dataclasses import asdict
+from typing import List, Optional
+
+from src.config import get_settings
+from src.services.autotune import TuningStore, format_table, host_key
+from src.services.model_registry import ModelRegistry
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Calibrate n_threads and n_batch for a model")
+    parser.add_argument("--model", default=settings.MODEL_NAME, help="Model file in MODEL_DIR")
+    parser.add_argument("--threads", type=_int_list, help="Thread counts to try (default: derived from the CPUs)")
+    parser.add_argument("--batch-sizes", type=_int_list, help="n_batch values to try (default: AUTOTUNE_BATCH_SIZES)")
+    parser.add_argument("--no-save", action="store_true", help="Only print the results")
+    parser.add_argument("--json", action="store_true", help="Print the tuning as JSON instead of a table")
+    args = parser.parse_args(argv)
+
+    registry = ModelRegistry(settings)
+    if not os.path.exists(registry.model_path(args.model)):
+        print(f"Model file not found: {registry.model_path(args.model)}", file=sys.stderr)
+        return 1
+
+    print(f"Calibrating {args.model} on {host_key()}...", file=sys.stderr)
+    tuning = registry.calibrate(args.model, args.threads, args.batch_sizes)
+
+    if args.json:
+        print(json.dumps(asdict(tuning), indent=2))
+    else:
+        print(format_table(tuning))
+        print(f"\nBest: n_threads={tuning.n_threads} n_batch={tuning.n_batch} "
+              f"(calibration took {tuning.calibration_seconds}s)")
+
+    if not args.no_save:
+        TuningStore(settings.AUTOTUNE_PATH).put(args.model, tuning)
+        print(f"Saved to {settings.AUTOTUNE_PATH}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""Deterministic stand-in for gpt4all.GPT4All, for benchmarks without a real model
+
+Select it with MODEL_FACTORY=scripts.fake_model:FakeGPT4All (run the server
+from the repository root). The latency profile is read from the environment,
+so it also applies inside worker-pool processes:
+
+    FAKE_MODEL_LOAD_SECONDS        time spent in the constructor (default 0)
+    FAKE_MODEL_PROMPT_TPS          prompt evaluation rate, tokens/s (default 400)
+    FAKE_MODEL_TOKENS_PER_SECOND   decode rate, tokens/s (default 20)
+    FAKE_MODEL_OUTPUT_TOKENS       tokens per completion before max_tokens (default 64)
+    FAKE_MODEL_JITTER              +/- fraction applied to every delay (default 0)
+    FAKE_MODEL_BUSY                "1" to spin the CPU instead of sleeping (default 0)
+    FAKE_MODEL_SEED                seed mixed into the per-prompt RNG (default 0)
+
+Output and jitter depend only on the prompt and seed, so runs are repeatable.
+Like llama.cpp, sleeping releases the GIL; FAKE_MODEL_BUSY models a backend
+that holds a core per generation.
+"""
+import os
+import time
+import zlib
+import random
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+_VOCABULARY = [
+    "def", " ", "return", "(", ")", ":", "\n", "    ", "self", ".", "x", "y", " =", " +", " -",
+    "value", "result", "for", " in", " range", "if", " not", "None", "[", "]", ",", "0", "1",
+    "print", "import", " os", "class", " Node", "__init__", "items", "append", "len", "else",
+]
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return max(1, (len(text) + 3) // 4)
+
+
+class FakeGPT4All:
+    """Emits deterministic tokens at a configurable rate and latency profile"""
+
+    def __init__(
+        self,
+        model_name: str,
+        model_path: Optional[str] = None,
+        allow_download: bool = False,
+        n_threads: Optional[int] = None,
+        **kwargs,
+    ):
+        self.model_name = model_name
+        self.n_threads = n_threads
+        self.load_seconds = _env_float("FAKE_MODEL_LOAD_SECONDS", 0.0)
+        self.prompt_tps = _env_float("FAKE_MODEL_PROMPT_TPS", 400.0)
+        self.tokens_per_second = _env_float("FAKE_MODEL_TOKENS_PER_SECOND", 20.0)
+        self.output_tokens = int(_env_float("FAKE_MODEL_OUTPUT_TOKENS", 64))
+        self.jitter = _env_float("FAKE_MODEL_JITTER", 0.0)
+        self.busy = os.environ.get("FAKE_MODEL_BUSY", "0") == "1"
+        self.seed = int(_env_float("FAKE_MODEL_SEED", 0))
+        self._history: Optional[List[str]] = None
+        self._wait(self.load_seconds, random.Random(self.seed))
+
+    def _wait(self, seconds: float, rng: random.Random):
+        if self.jitter:
+            seconds *= 1 + rng.uniform(-self.jitter, self.jitter)
+        if seconds <= 0:
+            return
+        if not self.busy:
+            time.sleep(seconds)
+            return
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            pass
+
+    def _tokens(self, prompt: str, max_tokens: int, rng: random.Random) -> Iterator[str]:
+        # Prompt evaluation happens before the first token, as in llama.cpp
+        self._wait(estimate_tokens(prompt) / self.prompt_tps, rng)
+        for _ in range(min(max_tokens, self.output_tokens)):
+            self._wait(1 / self.tokens_per_second, rng)
+            yield rng.choice(_VOCABULARY)
+
+    def generate(
+        self,
+        prompt: str,
+        max_tokens: int = 200,
+        temp: float = 0.7,
+        top_k: int = 40,
+        top_p: float = 0.4,
+        repeat_penalty: float = 1.18,
+        n_batch: int = 8,
+        streaming: bool = False,
+        callback: Optional[Callable[[int, str], bool]] = None,
+        **kwargs,
+    ):
+        context = "".join(self._history or [])
+        rng = random.Random(zlib.crc32(f"{self.seed}:{context}{prompt}".encode()))
+
+        def stream() -> Iterator[str]:
+            for index, token in enumerate(self._tokens(prompt, max_tokens, rng)):
+                if callback is not None and callback(index, token) is False:
+                    return
+                yield token
+
+        if streaming:
+            return stream()
+        text = "".join(stream())
+        if self._history is not None:
+            self._history.extend((prompt, text))
+        return text
+
+    @contextmanager
+    def chat_session(self, system_prompt: Optional[str] = None, prompt_template: Optional[str] = None):
+        self._history = [system_prompt or ""]
+        try:
+            yield self
+        finally:
+            self._history = None
@@ -0,0 +1,396 @@
+"""Load generator for /generate and /generate/stream
+
+Usage:
+    python scripts/load_test.py --concurrency 1,4,16 --duration 20
+    python scripts/load_test.py --rate 2,5,10 --endpoint stream --output run.json
+    python scripts/load_test.py --url http://127.0.0.1:5000 --concurrency 8
+
+Without --url a server is started with the fake model backend
+(scripts/fake_model.py) in a temporary model directory, so the whole run is
+offline and needs no model file. --fake-* options set its latency profile.
+
+Closed-loop levels (--concurrency) keep N requests outstanding. Open-loop
+levels (--rate) start requests at Poisson arrival times regardless of how
+many are outstanding, and measure latency from the scheduled arrival so
+queueing delay is not hidden. Each level reports p50/p95/p99 latency,
+throughput, error and reject (429/503) rates, time-to-first-token for
+streams, and event-loop lag of both the client and the server (from the
+server's /metrics). Results are printed (or written) as JSON.
+
+Only the standard library is used.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import platform
+import subprocess
+import urllib.parse
+from typing import Any, Dict, List, Optional, Tuple
+
+from startup_benchmark import _poll
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_FACTORY = "scripts.fake_model:FakeGPT4All"
+
+
+class Result:
+    __slots__ = ("status", "latency", "ttft", "tokens", "error")
+
+    def __init__(self, status: int, latency: float, ttft: Optional[float] = None, tokens: Optional[int] = None, error: Optional[str] = None):
+        self.status = status
+        self.latency = latency
+        self.ttft = ttft
+        self.tokens = tokens
+        self.error = error
+
+
+async def _http(host: str, port: int, method: str, path: str, body: bytes = b"") -> Tuple[int, Dict[str, str], bytes, Optional[float]]:
+    """Minimal HTTP/1.1 request; returns status, headers, body and the time the first body bytes arrived"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: {host}:{port}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+        status = int(status_line.split()[1])
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        first_byte_at = None
+        chunks = []
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                break
+            if first_byte_at is None:
+                first_byte_at = time.perf_counter()
+            chunks.append(chunk)
+        raw = b"".join(chunks)
+        if headers.get("transfer-encoding") == "chunked":
+            raw = _dechunk(raw)
+        return status, headers, raw, first_byte_at
+    finally:
+        writer.close()
+
+
+def _dechunk(raw: bytes) -> bytes:
+    body, position = [], 0
+    while position < len(raw):
+        end = raw.index(b"\r\n", position)
+        size = int(raw[position:end].split(b";")[0], 16)
+        if size == 0:
+            break
+        body.append(raw[end + 2:end + 2 + size])
+        position = end + 2 + size + 2
+    return b"".join(body)
+
+
+class LoadGenerator:
+    def __init__(self, url: str, endpoint: str, prompt_size: int, repeat_ratio: float, seed: int):
+        parsed = urllib.parse.urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.endpoint = endpoint
+        self.path = "/generate/stream?format=ndjson" if endpoint == "stream" else "/generate"
+        self.prompt_size = prompt_size
+        self.repeat_ratio = repeat_ratio
+        self.rng = random.Random(seed)
+        self.counter = 0
+
+    def _prompt(self) -> str:
+        # Unique prompts defeat the response cache unless repeats are requested
+        self.counter += 1
+        index = 0 if self.rng.random() < self.repeat_ratio else self.counter
+        text = f"Write a function number {index} that processes a list of records. "
+        return (text * (self.prompt_size // len(text) + 1))[:self.prompt_size]
+
+    async def request(self, started: Optional[float] = None) -> Result:
+        started = started if started is not None else time.perf_counter()
+        body = json.dumps({"prompt": self._prompt(), "bypass_cache": self.repeat_ratio == 0}).encode()
+        try:
+            status, _, raw, first_byte_at = await _http(self.host, self.port, "POST", self.path, body)
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            return Result(0, time.perf_counter() - started, error=f"{type(e).__name__}: {e}")
+        latency = time.perf_counter() - started
+
+        if status != 200 or self.endpoint != "stream":
+            return Result(status, latency, error=None if status == 200 else raw[:200].decode(errors="replace"))
+
+        events = [json.loads(line) for line in raw.decode().splitlines() if line.strip()]
+        done = events[-1] if events else {}
+        if "error" in done or not done.get("done"):
+            return Result(500, latency, error=str(done.get("error", "stream ended without a done event")))
+        ttft = first_byte_at - started if first_byte_at is not None else None
+        return Result(status, latency, ttft=ttft, tokens=done.get("tokens"))
+
+    async def closed_loop(self, concurrency: int, duration: float) -> Tuple[List[Result], float]:
+        deadline = time.perf_counter() + duration
+        results: List[Result] = []
+
+        async def user():
+            while time.perf_counter() < deadline:
+                results.append(await self.request())
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        return results, time.perf_counter() - started
+
+    async def open_loop(self, rate: float, duration: float, max_outstanding: int) -> Tuple[List[Result], float, int]:
+        results: List[Result] = []
+        tasks = set()
+        dropped = 0
+        started = time.perf_counter()
+        arrival = started
+        while True:
+            arrival += self.rng.expovariate(rate)
+            if arrival - started >= duration:
+                break
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(tasks) >= max_outstanding:
+                dropped += 1
+                continue
+            task = asyncio.create_task(self.request(started=arrival))
+            task.add_done_callback(lambda t: (tasks.discard(t), results.append(t.result())))
+            tasks.add(task)
+        if tasks:
+            await asyncio.wait(tasks)
+        return results, time.perf_counter() - started, dropped
+
+    async def server_lag(self) -> Optional[Dict[str, float]]:
+        """Event-loop lag histogram totals from the server's /metrics"""
+        try:
+            status, _, raw, _ = await _http(self.host, self.port, "GET", "/metrics")
+        except OSError:
+            return None
+        if status != 200:
+            return None
+        buckets: Dict[str, float] = {}
+        totals = {"sum": 0.0, "count": 0.0}
+        for line in raw.decode().splitlines():
+            if not line.startswith("cachecow_event_loop_lag_seconds"):
+                continue
+            name, value = line.rsplit(" ", 1)
+            if name.startswith("cachecow_event_loop_lag_seconds_bucket"):
+                buckets[name.split('le="')[1].rstrip('"}')] = float(value)
+            elif name.endswith("_sum"):
+                totals["sum"] = float(value)
+            elif name.endswith("_count"):
+                totals["count"] = float(value)
+        return {**totals, "buckets": buckets}
+
+
+async def _measure_client_lag(samples: List[float], interval: float = 0.05):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - started - interval))
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return round(value * 1000, 2) if value is not None else None
+
+
+def _distribution(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50_ms": _ms(percentile(values, 50)),
+        "p95_ms": _ms(percentile(values, 95)),
+        "p99_ms": _ms(percentile(values, 99)),
+        "max_ms": _ms(max(values) if values else None),
+        "mean_ms": _ms(sum(values) / len(values) if values else None),
+    }
+
+
+def _server_lag_delta(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not before or not after:
+        return None
+    count = after["count"] - before["count"]
+    if count <= 0:
+        return None
+    # p99 as the smallest bucket bound holding 99% of the samples taken during the level
+    p99 = None
+    for bound, cumulative in after["buckets"].items():
+        if cumulative - before["buckets"].get(bound, 0.0) >= 0.99 * count:
+            p99 = bound
+            break
+    return {
+        "mean_ms": _ms((after["sum"] - before["sum"]) / count),
+        "p99_le_ms": _ms(float(p99)) if p99 not in (None, "+Inf") else p99,
+        "samples": int(count),
+    }
+
+
+def summarize(results: List[Result], elapsed: float, dropped: int = 0) -> Dict[str, Any]:
+    ok = [r for r in results if r.status == 200]
+    rejected = [r for r in results if r.status in (429, 503)]
+    errors = [r for r in results if r.status not in (200, 429, 503)]
+    total = len(results) + dropped
+    tokens = sum(r.tokens or 0 for r in ok)
+    summary = {
+        "requests": total,
+        "ok": len(ok),
+        "rejected": len(rejected),
+        "errors": len(errors),
+        "dropped": dropped,
+        "reject_rate": round(len(rejected) / total, 4) if total else 0.0,
+        "error_rate": round((len(errors) + dropped) / total, 4) if total else 0.0,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else None,
+        "latency": _distribution([r.latency for r in ok]),
+    }
+    ttfts = [r.ttft for r in ok if r.ttft is not None]
+    if ttfts:
+        summary["ttft"] = _distribution(ttfts)
+        summary["tokens_per_second"] = round(tokens / elapsed, 2) if elapsed else None
+    if errors:
+        summary["sample_errors"] = sorted({r.error or str(r.status) for r in errors})[:5]
+    return summary
+
+
+async def run_levels(args: argparse.Namespace, url: str) -> List[Dict[str, Any]]:
+    generator = LoadGenerator(url, args.endpoint, args.prompt_size, args.repeat_ratio, args.seed)
+    levels = [("closed", c) for c in args.concurrency] + [("open", r) for r in args.rate]
+    reports = []
+    for mode, value in levels:
+        if args.warmup > 0:
+            await generator.closed_loop(1, args.warmup)
+        client_lag: List[float] = []
+        lag_task = asyncio.create_task(_measure_client_lag(client_lag))
+        lag_before = await generator.server_lag()
+        if mode == "closed":
+            results, elapsed = await generator.closed_loop(int(value), args.duration)
+            dropped = 0
+        else:
+            results, elapsed, dropped = await generator.open_loop(value, args.duration, args.max_outstanding)
+        lag_after = await generator.server_lag()
+        lag_task.cancel()
+
+        report = {"mode": mode, ("concurrency" if mode == "closed" else "rate_rps"): value}
+        report.update(summarize(results, elapsed, dropped))
+        report["client_loop_lag"] = _distribution(client_lag)
+        report["server_loop_lag"] = _server_lag_delta(lag_before, lag_after)
+        reports.append(report)
+        print(
+            f"{mode} {value}: {report['ok']} ok, {report['rejected']} rejected, {report['errors']} errors, "
+            f"p50={report['latency']['p50_ms']}ms p99={report['latency']['p99_ms']}ms, "
+            f"{report['throughput_rps']} req/s",
+            file=sys.stderr,
+        )
+    return reports
+
+
+def start_server(args: argparse.Namespace, port: int, model_dir: str) -> subprocess.Popen:
+    """Start the API with the fake model backend; returns once /ready answers"""
+    model_name = "fake-model.gguf"
+    open(os.path.join(model_dir, model_name), "wb").close()
+    env = {
+        **os.environ,
+        "GPT4ALL_MODEL_DIR": model_dir,
+        "MODEL_NAME": model_name,
+        "MODEL_FACTORY": FAKE_FACTORY,
+        "LOG_LEVEL": "WARNING",
+        "FAKE_MODEL_TOKENS_PER_SECOND": str(args.fake_tps),
+        "FAKE_MODEL_PROMPT_TPS": str(args.fake_prompt_tps),
+        "FAKE_MODEL_OUTPUT_TOKENS": str(args.fake_output_tokens),
+        "FAKE_MODEL_JITTER": str(args.fake_jitter),
+        "FAKE_MODEL_BUSY": "1" if args.fake_busy else "0",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL if not args.server_logs else None,
+    )
+    if _poll(f"http://127.0.0.1:{port}/ready", time.monotonic() + 60, 0.05) is None:
+        server.kill()
+        raise SystemExit("Server did not become ready within 60s")
+    return server
+
+
+def _float_list(value: str) -> List[float]:
+    return [float(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Target an already running server instead of starting one")
+    parser.add_argument("--port", type=int, default=5056, help="Port for the spawned server")
+    parser.add_argument("--endpoint", choices=("generate", "stream"), default="generate")
+    parser.add_argument("--concurrency", type=_float_list, default=[1.0, 4.0, 16.0], help="Closed-loop levels, e.g. 1,4,16")
+    parser.add_argument("--rate", type=_float_list, default=[], help="Open-loop arrival rates in req/s, e.g. 2,5,10")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per level")
+    parser.add_argument("--warmup", type=float, default=1.0, help="Seconds of single-user load before each level")
+    parser.add_argument("--max-outstanding", type=int, default=1000, help="Open-loop cap; arrivals beyond it count as dropped")
+    parser.add_argument("--prompt-size", type=int, default=200, help="Prompt length in characters")
+    parser.add_argument("--repeat-ratio", type=float, default=0.0, help="Fraction of requests reusing one prompt (cache hits)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--fake-tps", type=float, default=20.0, help="Fake model decode tokens/s")
+    parser.add_argument("--fake-prompt-tps", type=float, default=400.0, help="Fake model prompt eval tokens/s")
+    parser.add_argument("--fake-output-tokens", type=int, default=64)
+    parser.add_argument("--fake-jitter", type=float, default=0.0)
+    parser.add_argument("--fake-busy", action="store_true", help="Spin the CPU instead of sleeping")
+    parser.add_argument("--server-logs", action="store_true", help="Show the spawned server's stderr")
+    args = parser.parse_args()
+
+    server = None
+    model_dir = None
+    url = args.url
+    if url is None:
+        model_dir = tempfile.TemporaryDirectory(prefix="cachecow-bench-")
+        server = start_server(args, args.port, model_dir.name)
+        url = f"http://127.0.0.1:{args.port}"
+    try:
+        levels = asyncio.run(run_levels(args, url))
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        if model_dir is not None:
+            model_dir.cleanup()
+
+    report = {
+        "target": url if args.url else "spawned (fake model)",
+        "endpoint": args.endpoint,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "server_logs")},
+        "levels": levels,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
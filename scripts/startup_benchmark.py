@@ -0,0 +1,92 @@
+"""Measure server cold start: time-to-listen (/health) and time-to-ready (/ready)
+
+Usage:
+    python scripts/startup_benchmark.py --runs 5 --port 5055
+
+Each run starts a fresh server process, polls /health until it answers
+(time-to-listen) and /ready until it returns 200 (time-to-ready), then
+stops the server. Results are printed as JSON. Extra environment
+variables (e.g. WARMUP_ENABLED=false) are passed through to the server.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional
+
+
+def _poll(url: str, deadline: float, interval: float) -> Optional[float]:
+    """Return the monotonic time the URL first answered 200, or None on timeout"""
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.monotonic()
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            pass
+        time.sleep(interval)
+    return None
+
+
+def run_once(port: int, timeout: float, interval: float) -> Dict[str, Optional[float]]:
+    started = time.monotonic()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env=os.environ.copy(),
+    )
+    try:
+        deadline = started + timeout
+        listening = _poll(f"http://127.0.0.1:{port}/health", deadline, interval)
+        ready = _poll(f"http://127.0.0.1:{port}/ready", deadline, interval) if listening else None
+        phases = None
+        if ready:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=5) as response:
+                phases = json.load(response)["phases"]
+        return {
+            "time_to_listen_s": round(listening - started, 3) if listening else None,
+            "time_to_ready_s": round(ready - started, 3) if ready else None,
+            "phases": phases,
+        }
+    finally:
+        server.terminate()
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "min": round(min(values), 3),
+        "median": round(statistics.median(values), 3),
+        "max": round(max(values), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--timeout", type=float, default=600.0, help="Per-run timeout in seconds")
+    parser.add_argument("--interval", type=float, default=0.02, help="Polling interval in seconds")
+    args = parser.parse_args()
+
+    runs = [run_once(args.port, args.timeout, args.interval) for _ in range(args.runs)]
+    listen = [r["time_to_listen_s"] for r in runs if r["time_to_listen_s"] is not None]
+    ready = [r["time_to_ready_s"] for r in runs if r["time_to_ready_s"] is not None]
+    print(json.dumps({
+        "runs": runs,
+        "time_to_listen_s": summarize(listen) if listen else None,
+        "time_to_ready_s": summarize(ready) if ready else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from functools import lru_cache
+from typing import Dict, List, Optional
 import os
 
 class Settings(BaseSettings):
@@ -14,12 +15,145 @@ class Settings(BaseSettings):
     MODEL_DIR: str = os.getenv("GPT4ALL_MODEL_DIR", "models")
     MODEL_NAME: str = "llama-2-7b-chat.Q4_0.gguf"  # Using GGUF format for GPU support
     MODEL_PATH: str = os.path.join(MODEL_DIR, MODEL_NAME)
-    MAX_TOKENS: int = 2000
+    MODEL_URL: str = "https://huggingface.co/TheBloke/Llama-2-7B-Chat-GGUF/resolve/main/llama-2-7b-chat.Q4_0.gguf"
+    MODEL_SHA256: Optional[str] = None  # Overrides the manifest/server-published checksum
+    MODEL_MANIFEST_PATH: str = os.path.join(MODEL_DIR, "manifest.json")  # {model_name: {url, sha256, size}}
+    MODEL_DOWNLOAD_CONNECTIONS: int = 8  # Parallel range requests
+    MODEL_DOWNLOAD_PIECE_MB: int = 16  # Size of each range request
+    MAX_TOKENS: int = 2000  # Default when a request does not set max_tokens
+    MAX_TOKENS_LIMIT: int = 4096  # Largest max_tokens a request may ask for
     TEMPERATURE: float = 0.7
-    N_THREADS: int = 4  # Using more threads for GPU acceleration
+    N_THREADS: int = 4  # CPU threads per in-process model instance (see AUTOTUNE)
+    N_BATCH: int = 8  # Prompt tokens evaluated per batch (see AUTOTUNE)
+    MODEL_FACTORY: str = "gpt4all:GPT4All"  # "module:Class" used to construct models
+    TOP_K: int = 40
+    TOP_P: float = 0.9
+    REPEAT_PENALTY: float = 1.1
+    STOP_SEQUENCES: List[str] = []  # Default stop sequences when a request sets none
+    STOP_AT_CODE_BLOCK_END: bool = True  # Stop once the first fenced code block is closed
+    MAX_STOP_SEQUENCES: int = 8
+    MAX_STOP_SEQUENCE_LENGTH: int = 64
+    CONTEXT_LENGTH: int = 2048  # Context window (n_ctx) of models not listed in MODEL_CONTEXT_LENGTHS
+    MODEL_CONTEXT_LENGTHS: Dict[str, int] = {}  # Context window per model
+    CONTEXT_OVERFLOW: str = "reject"  # Prompts that don't fit: "reject" (413), "truncate_start" or "truncate_middle"
+    CONTEXT_MIN_OUTPUT_TOKENS: int = 64  # max_tokens is lowered to fit the window, but not below this
+    PROMPT_TEMPLATE: str = "code"  # Default prompt template (code, complete, tests or raw)
+    PROMPT_TOKENIZER: str = "estimate"  # "estimate", or the path of a Hugging Face tokenizer.json (needs tokenizers)
+    PROMPT_TOKEN_CACHE_SIZE: int = 4096  # Memoized token counts (template parts and repeated prompts)
+    STREAM_QUEUE_SIZE: int = 64  # Tokens buffered between the model thread and a streaming client
+
+    # Auto-tuning: calibrate threads/n_batch per host and model on first load
+    AUTOTUNE: bool = False
+    AUTOTUNE_PATH: str = os.path.join(MODEL_DIR, "autotune.json")  # Stored results, keyed by host and model
+    AUTOTUNE_BATCH_SIZES: List[int] = [8, 32, 128, 512]
+    AUTOTUNE_MAX_TOKENS: int = 32  # Tokens generated per calibration run
+
+    # Model registry settings (MODEL_NAME is the default model)
+    MODELS: List[str] = []  # Additional model files requests may select
+    MODEL_URLS: Dict[str, str] = {}  # Download URL per additional model
+    MODEL_ROUTES: Dict[str, int] = {}  # Model -> max prompt chars it is routed for when none is requested
+    PINNED_MODELS: List[str] = []  # Never evicted
+    PRELOAD_MODELS: List[str] = []  # Loaded at startup besides MODEL_NAME
+    MODEL_MEMORY_BUDGET_MB: int = 0  # RAM for resident models (0 = unlimited)
+    MODEL_CONTEXT_OVERHEAD_MB: int = 512  # Estimated context/KV memory per model replica
+
+    # Inference scheduler settings
+    INFERENCE_CONCURRENCY: int = 1  # Concurrent generations per model instance
+    INFERENCE_QUEUE_SIZE: int = 32  # Queued requests before rejecting with 429
+    INFERENCE_TIMEOUT_SECONDS: Optional[float] = None  # Default per-request deadline
+
+    # Worker pool settings (0 workers = run the model in-process)
+    WORKER_POOL_SIZE: int = 0
+    WORKER_THREADS: int = 4  # Threads per worker process
+    WORKER_HEALTH_INTERVAL_SECONDS: float = 10.0
+    WORKER_MAX_REQUESTS: int = 0  # Recycle a worker after N requests (0 = never)
+    WORKER_MAX_RSS_MB: int = 0  # Recycle a worker above this private memory (0 = no limit)
+
+    # Chat session settings
+    SESSION_MAX_SESSIONS: int = 256  # Sessions kept (live or with transcript only)
+    SESSION_MAX_LIVE: int = 4  # Sessions holding a live model context
+    SESSION_IDLE_TIMEOUT_SECONDS: float = 300.0  # Close idle live contexts after this
+    SESSION_TTL_SECONDS: float = 3600.0  # Forget sessions idle longer than this
+    SESSION_SYSTEM_PROMPT: str = "You are a coding assistant. Return only code without explanations."
+
+    # Batch generation settings
+    BATCH_MAX_ITEMS: int = 10_000
+    BATCH_MAX_IN_FLIGHT: int = 4  # Items per batch queued on the scheduler at once
+    BATCH_MAX_BATCHES: int = 64  # Batches kept (running or awaiting collection)
+    BATCH_TTL_SECONDS: float = 3600.0  # Keep finished batches' results this long
+
+    # Project generation settings
+    PROJECTS_DIR: str = "projects"  # Job manifests and generated files, kept across restarts
+    PROJECT_MAX_PARALLEL_FILES: int = 4  # Files generated at once across all project jobs
+    PROJECT_PRIORITY: str = "low"  # Scheduler priority of project file generations
+    PROJECT_MAX_JOBS: int = 256  # Jobs kept (running or finished); the oldest finished are deleted first
+    PROJECT_TTL_SECONDS: float = 7 * 24 * 3600.0  # Delete finished jobs (manifest and files) after this
+
+    # Sandbox settings (/workflow code execution)
+    SANDBOX_POOL_SIZE: int = 2  # Prewarmed worker processes
+    SANDBOX_MAX_RUNS: int = 100  # Replace a worker after N runs (0 = never); hitting a limit also replaces it
+    SANDBOX_QUEUE_SIZE: int = 32  # Executions waiting for a worker before rejecting with 429
+    SANDBOX_CPU_SECONDS: float = 5.0  # CPU time per run
+    SANDBOX_MEMORY_MB: int = 256  # Address space per run (0 = unlimited)
+    SANDBOX_WALL_SECONDS: float = 10.0  # Longest a run may take (requests may ask for less)
+    SANDBOX_MAX_FILE_MB: int = 16  # Largest file a run may write
+    SANDBOX_MAX_OUTPUT_BYTES: int = 65_536  # stdout/stderr returned per stream; the rest is cut
+    SANDBOX_MAX_CODE_BYTES: int = 262_144
+    SANDBOX_PRELOAD_MODULES: List[str] = [
+        "json", "re", "math", "random", "string", "collections", "itertools", "functools",
+        "dataclasses", "typing", "datetime", "decimal", "fractions", "statistics", "heapq", "bisect",
+    ]  # Imported once per worker instead of on every run
+    SANDBOX_WORKDIR: Optional[str] = None  # Empty directory each worker mounts its private root on (defaults to one in the system temp dir)
+    SANDBOX_SCRATCH_MB: int = 64  # Private /tmp per worker holding the runs' scratch directories
+    SANDBOX_UID: int = 65534  # Runs switch to this uid/gid when the service runs as root ("nobody")
+    SANDBOX_GID: int = 65534
+
+    # Deployment settings (python -m src.serve)
+    HOST: str = "0.0.0.0"
+    PORT: int = 5000
+    HTTP_WORKERS: int = 1  # More than 1 runs the models in a separate inference daemon
+    INFERENCE_SOCKET: Optional[str] = None  # Unix socket of the inference daemon; set = HTTP workers use it
+    INFERENCE_CLIENT_POOL_SIZE: int = 16  # Open daemon connections per HTTP worker (also its concurrency limit)
+    INFERENCE_STATUS_INTERVAL_SECONDS: float = 1.0  # How often HTTP workers refresh the daemon's status
+    INFERENCE_START_TIMEOUT_SECONDS: float = 60.0  # How long the launcher waits for the daemon socket
+
+    # Response cache settings
+    CACHE_ENABLED: bool = True
+    CACHE_MAX_ENTRIES: int = 1024  # In-memory LRU capacity
+    CACHE_TTL_SECONDS: float = 3600.0
+    CACHE_DISK_ENABLED: bool = True
+    CACHE_DISK_PATH: str = os.path.join(MODEL_DIR, "response_cache.sqlite3")
+    CACHE_DISK_MAX_ENTRIES: int = 50_000
+    CACHE_DISK_TTL_SECONDS: float = 7 * 24 * 3600.0
+
+    # Semantic (embedding-similarity) cache settings
+    SEMANTIC_CACHE_ENABLED: bool = False
+    SEMANTIC_CACHE_EMBEDDER: str = "hashing"  # "hashing" (offline) or "gpt4all" (Embed4All)
+    SEMANTIC_CACHE_DIM: int = 1024  # Vector size for the hashing embedder
+    SEMANTIC_CACHE_THRESHOLD: float = 0.85  # Minimum cosine similarity for a hit
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 4096
+
+    # Startup settings
+    WARMUP_ENABLED: bool = True  # Run a short generation before reporting ready
+    WARMUP_PROMPT: str = "def add(a, b):"
+    WARMUP_MAX_TOKENS: int = 8
 
     # Logging
     LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # "json" (one object per line) or "text"
+    LOG_QUEUE_SIZE: int = 10_000  # Records buffered for the writer thread; more are dropped
+    LOG_REQUEST_SAMPLE_RATE: float = 1.0  # Fraction of successful requests summarized (errors always are)
+    LOG_PROMPT_SAMPLE_RATE: float = 1.0  # Fraction of requests whose prompt is logged
+    LOG_PROMPT_MAX_CHARS: int = 200  # Logged prompts are cut to this length
+
+    # Metrics
+    METRICS_ENABLED: bool = True  # Per-route HTTP metrics middleware and /metrics endpoint
+    METRICS_LOOP_LAG_INTERVAL_SECONDS: float = 0.1  # Event-loop lag sampling interval
 
     class Config:
-        env_file = ".env"
\ No newline at end of file
+        env_file = ".env"
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return the process-wide settings (environment and .env parsed once)"""
+    return Settings()
@@ -0,0 +1,61 @@
+"""Run the inference daemon: the models and everything that uses them, served over a Unix socket
+
+Usage (from the repository root):
+    python -m src.daemon [--socket PATH]
+
+HTTP workers started with INFERENCE_SOCKET=PATH forward their requests to
+it. python -m src.serve starts the daemon and the workers together; run this
+directly to manage the daemon separately (for example as its own service).
+"""
+import asyncio
+import argparse
+import signal
+
+from src.config import get_settings
+from src.utils.logger import get_logger, setup_logger
+from src.utils.metrics import monitor_event_loop_lag
+from src.services.gpt4all_service import GPT4ALLService
+from src.services.inference_daemon import InferenceDaemon
+
+
+async def serve(path: str):
+    settings = get_settings()
+    logger = get_logger(__name__)
+    service = GPT4ALLService()
+    daemon = InferenceDaemon(service, path)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    # Same startup as the in-process server (see main.py)
+    background = [asyncio.create_task(service.ensure_initialized()), asyncio.create_task(service.start_sandbox())]
+    service.resume_projects()
+    if settings.METRICS_ENABLED:
+        background.append(asyncio.create_task(monitor_event_loop_lag(settings.METRICS_LOOP_LAG_INTERVAL_SECONDS)))
+
+    await daemon.start()
+    try:
+        await stop.wait()
+    finally:
+        logger.info("Stopping inference daemon")
+        await daemon.close()
+        for task in background:
+            task.cancel()
+        await service.shutdown()
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=settings.INFERENCE_SOCKET, help="Unix socket path (default: INFERENCE_SOCKET)")
+    args = parser.parse_args()
+    if not args.socket:
+        parser.error("no socket path: pass --socket or set INFERENCE_SOCKET")
+    setup_logger()
+    asyncio.run(serve(args.socket))
+
+
+if __name__ == "__main__":
+    main()
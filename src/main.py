@@ -6,16 +6,17 @@ from fastapi.exceptions import RequestValidationError
 import asyncio
 
 from src.routes.api import router
-from src.utils.logger import setup_logger, get_logger
+from src.utils.logger import RequestLogMiddleware, setup_logger, get_logger
 from src.utils.exceptions import CacheCowException
-from src.services.service_container import init_gpt_service
-from src.config import Settings
+from src.utils.metrics import MetricsMiddleware, monitor_event_loop_lag
+from src.services.service_container import init_gpt_service, get_gpt_service
+from src.config import get_settings
 
 # Initialize logger
 logger = setup_logger()
 
 # Load settings
-settings = Settings()
+settings = get_settings()
 
 # Initialize FastAPI app with explicit root path
 app = FastAPI(
@@ -42,6 +43,13 @@ app.add_middleware(
     allowed_hosts=["*"]
 )
 
+# Request IDs and per-request summary logs
+app.add_middleware(RequestLogMiddleware)
+
+# Record per-route request metrics (outermost, so it sees every request)
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize services on startup"""
@@ -52,19 +60,39 @@ async def startup_event():
         # Start model initialization in background
         asyncio.create_task(service.ensure_initialized())
         logger.info("GPT4ALL service initialization started in background")
+        # Pick up project jobs a previous run left unfinished
+        service.resume_projects()
+        # Prewarm the /workflow sandbox workers
+        asyncio.create_task(service.start_sandbox())
+        if settings.METRICS_ENABLED:
+            app.state.loop_lag_monitor = asyncio.create_task(
+                monitor_event_loop_lag(settings.METRICS_LOOP_LAG_INTERVAL_SECONDS)
+            )
     except Exception as e:
         logger.error(f"Error initializing GPT4ALL service: {str(e)}")
         # Let the service endpoints handle the absence of the model
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background inference workers"""
+    monitor = getattr(app.state, "loop_lag_monitor", None)
+    if monitor is not None:
+        monitor.cancel()
+    service = get_gpt_service()
+    if service:
+        await service.shutdown()
+
 # Include API routes
 app.include_router(router)
 
 @app.exception_handler(CacheCowException)
 async def cachecow_exception_handler(request: Request, exc: CacheCowException):
     logger.error(f"CacheCow error: {str(exc)}")
+    retry_after = getattr(exc, "retry_after", None)
     return JSONResponse(
         status_code=exc.status_code,
-        content={"error": str(exc)}
+        content={"error": str(exc)},
+        headers={"Retry-After": str(retry_after)} if retry_after is not None else None
     )
 
 @app.exception_handler(RequestValidationError)
@@ -1,4 +1,5 @@
 from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 
 class GenerateRequest(BaseModel):
     prompt: str = Field(
@@ -6,6 +7,166 @@ class GenerateRequest(BaseModel):
         description="The prompt for code generation",
         example="Write a Python hello world program"
     )
+    bypass_cache: bool = Field(
+        default=False,
+        description="Skip the response cache for this request",
+        example=False
+    )
+    refresh_cache: bool = Field(
+        default=False,
+        description="Ignore any cached response but store the new result",
+        example=False
+    )
+    priority: Literal["high", "normal", "low"] = Field(
+        default="normal",
+        description="Scheduling priority in the inference queue",
+        example="normal"
+    )
+    timeout_seconds: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description="Deadline for the request; queued requests past it are rejected and running generation is stopped",
+        example=60.0
+    )
+    model: Optional[str] = Field(
+        default=None,
+        description="Model to generate with (defaults to routing by prompt size)",
+        example="llama-2-7b-chat.Q4_0.gguf"
+    )
+    max_tokens: Optional[int] = Field(
+        default=None,
+        gt=0,
+        description="Maximum tokens to generate (defaults to the server setting, capped by the server limit)",
+        example=512
+    )
+    temperature: Optional[float] = Field(
+        default=None,
+        ge=0,
+        le=2,
+        description="Sampling temperature",
+        example=0.2
+    )
+    top_k: Optional[int] = Field(
+        default=None,
+        ge=1,
+        le=1000,
+        description="Sample from the k most likely tokens",
+        example=40
+    )
+    top_p: Optional[float] = Field(
+        default=None,
+        gt=0,
+        le=1,
+        description="Nucleus sampling probability mass",
+        example=0.9
+    )
+    stop: Optional[List[str]] = Field(
+        default=None,
+        description="Stop generating as soon as one of these appears (it is not included in the output)",
+        example=["\n\n\n", "# End"]
+    )
+    template: Optional[str] = Field(
+        default=None,
+        description="Prompt template: code, complete, tests or raw (defaults to the server setting)",
+        example="code"
+    )
+    repeat_penalty: Optional[float] = Field(
+        default=None,
+        gt=0,
+        le=2,
+        description="Penalty applied to recently generated tokens (1 = none)",
+        example=1.1
+    )
+
+class BatchItem(BaseModel):
+    id: Optional[str] = Field(
+        default=None,
+        description="Item identifier echoed in its result (defaults to the item's index)",
+        example="job-42"
+    )
+    prompt: str = Field(
+        ...,
+        description="The prompt for code generation",
+        example="Write a Python hello world program"
+    )
+    bypass_cache: bool = Field(
+        default=False,
+        description="Skip the response cache for this item",
+        example=False
+    )
+    refresh_cache: bool = Field(
+        default=False,
+        description="Ignore any cached response but store the new result",
+        example=False
+    )
+    timeout_seconds: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description="Deadline for this item once it is submitted to the inference queue",
+        example=120.0
+    )
+    model: Optional[str] = Field(
+        default=None,
+        description="Model to generate with (defaults to routing by prompt size)",
+        example="llama-2-7b-chat.Q4_0.gguf"
+    )
+    max_tokens: Optional[int] = Field(
+        default=None,
+        gt=0,
+        description="Maximum tokens to generate (defaults to the server setting, capped by the server limit)",
+        example=512
+    )
+    temperature: Optional[float] = Field(
+        default=None,
+        ge=0,
+        le=2,
+        description="Sampling temperature",
+        example=0.2
+    )
+    top_k: Optional[int] = Field(
+        default=None,
+        ge=1,
+        le=1000,
+        description="Sample from the k most likely tokens",
+        example=40
+    )
+    top_p: Optional[float] = Field(
+        default=None,
+        gt=0,
+        le=1,
+        description="Nucleus sampling probability mass",
+        example=0.9
+    )
+    stop: Optional[List[str]] = Field(
+        default=None,
+        description="Stop generating as soon as one of these appears (it is not included in the output)",
+        example=["\n\n\n", "# End"]
+    )
+    template: Optional[str] = Field(
+        default=None,
+        description="Prompt template: code, complete, tests or raw (defaults to the server setting)",
+        example="code"
+    )
+    repeat_penalty: Optional[float] = Field(
+        default=None,
+        gt=0,
+        le=2,
+        description="Penalty applied to recently generated tokens (1 = none)",
+        example=1.1
+    )
+
+class BatchGenerateRequest(BaseModel):
+    items: List[BatchItem] = Field(
+        ...,
+        min_length=1,
+        description="Prompts to generate; identical items are generated once",
+        example=[{"id": "a", "prompt": "Write a Python hello world program"}]
+    )
+    priority: Literal["high", "normal", "low"] = Field(
+        default="low",
+        description="Scheduling priority of the batch's items",
+        example="low"
+    )
 
 class ProjectRequest(BaseModel):
     name: str = Field(
@@ -22,4 +183,62 @@ class ProjectRequest(BaseModel):
         ...,
         description="Project template to use",
         example="python-fastapi"
-    )
\ No newline at end of file
+    )
+
+class SessionCreateRequest(BaseModel):
+    system_prompt: Optional[str] = Field(
+        default=None,
+        description="System prompt shared by every turn (defaults to the server setting)",
+        example="You are a Python expert. Return only code."
+    )
+
+class SessionGenerateRequest(BaseModel):
+    prompt: str = Field(
+        ...,
+        description="Next turn in the conversation",
+        example="Now add unit tests"
+    )
+    priority: Literal["high", "normal", "low"] = Field(
+        default="normal",
+        description="Scheduling priority in the inference queue",
+        example="normal"
+    )
+    timeout_seconds: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description="Deadline for the request; queued requests past it are rejected",
+        example=60.0
+    )
+
+class WorkflowRequest(BaseModel):
+    code: Optional[str] = Field(
+        default=None,
+        description="Python code to execute (give either code or prompt)",
+        example="print(sum(range(10)))"
+    )
+    prompt: Optional[str] = Field(
+        default=None,
+        description="Prompt to generate the code from before executing it",
+        example="Write a Python program that prints the first 10 primes"
+    )
+    stdin: str = Field(
+        default="",
+        description="Standard input for the program",
+        example=""
+    )
+    timeout_seconds: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description="Wall-clock limit for the run (capped by the server limit)",
+        example=5.0
+    )
+    model: Optional[str] = Field(
+        default=None,
+        description="Model to generate with when a prompt is given",
+        example="llama-2-7b-chat.Q4_0.gguf"
+    )
+    priority: Literal["high", "normal", "low"] = Field(
+        default="normal",
+        description="Scheduling priority of the generation in the inference queue",
+        example="normal"
+    )
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 class HealthResponse(BaseModel):
     status: str = Field(
@@ -8,6 +8,29 @@ class HealthResponse(BaseModel):
         example="ok"
     )
 
+class ReadinessResponse(BaseModel):
+    status: str = Field(
+        description="ready, loading or error",
+        example="ready"
+    )
+    ready: bool = Field(
+        description="Whether the model can serve requests",
+        example=True
+    )
+    phases: Dict[str, Dict[str, Any]] = Field(
+        description="Startup phases (download, load, warmup) with status and duration",
+        example={"download": {"status": "done", "duration_ms": 3.1}, "load": {"status": "done", "duration_ms": 2140.5}}
+    )
+    seconds_since_start: float = Field(
+        description="Seconds since the service was created",
+        example=2.4
+    )
+    error: Optional[str] = Field(
+        default=None,
+        description="Initialization error, if any",
+        example=None
+    )
+
 class GenerateResponse(BaseModel):
     code: str = Field(
         description="Generated code output",
@@ -18,6 +41,119 @@ class GenerateResponse(BaseModel):
         description="Generation status",
         example="success"
     )
+    prompt_tokens: Optional[int] = Field(
+        default=None,
+        description="Tokens in the prompt as sent to the model (template included)",
+        example=42
+    )
+
+class SessionResponse(BaseModel):
+    session_id: str = Field(
+        description="Session identifier",
+        example="3f2b6c1e9a8d4e0f8b7a6c5d4e3f2a1b"
+    )
+    live: bool = Field(
+        description="Whether the session currently holds a live model context",
+        example=True
+    )
+    turns: int = Field(
+        description="Number of completed turns",
+        example=2
+    )
+    prompt_tokens: int = Field(
+        description="Prompt tokens submitted across all turns",
+        example=120
+    )
+    completion_tokens: int = Field(
+        description="Tokens generated across all turns",
+        example=640
+    )
+    last_prompt_eval_ms: Optional[float] = Field(
+        default=None,
+        description="Prompt evaluation time (to first token) of the last turn",
+        example=85.3
+    )
+    activations: int = Field(
+        description="Times a live context was (re)built for this session",
+        example=1
+    )
+    created_at: float = Field(
+        description="Creation time (Unix timestamp)",
+        example=1760745600.0
+    )
+
+class SessionGenerateResponse(BaseModel):
+    code: str = Field(
+        description="Generated code output",
+        example="def test_hello_world():\n    assert hello_world() is None"
+    )
+    turn: int = Field(
+        description="Turn number within the session",
+        example=2
+    )
+    completion_tokens: int = Field(
+        description="Tokens generated for this turn",
+        example=42
+    )
+    prompt_eval_ms: Optional[float] = Field(
+        default=None,
+        description="Prompt evaluation time (to first token) for this turn",
+        example=85.3
+    )
+    session: SessionResponse = Field(
+        description="Session state after this turn"
+    )
+    status: str = Field(
+        default="success",
+        description="Generation status",
+        example="success"
+    )
+
+class BatchStatusResponse(BaseModel):
+    batch_id: str = Field(
+        description="Batch identifier",
+        example="9c1d2e3f4a5b6c7d8e9f0a1b2c3d4e5f"
+    )
+    status: str = Field(
+        description="running, completed, cancelled or failed",
+        example="running"
+    )
+    priority: str = Field(
+        description="Scheduling priority of the batch's items",
+        example="low"
+    )
+    items: int = Field(
+        description="Items in the batch",
+        example=1000
+    )
+    unique: int = Field(
+        description="Distinct items after deduplication",
+        example=940
+    )
+    completed: int = Field(
+        description="Items generated successfully",
+        example=312
+    )
+    failed: int = Field(
+        description="Items that failed",
+        example=1
+    )
+    cancelled: int = Field(
+        description="Items cancelled before they ran",
+        example=0
+    )
+    pending: int = Field(
+        description="Items still waiting for a result",
+        example=687
+    )
+    created_at: float = Field(
+        description="Creation time (Unix timestamp)",
+        example=1760745600.0
+    )
+    elapsed_ms: float = Field(
+        description="Time since the batch started (or its total run time once finished)",
+        example=95000.0
+    )
 
 class StatusResponse(BaseModel):
     status: str = Field(
@@ -36,4 +172,98 @@ class StatusResponse(BaseModel):
         default=None,
         description="Error message if any",
         example="Model failed to load"
-    )
\ No newline at end of file
+    )
+    models: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Resident models, their estimated memory and load/eviction counters",
+        example={"resident": [{"name": "llama-2-7b-chat.Q4_0.gguf", "memory_mb": 4300.0}], "budget_mb": 8192}
+    )
+    cache: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Response cache counters (hits, misses, evictions)",
+        example={"hits": 12, "misses": 3, "evictions": 0}
+    )
+    scheduler: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Inference queue depth, wait times and service rate per resident model",
+        example={"llama-2-7b-chat.Q4_0.gguf": {"queue_depth": 2, "avg_wait_ms": 850.0, "rejected": 0}}
+    )
+    workers: Optional[Dict[str, List[Dict[str, Any]]]] = Field(
+        default=None,
+        description="Per-process stats per resident model when running model worker pools",
+        example={"llama-2-7b-chat.Q4_0.gguf": [{"index": 0, "pid": 4242, "alive": True, "inflight": 1}]}
+    )
+    coalescing: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Counters for identical in-flight requests sharing one generation",
+        example={"leaders": 10, "coalesced": 19, "aborted": 0}
+    )
+    sessions: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Chat session and live context counters",
+        example={"sessions": 3, "live": 2, "context_evictions": 0}
+    )
+    batches: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Batch generation counters",
+        example={"running": 1, "items": 5000, "deduplicated": 120}
+    )
+    aborted: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Generations stopped early by client disconnects/cancellation or deadlines, and the tokens that saved",
+        example={"aborted": 4, "by_reason": {"cancelled": 3, "deadline": 1}, "tokens_saved": 5210}
+    )
+    projects: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Project job counters",
+        example={"jobs": 3, "running": 1, "files_generated": 9, "files_from_skeleton": 14}
+    )
+    prompts: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Prompt budgeting: requests prepared, max_tokens clamped, truncated or rejected, token cache",
+        example={"prepared": 120, "max_tokens_clamped": 8, "rejected": 1, "token_cache_hit_ratio": 0.62}
+    )
+    sandbox: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description="Sandbox worker pool: idle/busy workers, queue, runs, reuse and recycles by reason",
+        example={"size": 2, "idle": 2, "busy": 0, "runs": 40, "reuse_ratio": 0.95, "recycled": {"max_runs": 1, "timeout": 1}}
+    )
+
+class ProjectFileResponse(BaseModel):
+    path: str = Field(description="Path inside the project", example="app/main.py")
+    source: str = Field(description="skeleton (static template file) or model", example="model")
+    status: str = Field(description="pending, running, done or failed", example="done")
+    bytes: int = Field(description="Size of the written file", example=812)
+    duration_ms: Optional[float] = Field(default=None, description="Generation time", example=5230.4)
+    error: Optional[str] = Field(default=None, description="Why the file could not be generated", example=None)
+
+class ProjectResponse(BaseModel):
+    project_id: str = Field(description="Job ID", example="3f2a9c0e7b5d4e1f8a6b2c9d0e1f2a3b")
+    name: str = Field(description="Project name", example="my-awesome-project")
+    template: str = Field(description="Project template", example="python-fastapi")
+    status: str = Field(description="pending, running, completed or failed", example="running")
+    error: Optional[str] = Field(default=None, description="Error message if the job failed", example=None)
+    created_at: float = Field(description="Unix time the job was submitted", example=1718000000.0)
+    updated_at: float = Field(description="Unix time of the last progress", example=1718000012.5)
+    files_total: int = Field(description="Files in the project", example=9)
+    files_done: int = Field(description="Files written", example=6)
+    files_failed: int = Field(description="Files that could not be generated", example=0)
+    files_from_skeleton: int = Field(description="Files taken from the template without the model", example=5)
+    files: List[ProjectFileResponse] = Field(description="Per-file progress")
+
+class WorkflowResponse(BaseModel):
+    status: str = Field(description="success (exit code 0) or error", example="success")
+    code: str = Field(description="The code that was executed", example="print(sum(range(10)))")
+    generated: bool = Field(description="Whether the code was generated from the prompt", example=True)
+    exit_code: int = Field(description="Exit status (negative: killed by that signal)", example=0)
+    stdout: str = Field(description="Standard output", example="45\n")
+    stderr: str = Field(description="Standard error (tracebacks end up here)", example="")
+    limit: Optional[str] = Field(
+        default=None,
+        description="Limit that stopped the run: cpu, memory or timeout",
+        example=None
+    )
+    truncated: bool = Field(description="Whether stdout or stderr was cut at the output limit", example=False)
+    duration_ms: float = Field(description="Wall time of the run", example=3.1)
+    cpu_ms: float = Field(description="CPU time of the run", example=2.4)
+    queue_ms: float = Field(description="Time spent waiting for an idle sandbox worker", example=0.1)
@@ -1,9 +1,24 @@
-from fastapi import APIRouter, HTTPException
-from src.models.request_models import GenerateRequest, ProjectRequest
-from src.models.response_models import HealthResponse, GenerateResponse, StatusResponse
-from src.utils.logger import get_logger
-from src.utils.exceptions import ModelLoadError
+import json
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Dict
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from src.models.request_models import (
+    GenerateRequest, BatchGenerateRequest, ProjectRequest, SessionCreateRequest, SessionGenerateRequest,
+    WorkflowRequest
+)
+from src.models.response_models import (
+    HealthResponse, ReadinessResponse, GenerateResponse, BatchStatusResponse, StatusResponse, SessionResponse,
+    SessionGenerateResponse, ProjectResponse, WorkflowResponse
+)
+from src.utils.logger import get_logger, loggable_prompt, mark, span
+from src.utils.exceptions import (
+    BatchNotFoundError, ClientDisconnectedError, ModelLoadError, ProjectNotFoundError, PromptTooLongError,
+    SandboxUnavailableError, ServiceOverloadedError, SessionNotFoundError, ValidationError
+)
 from src.services.service_container import get_gpt_service
+from src.utils import metrics
+from src.config import get_settings
 
 router = APIRouter(tags=["API"])  # Add tags for better documentation organization
 
@@ -11,10 +26,38 @@ logger = get_logger(__name__)
 
 @router.get("/health", response_model=HealthResponse)
 async def health_check():
-    """Health check endpoint"""
+    """Liveness check: the process is up (see /ready for model readiness)"""
     logger.debug("Health check endpoint called")
     return HealthResponse(status="ok")
 
+@router.get("/ready", response_model=ReadinessResponse, responses={503: {"model": ReadinessResponse}})
+async def readiness_check():
+    """Readiness check: 200 once the model is downloaded, loaded and warmed up, 503 before"""
+    gpt_service = get_gpt_service()
+    readiness = ReadinessResponse(**gpt_service.readiness())
+    if not readiness.ready:
+        return JSONResponse(status_code=503, content=readiness.model_dump())
+    return readiness
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus text-format metrics"""
+    if not get_settings().METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    get_gpt_service()  # registers the service's scrape-time collectors
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@router.get("/metrics/inference", include_in_schema=False)
+async def get_inference_metrics():
+    """Prometheus text-format metrics of the process running the models (the inference daemon in split mode)"""
+    if not get_settings().METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    try:
+        content = await get_gpt_service().inference_metrics()
+    except ModelLoadError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return Response(content=content, media_type=metrics.CONTENT_TYPE)
+
 @router.get("/status", response_model=StatusResponse)
 async def get_status():
     """Get CacheCow Engine runtime status"""
@@ -24,7 +67,18 @@ async def get_status():
         return StatusResponse(
             status="operational",
             model_loaded=model_loaded,
-            version="1.0.0"
+            version="1.0.0",
+            models=gpt_service.model_stats() if gpt_service else None,
+            cache=gpt_service.cache_stats() if gpt_service else None,
+            scheduler=gpt_service.scheduler_stats() if gpt_service else None,
+            workers=gpt_service.worker_stats() if gpt_service else None,
+            coalescing=gpt_service.coalescing_stats() if gpt_service else None,
+            sessions=gpt_service.session_stats() if gpt_service else None,
+            batches=gpt_service.batch_stats() if gpt_service else None,
+            projects=gpt_service.project_stats() if gpt_service else None,
+            aborted=gpt_service.abort_stats() if gpt_service else None,
+            prompts=gpt_service.prompt_stats() if gpt_service else None,
+            sandbox=gpt_service.sandbox_stats() if gpt_service else None
         )
     except Exception as e:
         logger.error(f"Error checking status: {str(e)}")
@@ -35,8 +89,32 @@ async def get_status():
             error=str(e)
         )
 
+async def _wait_for_disconnect(http_request: Request):
+    """Return once the client closes the connection (the request body is already read)"""
+    while True:
+        message = await http_request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+async def _unless_disconnected(http_request: Request, awaitable: Awaitable[Any]) -> Any:
+    """Await awaitable, cancelling it (and the generation behind it) if the client goes away first"""
+    task = asyncio.ensure_future(awaitable)
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(http_request))
+    try:
+        await asyncio.wait({task, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        disconnect.cancel()
+        raise
+    disconnect.cancel()
+    if not task.done():
+        task.cancel()
+        await asyncio.wait({task})
+        raise ClientDisconnectedError()
+    return task.result()
+
 @router.post("/generate", response_model=GenerateResponse)
-async def generate_code(request: GenerateRequest):
+async def generate_code(request: GenerateRequest, http_request: Request):
     """
     Generate code based on prompt
 
@@ -47,22 +125,114 @@ async def generate_code(request: GenerateRequest):
     }
     ```
     """
+    mark("validation")  # request body received, parsed and validated
     try:
-        logger.info(f"Received generation request with prompt: {request.prompt}")
+        logger.info(
+            "Received generation request",
+            extra={"prompt": loggable_prompt(request.prompt), "prompt_chars": len(request.prompt)}
+        )
 
         gpt_service = get_gpt_service()
         if not gpt_service:
             raise ModelLoadError("GPT service not initialized")
 
-        await gpt_service.ensure_initialized()  # Ensure model is loaded
-
-        generated_code = await gpt_service.generate(request.prompt)
+        # generate() loads the model on demand, so cache hits don't wait for it
+        generated_code, prepared = await _unless_disconnected(http_request, gpt_service.generate_result(
+            request.prompt,
+            bypass_cache=request.bypass_cache,
+            refresh_cache=request.refresh_cache,
+            priority=request.priority,
+            timeout=request.timeout_seconds,
+            model=request.model,
+            max_tokens=request.max_tokens,
+            temperature=request.temperature,
+            top_k=request.top_k,
+            top_p=request.top_p,
+            stop=request.stop,
+            template=request.template,
+            repeat_penalty=request.repeat_penalty
+        ))
         logger.info("Successfully generated code response")
 
-        return GenerateResponse(
-            code=generated_code,
-            status="success"
+        # Serialized here (not by FastAPI) so the cost shows up as a span
+        with span("serialization"):
+            response = JSONResponse(GenerateResponse(
+                code=generated_code,
+                status="success",
+                prompt_tokens=prepared.prompt_tokens
+            ).model_dump())
+        return response
+    except ClientDisconnectedError as e:
+        # Nobody is listening; the status code only shows up in logs and metrics
+        logger.info(f"Stopped generation request: {str(e)}")
+        return Response(status_code=e.status_code)
+    except ServiceOverloadedError as e:
+        logger.warning(f"Rejected generation request: {str(e)}")
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except (ValidationError, PromptTooLongError) as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ModelLoadError as e:
+        logger.error(f"Model error: {str(e)}")
+        raise HTTPException(status_code=503, detail=f"Model error: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error generating code: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error generating code: {str(e)}")
+
+def _format_stream_event(event: Dict[str, Any], stream_format: str) -> str:
+    """Serialize a stream event as an SSE frame or an NDJSON line"""
+    if stream_format == "ndjson":
+        return json.dumps(event) + "\n"
+    if event.get("done"):
+        return f"event: done\ndata: {json.dumps(event)}\n\n"
+    if "error" in event:
+        return f"event: error\ndata: {json.dumps(event)}\n\n"
+    return f"data: {json.dumps(event)}\n\n"
+
+@router.post("/generate/stream")
+async def generate_code_stream(
+    request: GenerateRequest,
+    format: str = Query("sse", pattern="^(sse|ndjson)$", description="Stream format: sse or ndjson")
+):
+    """
+    Stream generated code token by token
+
+    Tokens are sent as Server-Sent Events (default) or NDJSON lines as soon
+    as the model produces them. The final event reports time-to-first-token
+    and tokens/sec.
+    """
+    mark("validation")
+    try:
+        logger.info(
+            "Received streaming generation request",
+            extra={"prompt": loggable_prompt(request.prompt), "prompt_chars": len(request.prompt)}
+        )
+
+        gpt_service = get_gpt_service()
+        if not gpt_service:
+            raise ModelLoadError("GPT service not initialized")
+
+        events = gpt_service.generate_stream(
+            request.prompt,
+            bypass_cache=request.bypass_cache,
+            refresh_cache=request.refresh_cache,
+            priority=request.priority,
+            timeout=request.timeout_seconds,
+            model=request.model,
+            max_tokens=request.max_tokens,
+            temperature=request.temperature,
+            top_k=request.top_k,
+            top_p=request.top_p,
+            stop=request.stop,
+            template=request.template,
+            repeat_penalty=request.repeat_penalty
         )
+        # Pull the first event here so load failures still map to HTTP errors
+        first_event = await events.__anext__()
+    except ServiceOverloadedError as e:
+        logger.warning(f"Rejected generation request: {str(e)}")
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except (ValidationError, PromptTooLongError) as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except ModelLoadError as e:
         logger.error(f"Model error: {str(e)}")
         raise HTTPException(status_code=503, detail=f"Model error: {str(e)}")
@@ -70,12 +240,266 @@ async def generate_code(request: GenerateRequest):
         logger.error(f"Error generating code: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error generating code: {str(e)}")
 
-@router.post("/projects")
+    async def body() -> AsyncIterator[str]:
+        yield _format_stream_event(first_event, format)
+        try:
+            async for event in events:
+                yield _format_stream_event(event, format)
+        except Exception as e:
+            logger.error(f"Error streaming code: {str(e)}")
+            yield _format_stream_event({"error": str(e)}, format)
+        finally:
+            await events.aclose()
+
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/event-stream"
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+def _ndjson(events: AsyncIterator[Dict[str, Any]]) -> StreamingResponse:
+    async def body() -> AsyncIterator[str]:
+        async for event in events:
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache"})
+
+@router.post("/generate/batch")
+async def generate_batch(request: BatchGenerateRequest):
+    """
+    Generate many prompts in one request
+
+    Identical items are generated once and the response cache is used.
+    Items run at background priority by default. Results stream back as
+    NDJSON in completion order: a first line with the batch_id, one line
+    per item ({"id", "status", "code" or "error"}), and a final
+    {"done": true, ...} summary. The batch keeps running if the client
+    disconnects; use GET /generate/batch/{batch_id}/results to reattach and
+    DELETE /generate/batch/{batch_id} to cancel it.
+    """
+    try:
+        gpt_service = get_gpt_service()
+        if not gpt_service:
+            raise ModelLoadError("GPT service not initialized")
+
+        items = [
+            {
+                "id": item.id if item.id is not None else str(index),
+                "prompt": item.prompt,
+                "params": {
+                    "bypass_cache": item.bypass_cache,
+                    "refresh_cache": item.refresh_cache,
+                    "timeout": item.timeout_seconds,
+                    "model": item.model,
+                    "max_tokens": item.max_tokens,
+                    "temperature": item.temperature,
+                    "top_k": item.top_k,
+                    "top_p": item.top_p,
+                    "repeat_penalty": item.repeat_penalty,
+                    "stop": item.stop,
+                    "template": item.template,
+                },
+            }
+            for index, item in enumerate(request.items)
+        ]
+        batch = await gpt_service.start_batch(items, priority=request.priority)
+        logger.info(f"Started batch {batch.id} with {batch.items} items")
+    except ServiceOverloadedError as e:
+        logger.warning(f"Rejected batch request: {str(e)}")
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except ValidationError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ModelLoadError as e:
+        logger.error(f"Model error: {str(e)}")
+        raise HTTPException(status_code=503, detail=f"Model error: {str(e)}")
+
+    return _ndjson(batch.follow())
+
+@router.get("/generate/batch/{batch_id}", response_model=BatchStatusResponse)
+async def get_batch(batch_id: str):
+    """Get batch progress"""
+    try:
+        return BatchStatusResponse(**(await get_gpt_service().get_batch(batch_id)).info())
+    except BatchNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/generate/batch/{batch_id}/results")
+async def get_batch_results(batch_id: str):
+    """Stream a batch's results as NDJSON: everything so far, then new results until it finishes"""
+    try:
+        batch = await get_gpt_service().get_batch(batch_id)
+    except BatchNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return _ndjson(batch.follow())
+
+@router.delete("/generate/batch/{batch_id}", response_model=BatchStatusResponse)
+async def cancel_batch(batch_id: str):
+    """Cancel a batch; items without a result are reported as cancelled"""
+    try:
+        batch = await get_gpt_service().cancel_batch(batch_id)
+        return BatchStatusResponse(**batch.info())
+    except BatchNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.post("/sessions", response_model=SessionResponse)
+async def create_session(request: SessionCreateRequest):
+    """Start a chat session that keeps model context between turns"""
+    gpt_service = get_gpt_service()
+    if not gpt_service:
+        raise HTTPException(status_code=503, detail="Model error: GPT service not initialized")
+    return SessionResponse(**await gpt_service.create_session(request.system_prompt))
+
+@router.get("/sessions/{session_id}", response_model=SessionResponse)
+async def get_session(session_id: str):
+    """Get chat session state and token usage"""
+    try:
+        return SessionResponse(**await get_gpt_service().get_session(session_id))
+    except SessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """End a chat session and release its model context"""
+    try:
+        await get_gpt_service().delete_session(session_id)
+        return {"status": "success", "message": "Session deleted"}
+    except SessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.post("/sessions/{session_id}/generate", response_model=SessionGenerateResponse)
+async def session_generate(session_id: str, request: SessionGenerateRequest):
+    """
+    Generate the next turn in a chat session
+
+    Earlier turns stay in the session's model context, so only the new
+    prompt is evaluated.
+    """
+    try:
+        logger.info(f"Received session generation request for {session_id}")
+
+        gpt_service = get_gpt_service()
+        if not gpt_service:
+            raise ModelLoadError("GPT service not initialized")
+
+        result = await gpt_service.session_generate(
+            session_id,
+            request.prompt,
+            priority=request.priority,
+            timeout=request.timeout_seconds
+        )
+        return SessionGenerateResponse(**result)
+    except SessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ServiceOverloadedError as e:
+        logger.warning(f"Rejected session generation request: {str(e)}")
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except (ValidationError, PromptTooLongError) as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ModelLoadError as e:
+        logger.error(f"Model error: {str(e)}")
+        raise HTTPException(status_code=503, detail=f"Model error: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error generating code: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error generating code: {str(e)}")
+
+@router.post("/projects", response_model=ProjectResponse, status_code=202)
 async def create_project(project: ProjectRequest):
-    """Create a new project"""
+    """
+    Start generating a project from a template
+
+    Returns immediately with the job ID. Static template files are written
+    right away; the remaining files are generated in the background (follow
+    progress with GET /projects/{project_id} or /projects/{project_id}/events).
+    """
     try:
-        # Project creation logic would go here
-        return {"status": "success", "message": "Project created successfully"}
+        gpt_service = get_gpt_service()
+        if not gpt_service:
+            raise ModelLoadError("GPT service not initialized")
+        job = await gpt_service.create_project(project.name, project.description, project.template)
+        return ProjectResponse(**job.info())
+    except ServiceOverloadedError as e:
+        logger.warning(f"Rejected project request: {str(e)}")
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except ValidationError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ModelLoadError as e:
+        logger.error(f"Model error: {str(e)}")
+        raise HTTPException(status_code=503, detail=f"Model error: {str(e)}")
     except Exception as e:
         logger.error(f"Error creating project: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/projects/{project_id}", response_model=ProjectResponse)
+async def get_project(project_id: str):
+    """Get project generation progress"""
+    try:
+        return ProjectResponse(**(await get_gpt_service().get_project(project_id)).info())
+    except ProjectNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/projects/{project_id}/events")
+async def get_project_events(project_id: str):
+    """Stream project progress as NDJSON: events so far, then new ones until the job finishes"""
+    try:
+        events = await get_gpt_service().project_events(project_id)
+    except ProjectNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return _ndjson(events)
+
+@router.get("/projects/{project_id}/files/{path:path}")
+async def get_project_file(project_id: str, path: str):
+    """Download a generated project file"""
+    try:
+        return FileResponse(await get_gpt_service().project_file(project_id, path), media_type="text/plain")
+    except ProjectNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.post("/workflow", response_model=WorkflowResponse)
+async def run_workflow(workflow: WorkflowRequest, http_request: Request):
+    """
+    Execute Python code in a sandbox, optionally generating it first
+
+    Runs on a prewarmed worker as an unprivileged user in its own namespaces
+    (no network, no view of the host filesystem besides read-only system
+    directories), under CPU, memory, file-size and wall-clock limits. A
+    program that fails (or hits a limit) still returns 200 with status
+    "error", its exit code and output. Returns 503 when the host cannot
+    isolate the sandbox.
+
+    Example request body:
+    ```json
+    {
+        "prompt": "Write a Python program that prints the first 10 primes"
+    }
+    ```
+    """
+    mark("validation")
+    try:
+        gpt_service = get_gpt_service()
+        if not gpt_service:
+            raise ModelLoadError("GPT service not initialized")
+        result = await _unless_disconnected(http_request, gpt_service.run_workflow(
+            code=workflow.code,
+            prompt=workflow.prompt,
+            stdin=workflow.stdin,
+            timeout=workflow.timeout_seconds,
+            model=workflow.model,
+            priority=workflow.priority
+        ))
+        status = "success" if result["exit_code"] == 0 and result["limit"] is None else "error"
+        logger.info(f"Workflow run finished: exit code {result['exit_code']}, limit {result['limit']}, {result['duration_ms']}ms")
+        return WorkflowResponse(status=status, **result)
+    except ClientDisconnectedError as e:
+        logger.info(f"Stopped workflow request: {str(e)}")
+        return Response(status_code=e.status_code)
+    except ServiceOverloadedError as e:
+        logger.warning(f"Rejected workflow request: {str(e)}")
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except SandboxUnavailableError as e:
+        logger.error(str(e))
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except (ValidationError, PromptTooLongError) as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ModelLoadError as e:
+        logger.error(f"Model error: {str(e)}")
+        raise HTTPException(status_code=503, detail=f"Model error: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error running workflow: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error running workflow: {str(e)}")
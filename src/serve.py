@@ -0,0 +1,70 @@
+"""Start the server, splitting HTTP workers from the models when asked to
+
+Usage (from the repository root):
+    python -m src.serve [--host HOST] [--port PORT] [--workers N] [--socket PATH]
+
+With one worker and no INFERENCE_SOCKET, a single process serves HTTP and
+runs the models, as python -m src.main does. Otherwise the models run in one
+inference daemon (python -m src.daemon) and N uvicorn workers forward requests
+to it over its Unix socket: request parsing, validation and serialization
+scale across cores while model memory is paid once and scheduling stays
+global. The daemon is stopped when the workers exit.
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+
+import uvicorn
+
+from src.config import get_settings
+
+
+def _wait_for_socket(path: str, daemon: subprocess.Popen, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if daemon.poll() is not None:
+            sys.exit(f"Inference daemon exited with code {daemon.returncode}")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(path)
+                return
+            except OSError:
+                pass
+        time.sleep(0.05)
+    sys.exit(f"Inference daemon did not open {path} within {timeout}s")
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=settings.HOST)
+    parser.add_argument("--port", type=int, default=settings.PORT)
+    parser.add_argument("--workers", type=int, default=settings.HTTP_WORKERS, help="HTTP worker processes")
+    parser.add_argument("--socket", default=settings.INFERENCE_SOCKET, help="Inference daemon socket path")
+    args = parser.parse_args()
+
+    if args.workers <= 1 and not args.socket:
+        uvicorn.run("src.main:app", host=args.host, port=args.port)
+        return
+
+    path = args.socket or os.path.join(tempfile.gettempdir(), f"cachecow-inference-{os.getpid()}.sock")
+    # Inherited by the daemon and by every worker, which then use RemoteService
+    os.environ["INFERENCE_SOCKET"] = path
+    daemon = subprocess.Popen([sys.executable, "-m", "src.daemon", "--socket", path])
+    try:
+        _wait_for_socket(path, daemon, settings.INFERENCE_START_TIMEOUT_SECONDS)
+        uvicorn.run("src.main:app", host=args.host, port=args.port, workers=args.workers)
+    finally:
+        daemon.terminate()
+        try:
+            daemon.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            daemon.kill()
+
+
+if __name__ == "__main__":
+    main()
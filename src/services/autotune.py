@@ -0,0 +1,219 @@
+"""Calibration of CPU threads and prompt batch size per host and model
+
+The best n_threads / n_batch depend on core count, SMT and memory
+bandwidth, so instead of guessing they are measured: a short generation on
+a fixed prompt is run for every candidate, recording prompt-eval speed and
+decode speed. The winner (lowest time for a reference request) is stored
+per host and model, so later starts reuse it without calibrating again.
+"""
+import os
+import json
+import time
+import platform
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from src.utils.logger import get_logger
+
+# Fixed calibration input (a few hundred tokens, like a typical request)
+CALIBRATION_PROMPT = """Write code for the following request:
+Implement a Python class LRUCache with get(key) and put(key, value) methods
+that run in O(1) time. Use a dictionary together with a doubly linked list,
+evict the least recently used entry when the capacity is exceeded, and add
+type hints and docstrings. Also write a function that parses a CSV file of
+user records (id, name, email, signup_date), validates every field, skips
+malformed rows with a warning, and returns a list of dataclass instances
+sorted by signup date. Finally, add pytest tests for both.
+
+Return only the code without explanations:
+"""
+
+# Output length of the reference request used to rank configurations
+REFERENCE_OUTPUT_TOKENS = 256
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return max(1, (len(text) + 3) // 4)
+
+
+def host_key() -> str:
+    """Identifies the hardware a tuning was measured on"""
+    cpu = platform.processor() or platform.machine()
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    cpu = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return f"{platform.node()}|{cpu}|{available_cpus()} cpus"
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def thread_candidates(cpus: int) -> List[int]:
+    """Thread counts worth trying on a machine with cpus usable CPUs
+
+    Powers of two plus half and all of the CPUs: with SMT the optimum is
+    often the physical core count, which is half the logical CPUs.
+    """
+    candidates = {cpus, max(1, cpus // 2)}
+    threads = 1
+    while threads < cpus:
+        candidates.add(threads)
+        threads *= 2
+    return sorted(candidates)
+
+
+@dataclass
+class Trial:
+    n_threads: int
+    n_batch: int
+    prompt_eval_ms: float
+    prompt_tokens_per_second: float  # estimated prompt tokens / prompt-eval time
+    tokens_per_second: Optional[float]  # decode rate after the first token
+    reference_ms: Optional[float]  # prompt eval + REFERENCE_OUTPUT_TOKENS at the decode rate
+
+
+@dataclass
+class Tuning:
+    n_threads: int
+    n_batch: int
+    model_size: int
+    calibrated_at: float = field(default_factory=time.time)
+    calibration_seconds: float = 0.0
+    trials: List[Trial] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Tuning":
+        return cls(**{**data, "trials": [Trial(**t) for t in data.get("trials", [])]})
+
+
+def measure(model: Any, n_threads: int, n_batch: int, max_tokens: int) -> Trial:
+    """Time one generation of the calibration prompt"""
+    first_token_at = None
+    last_token_at = None
+    tokens = 0
+
+    def callback(token_id: int, token: str) -> bool:
+        nonlocal first_token_at, last_token_at, tokens
+        last_token_at = time.perf_counter()
+        if first_token_at is None:
+            first_token_at = last_token_at
+        tokens += 1
+        return True
+
+    started = time.perf_counter()
+    model.generate(CALIBRATION_PROMPT, max_tokens=max_tokens, n_batch=n_batch, temp=0.0, callback=callback)
+    prompt_eval = (first_token_at or time.perf_counter()) - started
+    decode = last_token_at - first_token_at if tokens > 1 else 0.0
+    tps = (tokens - 1) / decode if decode > 0 else None
+    return Trial(
+        n_threads=n_threads,
+        n_batch=n_batch,
+        prompt_eval_ms=round(prompt_eval * 1000, 2),
+        prompt_tokens_per_second=round(estimate_tokens(CALIBRATION_PROMPT) / prompt_eval, 2) if prompt_eval > 0 else 0.0,
+        tokens_per_second=round(tps, 2) if tps else None,
+        reference_ms=round((prompt_eval + REFERENCE_OUTPUT_TOKENS / tps) * 1000, 2) if tps else None,
+    )
+
+
+def calibrate(
+    create_model: Callable[[int], Any],
+    thread_counts: Sequence[int],
+    batch_sizes: Sequence[int],
+    max_tokens: int,
+    model_size: int = 0,
+) -> Tuning:
+    """Sweep thread counts x batch sizes and pick the fastest reference request
+
+    create_model(n_threads) builds a model instance (blocking); one is built
+    per thread count and warmed up before its measurements.
+    """
+    logger = get_logger(__name__)
+    started = time.perf_counter()
+    trials: List[Trial] = []
+    for n_threads in thread_counts:
+        model = create_model(n_threads)
+        try:
+            model.generate("def f():", max_tokens=1)  # page in the weights before timing
+            for n_batch in batch_sizes:
+                trial = measure(model, n_threads, n_batch, max_tokens)
+                logger.info(
+                    f"Calibration n_threads={n_threads} n_batch={n_batch}: prompt eval {trial.prompt_eval_ms}ms, "
+                    f"{trial.tokens_per_second} tokens/s"
+                )
+                trials.append(trial)
+        finally:
+            del model
+
+    measured = [t for t in trials if t.reference_ms is not None]
+    if not measured:
+        raise RuntimeError("Calibration produced no measurable generations")
+    best = min(measured, key=lambda t: t.reference_ms)
+    return Tuning(
+        n_threads=best.n_threads,
+        n_batch=best.n_batch,
+        model_size=model_size,
+        calibration_seconds=round(time.perf_counter() - started, 2),
+        trials=trials,
+    )
+
+
+def format_table(tuning: Tuning) -> str:
+    """Calibration results as a text table, the chosen configuration marked with *"""
+    header = f"{'':2}{'threads':>8}{'n_batch':>9}{'prompt ms':>11}{'prompt tok/s':>14}{'tok/s':>9}{'ref req ms':>12}"
+    lines = [header, "-" * len(header)]
+    for t in tuning.trials:
+        chosen = "*" if (t.n_threads, t.n_batch) == (tuning.n_threads, tuning.n_batch) else ""
+        lines.append(
+            f"{chosen:2}{t.n_threads:>8}{t.n_batch:>9}{t.prompt_eval_ms:>11}{t.prompt_tokens_per_second:>14}"
+            f"{t.tokens_per_second if t.tokens_per_second is not None else '-':>9}"
+            f"{t.reference_ms if t.reference_ms is not None else '-':>12}"
+        )
+    return "\n".join(lines)
+
+
+class TuningStore:
+    """JSON file of tunings keyed by host, then model name"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.logger = get_logger(__name__)
+
+    def _read(self) -> Dict[str, Any]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable tuning file {self.path}: {str(e)}")
+            return {}
+
+    def get(self, model: str, model_size: int) -> Optional[Tuning]:
+        """Stored tuning for this host and model, unless the model file changed since"""
+        data = self._read().get(host_key(), {}).get(model)
+        if data is None:
+            return None
+        try:
+            tuning = Tuning.from_dict(data)
+        except TypeError:
+            return None
+        return tuning if tuning.model_size == model_size else None
+
+    def put(self, model: str, tuning: Tuning):
+        data = self._read()
+        data.setdefault(host_key(), {})[model] = asdict(tuning)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.path)
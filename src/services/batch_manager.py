@@ -0,0 +1,255 @@
+"""Batches of generation requests run at background priority"""
+import json
+import time
+import uuid
+import asyncio
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from src.utils.logger import get_logger
+from src.services.streaming import EventLog
+from src.utils.exceptions import BatchNotFoundError, CacheCowException, ServiceOverloadedError, ValidationError
+
+
+async def generate_when_admitted(
+    generate: Callable[..., Awaitable[str]],
+    prompt: str,
+    on_retry: Optional[Callable[[], None]] = None,
+    **kwargs,
+) -> str:
+    """Call generate, waiting out queue-full (429) rejections instead of failing
+
+    For background work: it yields to interactive requests by retrying after
+    the scheduler's Retry-After. Deadline rejections (503) are still raised.
+    """
+    while True:
+        try:
+            return await generate(prompt, **kwargs)
+        except ServiceOverloadedError as e:
+            if e.status_code != 429:
+                raise
+            if on_retry is not None:
+                on_retry()
+            await asyncio.sleep(e.retry_after)
+
+
+class Batch:
+    """State of one batch and the replayable list of events it produced"""
+
+    def __init__(self, items: List[Dict[str, Any]], unique: int, priority: str):
+        self.id = uuid.uuid4().hex
+        self.priority = priority
+        self.items = len(items)
+        self.unique = unique
+        self.status = "running"
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.created_at = time.time()
+        self.started = time.perf_counter()
+        self.finished_at: Optional[float] = None
+        self.pending: Set[str] = {item["id"] for item in items}
+        self.log = EventLog()
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def publish(self, event: Dict[str, Any]):
+        self.log.publish(event)
+
+    def record(self, item_id: str, event: Dict[str, Any]):
+        """Publish the result of one item"""
+        if item_id not in self.pending:
+            return
+        self.pending.discard(item_id)
+        status = event["status"]
+        if status == "success":
+            self.completed += 1
+        elif status == "cancelled":
+            self.cancelled += 1
+        else:
+            self.failed += 1
+        self.publish({"id": item_id, **event})
+
+    def finish(self, status: str):
+        self.status = status
+        self.finished_at = time.perf_counter()
+        self.publish({"done": True, **self.info()})
+        self.log.close()
+
+    def follow(self) -> AsyncIterator[Dict[str, Any]]:
+        """Replay the events so far, then follow new ones until the batch finishes"""
+        return self.log.follow()
+
+    def info(self) -> Dict[str, Any]:
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return {
+            "batch_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "items": self.items,
+            "unique": self.unique,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "pending": len(self.pending),
+            "created_at": self.created_at,
+            "elapsed_ms": round((end - self.started) * 1000, 2),
+        }
+
+
+class BatchManager:
+    """Runs batches against the generation path with bounded concurrency
+
+    Identical items (same prompt and parameters) are generated once and the
+    result is reported for each of their ids. Each batch keeps at most
+    max_in_flight generations queued on the scheduler, so interactive
+    requests still find room in the queue; the generations themselves go
+    through the normal path, so the response cache and request coalescing
+    apply. Items rejected because the queue is full are retried after the
+    scheduler's Retry-After instead of failing. Batches run independently
+    of the HTTP request that started them and are kept for ttl seconds
+    after finishing so their status and results can be fetched.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[..., Awaitable[str]],
+        max_items: int,
+        max_in_flight: int,
+        max_batches: int,
+        ttl: float,
+    ):
+        self.generate = generate
+        self.max_items = max_items
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_batches = max_batches
+        self.ttl = ttl
+        self.logger = get_logger(__name__)
+        self._batches: Dict[str, Batch] = {}
+
+        self.started = 0
+        self.items = 0
+        self.deduplicated = 0
+        self.retries = 0
+
+    def start(self, items: List[Dict[str, Any]], priority: str = "low") -> Batch:
+        """Validate items, group duplicates and start running the batch"""
+        if not items:
+            raise ValidationError("Batch has no items")
+        if len(items) > self.max_items:
+            raise ValidationError(f"Batch has {len(items)} items, the limit is {self.max_items}")
+        ids = [item["id"] for item in items]
+        if len(set(ids)) != len(ids):
+            raise ValidationError("Batch item ids must be unique")
+
+        self._sweep()
+        if len(self._batches) >= self.max_batches:
+            raise ServiceOverloadedError(
+                f"Too many batches ({self.max_batches}) running or awaiting collection", retry_after=60
+            )
+
+        groups: Dict[str, Tuple[Dict[str, Any], List[str]]] = {}
+        for item in items:
+            key = json.dumps([item["prompt"], item["params"]], sort_keys=True)
+            if key in groups:
+                groups[key][1].append(item["id"])
+            else:
+                groups[key] = (item, [item["id"]])
+
+        batch = Batch(items, unique=len(groups), priority=priority)
+        batch.publish({"batch_id": batch.id, "items": batch.items, "unique": batch.unique})
+        self._batches[batch.id] = batch
+        batch.task = asyncio.create_task(self._run(batch, deque(groups.values())))
+
+        self.started += 1
+        self.items += len(items)
+        self.deduplicated += len(items) - len(groups)
+        self.logger.info(f"Started batch {batch.id} with {batch.items} items ({batch.unique} unique)")
+        return batch
+
+    def get(self, batch_id: str) -> Batch:
+        batch = self._batches.get(batch_id)
+        if batch is None:
+            raise BatchNotFoundError(batch_id)
+        return batch
+
+    async def cancel(self, batch_id: str) -> Batch:
+        batch = self.get(batch_id)
+        if batch.task is not None and not batch.task.done():
+            batch.task.cancel()
+            await asyncio.wait([batch.task])
+        return batch
+
+    def _sweep(self):
+        """Forget finished batches past their retention time"""
+        now = time.perf_counter()
+        for batch in list(self._batches.values()):
+            if batch.finished and now - batch.finished_at > self.ttl:
+                del self._batches[batch.id]
+
+    async def _run(self, batch: Batch, groups: Deque[Tuple[Dict[str, Any], List[str]]]):
+        async def worker():
+            while groups:
+                item, ids = groups.popleft()
+                event = await self._run_item(batch, item)
+                for item_id in ids:
+                    batch.record(item_id, event)
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.max_in_flight, len(groups)))]
+        try:
+            await asyncio.gather(*workers)
+        except asyncio.CancelledError:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            for item_id in list(batch.pending):
+                batch.record(item_id, {"status": "cancelled"})
+            batch.finish("cancelled")
+            self.logger.info(f"Cancelled batch {batch.id}")
+            raise
+        except Exception as e:
+            # Item failures are reported per item; this is a bug in the runner itself
+            self.logger.error(f"Batch {batch.id} failed: {str(e)}")
+            for item_id in list(batch.pending):
+                batch.record(item_id, {"status": "error", "status_code": 500, "error": str(e)})
+            batch.finish("failed")
+        else:
+            batch.finish("completed")
+            self.logger.info(f"Finished batch {batch.id} in {batch.info()['elapsed_ms']}ms")
+
+    async def _run_item(self, batch: Batch, item: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            code = await generate_when_admitted(
+                self.generate, item["prompt"], on_retry=self._count_retry, priority=batch.priority, **item["params"]
+            )
+        except CacheCowException as e:
+            return {"status": "error", "status_code": e.status_code, "error": str(e)}
+        except Exception as e:
+            return {"status": "error", "status_code": 500, "error": str(e)}
+        return {"status": "success", "code": code, "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+    def _count_retry(self):
+        self.retries += 1
+
+    async def close(self):
+        for batch in list(self._batches.values()):
+            if batch.task is not None and not batch.task.done():
+                batch.task.cancel()
+        tasks = [b.task for b in self._batches.values() if b.task is not None]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": len(self._batches),
+            "running": sum(1 for b in self._batches.values() if not b.finished),
+            "started": self.started,
+            "items": self.items,
+            "deduplicated": self.deduplicated,
+            "retries": self.retries,
+            "max_in_flight": self.max_in_flight,
+        }
@@ -1,28 +1,135 @@
-import os
+import time
 import asyncio
-from gpt4all import GPT4All
-from src.config import Settings
-from src.utils.logger import get_logger
-from src.utils.exceptions import ModelLoadError
-from src.utils.model_downloader import download_model
+from dataclasses import asdict
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from src.config import Settings, get_settings
+from src.utils.logger import get_logger, record_span, span
+from src.utils.exceptions import CacheCowException, ModelLoadError, PromptTooLongError, ServiceOverloadedError, ValidationError
+from src.services.streaming import GenerationStats, StopMatcher, TokenStream
+from src.services.inference_scheduler import InferenceScheduler, PRIORITIES
+from src.services.single_flight import SingleFlight
+from src.services.session_manager import SessionManager
+from src.services.batch_manager import Batch, BatchManager
+from src.services.project_jobs import ProjectJob, ProjectJobManager, strip_code_fences
+from src.services.sandbox_pool import SandboxPool
+from src.services.prompt_manager import PreparedPrompt, PromptManager, create_tokenizer, get_template
+from src.services.model_registry import LoadedModel, ModelRegistry
+from src.services.worker_pool import ModelWorkerPool
+from src.services.response_cache import ResponseCache, DiskCache, make_cache_key
+from src.utils import metrics
+
+# Generation parameters handled by the service rather than passed to GPT4All.generate
+_SERVICE_PARAMS = ("model", "stop", "stop_at_code_block_end", "template")
 
 class GPT4ALLService:
     _instance = None
-    _model = None
     _initialization_lock = None
     _is_initializing = False
+    cache = None
+    semantic_cache = None
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(GPT4ALLService, cls).__new__(cls)
             cls._instance.logger = get_logger(__name__)
-            cls._instance.settings = Settings()
+            cls._instance.settings = get_settings()
+            cls._instance._created_at = time.perf_counter()
+            cls._instance._phases = {
+                name: {"status": "pending", "duration_ms": None}
+                for name in ("download", "load", "warmup")
+            }
+            cls._instance._ready = False
+            cls._instance._init_error = None
             cls._instance._initialization_lock = asyncio.Lock()
+            cls._instance.cache = cls._create_cache(cls._instance.settings)
+            cls._instance.semantic_cache = cls._create_semantic_cache(cls._instance.settings)
+            cls._instance._flights = SingleFlight()
+            cls._instance.registry = ModelRegistry(cls._instance.settings)
+            cls._instance.prompts = PromptManager(
+                create_tokenizer(cls._instance.settings.PROMPT_TOKENIZER),
+                overflow=cls._instance.settings.CONTEXT_OVERFLOW,
+                min_output_tokens=cls._instance.settings.CONTEXT_MIN_OUTPUT_TOKENS,
+                cache_size=cls._instance.settings.PROMPT_TOKEN_CACHE_SIZE,
+            )
+            cls._instance.sessions = SessionManager(
+                # Sessions run on the default model; their instances count against its memory budget
+                lambda: cls._instance.registry.open_instance(cls._instance.settings.MODEL_NAME),
+                cls._instance.registry.close_instance,
+                cls._instance.prompts,
+                context_length=cls._instance.registry.context_length(cls._instance.settings.MODEL_NAME),
+                max_sessions=cls._instance.settings.SESSION_MAX_SESSIONS,
+                max_live=cls._instance.settings.SESSION_MAX_LIVE,
+                idle_timeout=cls._instance.settings.SESSION_IDLE_TIMEOUT_SECONDS,
+                session_ttl=cls._instance.settings.SESSION_TTL_SECONDS,
+                max_tokens=cls._instance.settings.MAX_TOKENS,
+            )
+            cls._instance.batches = BatchManager(
+                cls._instance.generate,
+                max_items=cls._instance.settings.BATCH_MAX_ITEMS,
+                max_in_flight=cls._instance.settings.BATCH_MAX_IN_FLIGHT,
+                max_batches=cls._instance.settings.BATCH_MAX_BATCHES,
+                ttl=cls._instance.settings.BATCH_TTL_SECONDS,
+            )
+            cls._instance.projects = ProjectJobManager(
+                cls._instance.generate,
+                root=cls._instance.settings.PROJECTS_DIR,
+                max_parallel_files=cls._instance.settings.PROJECT_MAX_PARALLEL_FILES,
+                priority=cls._instance.settings.PROJECT_PRIORITY,
+                max_jobs=cls._instance.settings.PROJECT_MAX_JOBS,
+                ttl=cls._instance.settings.PROJECT_TTL_SECONDS,
+            )
+            cls._instance.sandbox = SandboxPool(
+                size=cls._instance.settings.SANDBOX_POOL_SIZE,
+                max_runs=cls._instance.settings.SANDBOX_MAX_RUNS,
+                queue_size=cls._instance.settings.SANDBOX_QUEUE_SIZE,
+                cpu_seconds=cls._instance.settings.SANDBOX_CPU_SECONDS,
+                memory_mb=cls._instance.settings.SANDBOX_MEMORY_MB,
+                wall_seconds=cls._instance.settings.SANDBOX_WALL_SECONDS,
+                max_file_mb=cls._instance.settings.SANDBOX_MAX_FILE_MB,
+                max_output_bytes=cls._instance.settings.SANDBOX_MAX_OUTPUT_BYTES,
+                preload=cls._instance.settings.SANDBOX_PRELOAD_MODULES,
+                workdir=cls._instance.settings.SANDBOX_WORKDIR,
+                scratch_mb=cls._instance.settings.SANDBOX_SCRATCH_MB,
+                uid=cls._instance.settings.SANDBOX_UID,
+                gid=cls._instance.settings.SANDBOX_GID,
+            )
+            metrics.REGISTRY.register_collector(cls._instance.collect_metrics)
         return cls._instance
 
+    @staticmethod
+    def _create_cache(settings: Settings) -> Optional[ResponseCache]:
+        """Build the response cache from settings"""
+        if not settings.CACHE_ENABLED:
+            return None
+        disk = None
+        if settings.CACHE_DISK_ENABLED:
+            disk = DiskCache(
+                settings.CACHE_DISK_PATH,
+                max_entries=settings.CACHE_DISK_MAX_ENTRIES,
+                ttl_seconds=settings.CACHE_DISK_TTL_SECONDS,
+            )
+        return ResponseCache(
+            max_entries=settings.CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.CACHE_TTL_SECONDS,
+            disk=disk,
+        )
+
+    @staticmethod
+    def _create_semantic_cache(settings: Settings):
+        """Build the optional semantic cache (imports numpy only when enabled)"""
+        if not settings.SEMANTIC_CACHE_ENABLED:
+            return None
+        from src.services.semantic_cache import SemanticCache, create_embedder
+        return SemanticCache(
+            create_embedder(settings.SEMANTIC_CACHE_EMBEDDER, settings.SEMANTIC_CACHE_DIM),
+            max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+            threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+        )
+
     async def ensure_initialized(self):
-        """Ensure the model is initialized"""
-        if self._model is not None:
+        """Ensure the default model (and any preloaded models) are initialized"""
+        if self._ready:
             return
 
         if self._is_initializing:
@@ -30,118 +137,696 @@ class GPT4ALLService:
             return
 
         async with self._initialization_lock:
-            if self._model is not None:  # Double-check after acquiring lock
+            if self._ready:  # Double-check after acquiring lock
                 return
 
             self._is_initializing = True
+            self._init_error = None
             try:
                 self.logger.info("Starting GPT4ALL service initialization")
-                await self._ensure_model()
-                await self._load_model()
-                self.logger.info("GPT4ALL service initialization completed successfully")
+                default_model = self.settings.MODEL_NAME
+                with self._phase("download"):
+                    await self.registry.ensure_file(default_model)
+                with self._phase("load"):
+                    loaded = await self.registry.load(default_model)
+                if self.settings.WARMUP_ENABLED:
+                    with self._phase("warmup"):
+                        await self._warm_up(loaded)
+                else:
+                    self._phases["warmup"]["status"] = "skipped"
+                await self._preload()
+                self._ready = True
+                self.logger.info(
+                    f"GPT4ALL service ready {time.perf_counter() - self._created_at:.2f}s after creation"
+                )
             except ModelLoadError as e:
+                self._init_error = str(e)
                 self.logger.error(f"Failed to initialize GPT4ALL service: {str(e)}")
                 raise
             except Exception as e:
+                self._init_error = str(e)
                 self.logger.error(f"An unexpected error occurred during initialization: {str(e)}")
                 raise ModelLoadError(f"An unexpected error occurred during GPT4ALL service initialization: {str(e)}")
             finally:
                 self._is_initializing = False
 
-    async def _ensure_model(self):
-        """Ensure the model file exists and is valid"""
+    @contextmanager
+    def _phase(self, name: str):
+        """Record status and duration of a startup phase"""
+        phase = self._phases[name]
+        phase["status"] = "running"
+        started = time.perf_counter()
         try:
-            os.makedirs(self.settings.MODEL_DIR, exist_ok=True)
-            self.logger.info(f"Created/verified model directory at {self.settings.MODEL_DIR}")
-
-            model_path = self.settings.MODEL_PATH
-            self.logger.info(f"Checking for model at {model_path}")
-
-            if not os.path.exists(model_path):
-                self.logger.info("Model file not found. Starting download...")
-                await asyncio.to_thread(download_model)
-                self.logger.info("Model download completed successfully")
-            else:
-                file_size = os.path.getsize(model_path)
-                self.logger.info(f"Found existing model file of size {file_size / 1024 / 1024:.2f} MB")
-                if file_size < 100_000_000:  # Less than 100MB
-                    self.logger.warning(f"Existing model file is too small ({file_size} bytes)")
-                    self.logger.info("Redownloading model...")
-                    await asyncio.to_thread(download_model)
-                else:
-                    self.logger.info(f"Using existing model at {model_path}")
-        except Exception as e:
-            self.logger.error(f"Error ensuring model file: {str(e)}")
-            raise ModelLoadError(f"Error ensuring model file: {str(e)}")
+            yield
+        except BaseException:
+            phase["status"] = "failed"
+            raise
+        else:
+            phase["status"] = "done"
+        finally:
+            phase["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            self.logger.info(f"Startup phase {name} {phase['status']} in {phase['duration_ms']}ms")
 
-    async def _load_model(self):
-        """Load the GPT-4ALL model"""
+    async def _warm_up(self, loaded: LoadedModel):
+        """Run a tiny generation so the first real request doesn't pay for cold caches"""
+        if not self.settings.WARMUP_ENABLED:
+            return
         try:
-            self.logger.info("Loading GPT-4ALL model...")
-            model_dir = self.settings.MODEL_DIR
-            model_name = self.settings.MODEL_NAME
-
-            self.logger.debug(f"Model directory: {model_dir}")
-            self.logger.debug(f"Model name: {model_name}")
-
-            # Enable GPU mode by removing CPU-only restrictions
-            if "CUDA_VISIBLE_DEVICES" in os.environ:
-                del os.environ["CUDA_VISIBLE_DEVICES"]
-
-            # Load model in a thread pool to avoid blocking
-            self._model = await asyncio.to_thread(
-                lambda: GPT4All(
-                    model_name=model_name,
-                    model_path=model_dir,
-                    allow_download=False,  # We handle downloads separately
-                    n_threads=self.settings.N_THREADS
-                )
+            await loaded.scheduler.submit(
+                lambda model: model.generate(
+                    self.settings.WARMUP_PROMPT, max_tokens=self.settings.WARMUP_MAX_TOKENS
+                ),
+                priority=PRIORITIES["high"],
             )
-            self.logger.info("Model loaded successfully with GPU support")
         except Exception as e:
-            self.logger.error(f"Error loading model: {str(e)}")
-            raise ModelLoadError(f"Failed to load GPT-4ALL model: {str(e)}")
+            # A failed warm-up only costs latency; the model itself is usable
+            self.logger.warning(f"Warm-up generation of {loaded.name} failed: {str(e)}")
+
+    async def _preload(self):
+        """Load and warm the configured preload set; failures leave models to load on demand"""
+        for name in self.settings.PRELOAD_MODELS:
+            try:
+                await self._warm_up(await self.registry.load(name))
+            except Exception as e:
+                self.logger.warning(f"Failed to preload model {name}: {str(e)}")
+
+    def readiness(self) -> Dict[str, Any]:
+        """Report whether the service can serve requests, with per-phase timings"""
+        if self._ready:
+            status = "ready"
+        elif self._init_error is not None:
+            status = "error"
+        else:
+            status = "loading"
+        return {
+            "status": status,
+            "ready": self._ready,
+            "phases": self._phases,
+            "seconds_since_start": round(time.perf_counter() - self._created_at, 3),
+            "error": self._init_error,
+        }
 
     def is_model_loaded(self) -> bool:
-        """Check if the model is loaded"""
-        return self._model is not None
+        """Check if any model is loaded"""
+        return self.registry.is_loaded()
+
+    def model_stats(self) -> Dict[str, Any]:
+        """Return resident models, their memory and load/eviction counters"""
+        return self.registry.stats()
 
-    async def generate(self, prompt: str) -> str:
-        """Generate code based on prompt"""
+    def scheduler_stats(self) -> Optional[Dict[str, Any]]:
+        """Return queue depth, wait time and throughput counters per resident model"""
+        return {loaded.name: loaded.scheduler.stats() for loaded in self.registry.resident()} or None
+
+    def coalescing_stats(self) -> Dict[str, Any]:
+        """Return counters for coalesced identical requests"""
+        return self._flights.stats()
+
+    def session_stats(self) -> Dict[str, Any]:
+        """Return chat session counters"""
+        return self.sessions.stats()
+
+    async def create_session(self, system_prompt: Optional[str] = None) -> Dict[str, Any]:
+        """Start a chat session and return its info"""
+        return self.sessions.create(system_prompt or self.settings.SESSION_SYSTEM_PROMPT).info()
+
+    async def get_session(self, session_id: str) -> Dict[str, Any]:
+        return self.sessions.get(session_id).info()
+
+    async def delete_session(self, session_id: str):
+        await self.sessions.delete(session_id)
+
+    async def session_generate(
+        self,
+        session_id: str,
+        prompt: str,
+        priority: str = "normal",
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Run one turn in a chat session, reusing its live context"""
+        self.sessions.get(session_id)  # fail fast on unknown sessions
         await self.ensure_initialized()
 
-        if not self.is_model_loaded():
-            raise ModelLoadError("Model not loaded")
+        try:
+            # Sessions run on the default model; its scheduler bounds their concurrency
+            async with self.registry.use(self.settings.MODEL_NAME) as loaded:
+                return await self.sessions.generate(
+                    session_id,
+                    prompt,
+                    submit=lambda fn, on_cancel: loaded.scheduler.submit(
+                        fn, priority=PRIORITIES[priority], timeout=self._request_timeout(timeout), on_cancel=on_cancel
+                    ),
+                )
+        except CacheCowException:
+            raise
+        except Exception as e:
+            self.logger.error(f"Error generating session response: {str(e)}")
+            raise Exception(f"Failed to generate response: {str(e)}")
+
+    async def start_batch(self, items: List[Dict[str, Any]], priority: str = "low") -> Batch:
+        """Start generating a batch of items; each item has id, prompt and params"""
+        return self.batches.start(items, priority)
+
+    async def get_batch(self, batch_id: str) -> Batch:
+        return self.batches.get(batch_id)
+
+    async def cancel_batch(self, batch_id: str) -> Batch:
+        return await self.batches.cancel(batch_id)
+
+    def abort_stats(self) -> Dict[str, Any]:
+        """Return counts of generations stopped early and the tokens that saved"""
+        by_reason: Dict[str, int] = {}
+        for (_, reason), count in metrics.GENERATIONS_ABORTED.values().items():
+            by_reason[reason] = by_reason.get(reason, 0) + int(count)
+        return {
+            "aborted": sum(by_reason.values()),
+            "by_reason": by_reason,
+            "tokens_saved": int(sum(metrics.TOKENS_SAVED.values().values())),
+        }
+
+    def batch_stats(self) -> Dict[str, Any]:
+        """Return batch generation counters"""
+        return self.batches.stats()
 
+    async def create_project(self, name: str, description: str, template: str) -> ProjectJob:
+        """Plan a project from a template and start generating its files in the background"""
+        return self.projects.submit(name, description, template)
+
+    async def get_project(self, project_id: str) -> ProjectJob:
+        return self.projects.get(project_id)
+
+    async def project_file(self, project_id: str, path: str) -> str:
+        return self.projects.file_path(project_id, path)
+
+    async def project_events(self, project_id: str) -> AsyncIterator[Dict[str, Any]]:
+        return self.projects.events(project_id)
+
+    def resume_projects(self):
+        """Continue project jobs interrupted by a restart"""
+        self.projects.resume()
+
+    def project_stats(self) -> Dict[str, Any]:
+        """Return project job counters"""
+        return self.projects.stats()
+
+    async def start_sandbox(self):
+        """Prewarm the sandbox workers that execute /workflow code"""
         try:
-            full_prompt = f"""Write code for the following request:
-{prompt}
+            await self.sandbox.start()
+        except Exception as e:
+            self.logger.error(f"Failed to start sandbox workers: {str(e)}")
 
-Return only the code without explanations:
-"""
-            response = await asyncio.to_thread(
-                lambda: self._model.generate(
-                    full_prompt,
-                    max_tokens=self.settings.MAX_TOKENS,
-                    temp=self.settings.TEMPERATURE,
-                    top_k=40,
-                    top_p=0.9,
-                    repeat_penalty=1.1
-                )
+    async def run_workflow(
+        self,
+        code: Optional[str] = None,
+        prompt: Optional[str] = None,
+        stdin: str = "",
+        timeout: Optional[float] = None,
+        model: Optional[str] = None,
+        priority: str = "normal",
+    ) -> Dict[str, Any]:
+        """Execute code in the sandbox, generating it from prompt first when no code is given"""
+        if (code is None) == (prompt is None):
+            raise ValidationError("Provide either code or prompt")
+        await self.sandbox.start()  # raises SandboxUnavailableError before any generation if it cannot run code
+        generated = code is None
+        if generated:
+            code = strip_code_fences(await self.generate(prompt, priority=priority, model=model))
+        if len(code.encode()) > self.settings.SANDBOX_MAX_CODE_BYTES:
+            raise ValidationError(f"Code is larger than {self.settings.SANDBOX_MAX_CODE_BYTES} bytes")
+
+        result = await self.sandbox.execute(code, stdin=stdin, timeout=timeout)
+        record_span("sandbox_queue_wait", result.queue_ms / 1000)
+        record_span("execution", result.duration_ms / 1000)
+        return {"code": code, "generated": generated, **asdict(result)}
+
+    def sandbox_stats(self) -> Dict[str, Any]:
+        """Return sandbox worker pool counters"""
+        return self.sandbox.stats()
+
+    def worker_stats(self) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """Return per-process stats per resident model when running worker pools"""
+        return {
+            loaded.name: loaded.model.stats()
+            for loaded in self.registry.resident()
+            if isinstance(loaded.model, ModelWorkerPool)
+        } or None
+
+    async def shutdown(self):
+        """Cancel batches and project jobs, stop session contexts and sandboxes, and unload every model (schedulers and worker processes)"""
+        self.sessions.close()
+        await self.batches.close()
+        await self.projects.close()
+        await self.sandbox.close()
+        await self.registry.close()
+
+    def _request_timeout(self, timeout: Optional[float]) -> Optional[float]:
+        """Per-request deadline, falling back to the configured default"""
+        return timeout if timeout is not None else self.settings.INFERENCE_TIMEOUT_SECONDS
+
+    def _generation_params(
+        self,
+        model: str,
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+        top_k: Optional[int] = None,
+        top_p: Optional[float] = None,
+        stop: Optional[List[str]] = None,
+        template: Optional[str] = None,
+        repeat_penalty: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Generation parameters (request overrides over the defaults); also part of the response cache key"""
+        settings = self.settings
+        if max_tokens is not None and max_tokens > settings.MAX_TOKENS_LIMIT:
+            raise ValidationError(f"max_tokens is {max_tokens}, the limit is {settings.MAX_TOKENS_LIMIT}")
+        stop = settings.STOP_SEQUENCES if stop is None else stop
+        if len(stop) > settings.MAX_STOP_SEQUENCES:
+            raise ValidationError(f"At most {settings.MAX_STOP_SEQUENCES} stop sequences are allowed")
+        if any(not sequence or len(sequence) > settings.MAX_STOP_SEQUENCE_LENGTH for sequence in stop):
+            raise ValidationError(f"Stop sequences must be 1-{settings.MAX_STOP_SEQUENCE_LENGTH} characters long")
+        return {
+            "model": model,
+            "max_tokens": max_tokens if max_tokens is not None else settings.MAX_TOKENS,
+            "temp": temperature if temperature is not None else settings.TEMPERATURE,
+            "top_k": top_k if top_k is not None else settings.TOP_K,
+            "top_p": top_p if top_p is not None else settings.TOP_P,
+            "repeat_penalty": repeat_penalty if repeat_penalty is not None else settings.REPEAT_PENALTY,
+            "stop": list(stop),
+            "stop_at_code_block_end": settings.STOP_AT_CODE_BLOCK_END,
+            "template": get_template(template or settings.PROMPT_TEMPLATE).name,
+        }
+
+    def _prepare_prompt(self, prompt: str, params: Dict[str, Any]) -> PreparedPrompt:
+        """Render the prompt and fit it plus max_tokens into the model's context window
+
+        Lowers params["max_tokens"] when only part of it fits; raises
+        PromptTooLongError when the prompt itself does not fit and the
+        overflow strategy is "reject".
+        """
+        model = params["model"]
+        requested = params["max_tokens"]
+        try:
+            with span("tokenize"):
+                prepared = self.prompts.prepare(prompt, params["template"], requested, self.registry.context_length(model))
+        except PromptTooLongError:
+            metrics.CONTEXT_OVERFLOWS.labels(model, "rejected").inc()
+            raise
+        if prepared.truncated_tokens:
+            metrics.CONTEXT_OVERFLOWS.labels(model, "truncated").inc()
+        elif prepared.max_tokens < requested:
+            metrics.CONTEXT_OVERFLOWS.labels(model, "clamped").inc()
+        metrics.PROMPT_TOKENS.labels(model).observe(prepared.prompt_tokens)
+        params["max_tokens"] = prepared.max_tokens
+        return prepared
+
+    def prompt_stats(self) -> Dict[str, Any]:
+        """Return prompt budgeting and token cache counters"""
+        return self.prompts.stats()
+
+    async def inference_metrics(self) -> str:
+        """Prometheus text of this process, where the models run"""
+        return metrics.REGISTRY.render()
+
+    def collect_metrics(self) -> List[metrics.Family]:
+        """Scrape-time gauges and counters derived from the services' own stats"""
+        Family = metrics.Family
+        resident = self.registry.resident()
+        registry_stats = self.registry.stats()
+
+        queue_depth, active, jobs = [], [], []
+        for loaded in resident:
+            labels = {"model": loaded.name}
+            scheduler = loaded.scheduler.stats()
+            queue_depth.append((labels, scheduler["queue_depth"]))
+            active.append((labels, scheduler["active"]))
+            for outcome in ("submitted", "completed", "failed", "rejected", "expired", "cancelled"):
+                jobs.append(({**labels, "outcome": outcome}, scheduler[outcome]))
+
+        families = [
+            Family("cachecow_ready", "gauge", "Whether the service has finished starting up",
+                   [({}, 1 if self._ready else 0)]),
+            Family("cachecow_inference_queue_depth", "gauge", "Jobs waiting in the inference queue", queue_depth),
+            Family("cachecow_inference_active", "gauge", "Jobs currently running on a model", active),
+            Family("cachecow_inference_jobs_total", "counter", "Inference jobs by outcome", jobs),
+            Family("cachecow_model_memory_bytes", "gauge", "Estimated memory of resident models",
+                   [({"model": m.name}, m.memory_bytes) for m in resident]),
+            Family("cachecow_model_memory_budget_bytes", "gauge", "Memory budget for resident models (0 = unlimited)",
+                   [({}, self.registry.budget_bytes)]),
+            Family("cachecow_model_loads_total", "counter", "Models loaded",
+                   [({}, registry_stats["loads"])]),
+            Family("cachecow_model_evictions_total", "counter", "Models evicted to stay within the memory budget",
+                   [({}, registry_stats["evictions"])]),
+        ]
+
+        cache_samples = []
+        if self.cache is not None:
+            cache_samples.append(({"tier": "exact"}, self.cache.stats()["hit_ratio"]))
+        if self.semantic_cache is not None:
+            cache_samples.append(({"tier": "semantic"}, self.semantic_cache.stats()["hit_ratio"]))
+        families.append(Family("cachecow_cache_hit_ratio", "gauge", "Response cache hit ratio since start", cache_samples))
+
+        flights = self._flights.stats()
+        families.append(Family("cachecow_coalesced_requests_total", "counter",
+                               "Requests served by joining an identical in-flight generation",
+                               [({"kind": "generate"}, flights["coalesced"]), ({"kind": "stream"}, flights["stream_coalesced"])]))
+        sessions = self.sessions.stats()
+        families.append(Family("cachecow_sessions", "gauge", "Chat sessions by state",
+                               [({"state": "total"}, sessions["sessions"]), ({"state": "live"}, sessions["live"])]))
+        return families
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Return response cache counters, or None if caching is disabled"""
+        stats = self.cache.stats() if self.cache is not None else {}
+        if self.semantic_cache is not None:
+            stats["semantic"] = self.semantic_cache.stats()
+        return stats or None
+
+    def _cache_keys(self, prompt: str, params: Dict[str, Any], bypass_cache: bool) -> Tuple[Optional[str], Optional[str]]:
+        """Return (exact cache key, semantic params key); None for disabled tiers"""
+        if bypass_cache:
+            return None, None
+        cache_key = make_cache_key(prompt, params) if self.cache is not None else None
+        params_key = make_cache_key("", params) if self.semantic_cache is not None else None
+        return cache_key, params_key
+
+    async def _cache_lookup(self, prompt: str, cache_key: Optional[str], params_key: Optional[str]) -> Optional[str]:
+        """Look up a response in the exact cache, then the semantic cache"""
+        if cache_key is not None:
+            cached = await self.cache.lookup(cache_key)
+            metrics.CACHE_LOOKUPS.labels("exact", "miss" if cached is None else "hit").inc()
+            if cached is not None:
+                self.logger.debug("Serving generation from response cache")
+                return cached
+
+        if params_key is not None:
+            cached = await self.semantic_cache.lookup(prompt, params_key)
+            metrics.CACHE_LOOKUPS.labels("semantic", "miss" if cached is None else "hit").inc()
+            if cached is not None:
+                self.logger.debug("Serving generation from semantic cache")
+                if cache_key is not None:
+                    self.cache.put(cache_key, cached)
+                return cached
+        return None
+
+    async def _cache_store(self, prompt: str, cache_key: Optional[str], params_key: Optional[str], code: str):
+        """Store a generated response in every enabled cache tier"""
+        if cache_key is not None:
+            await self.cache.store(cache_key, code)
+        if params_key is not None:
+            await self.semantic_cache.store(prompt, params_key, code)
+
+    def _model_kwargs(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """GPT4All.generate keyword arguments for the given parameters"""
+        kwargs = {key: value for key, value in params.items() if key not in _SERVICE_PARAMS}
+        # Performance-only setting, so it stays out of the cache key
+        kwargs["n_batch"] = self.registry.n_batch(params["model"])
+        return kwargs
+
+    @staticmethod
+    def _stop_matcher(params: Dict[str, Any]) -> StopMatcher:
+        """Fresh stop-sequence detector for one generation"""
+        return StopMatcher(params["stop"], close_code_block=params["stop_at_code_block_end"])
+
+    async def generate_result(
+        self,
+        prompt: str,
+        bypass_cache: bool = False,
+        refresh_cache: bool = False,
+        priority: str = "normal",
+        timeout: Optional[float] = None,
+        model: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+        top_k: Optional[int] = None,
+        top_p: Optional[float] = None,
+        stop: Optional[List[str]] = None,
+        template: Optional[str] = None,
+        repeat_penalty: Optional[float] = None,
+    ) -> Tuple[str, PreparedPrompt]:
+        """Generate code based on prompt; returns the code and the prompt as sent
+
+        bypass_cache skips the response cache entirely; refresh_cache skips the
+        lookup but stores the fresh result. priority and timeout control how
+        the request is queued by the inference scheduler. model selects a
+        registered model; by default one is routed by prompt size. The
+        sampling options and stop sequences override the configured
+        defaults; generation halts on the token that completes a stop
+        sequence, which is not included in the result. template names the
+        prompt template; prompts that do not fit the model's context window
+        are handled by the CONTEXT_OVERFLOW strategy.
+        """
+        params = self._generation_params(
+            self.registry.resolve(model, prompt), max_tokens, temperature, top_k, top_p, stop, template, repeat_penalty
+        )
+        prepared = self._prepare_prompt(prompt, params)
+        cache_key, params_key = self._cache_keys(prompt, params, bypass_cache)
+
+        if not refresh_cache:
+            cached = await self._cache_lookup(prompt, cache_key, params_key)
+            if cached is not None:
+                return cached, prepared
+
+        await self.ensure_initialized()
+
+        async with self.registry.use(params["model"]) as loaded:
+            code = await self._generate(
+                prompt, prepared.text, params, cache_key, params_key, loaded.scheduler, priority, timeout, bypass_cache
             )
+        return code, prepared
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        """Generate code based on prompt (see generate_result for the options)"""
+        code, _ = await self.generate_result(prompt, **kwargs)
+        return code
+
+    async def _generate(
+        self,
+        prompt: str,
+        full_prompt: str,
+        params: Dict[str, Any],
+        cache_key: Optional[str],
+        params_key: Optional[str],
+        scheduler: InferenceScheduler,
+        priority: str,
+        timeout: Optional[float],
+        bypass_cache: bool,
+    ) -> str:
+        """Run (or join) one generation on the selected model's scheduler"""
+        timeout = self._request_timeout(timeout)
+        model_kwargs = self._model_kwargs(params)
+        # Identical concurrent requests share one generation unless the caller
+        # explicitly asked for an independent one
+        flight_key = None if bypass_cache else make_cache_key(prompt, params)
+
+        async def run() -> str:
+            stats = GenerationStats(max_tokens=model_kwargs.get("max_tokens"))
+            stop = self._stop_matcher(params)
+            chunks: List[str] = []
+
+            def on_token(token_id: int, token: str) -> bool:
+                # Timestamps the token, then stops generation on a stop sequence
+                # or once the request is cancelled or its deadline passes
+                keep_going = stats.callback(token_id, token)
+                chunks.append(stop.feed(token))
+                if stop.stopped:
+                    stats.stop_sequence_hit = True
+                    return False
+                return keep_going
+
+            def generate(model) -> str:
+                stats.mark_started()
+                try:
+                    model.generate(full_prompt, callback=on_token, **model_kwargs)
+                    return "".join(chunks) + stop.flush()
+                finally:
+                    stats.finish()
+                    if stats.aborted is not None:
+                        # Nobody awaits the result any more; record the early stop here
+                        metrics.record_generation(params["model"], stats)
 
-            if not response or not response.strip():
-                raise Exception("Empty response from model")
+            try:
+                response = await scheduler.submit(
+                    generate,
+                    priority=PRIORITIES[priority],
+                    # Coalesced callers enforce their own deadlines on the shared task,
+                    # which is cancelled once the last of them has gone
+                    timeout=None if flight_key else timeout,
+                    on_cancel=stats.cancel,
+                )
 
-            code = response.strip()
+                if not response or not response.strip():
+                    raise Exception("Empty response from model")
+
+                code = response.strip()
+            except CacheCowException:
+                raise
+            except Exception as e:
+                self.logger.error(f"Error generating response: {str(e)}")
+                raise Exception(f"Failed to generate response: {str(e)}")
+
+            metrics.record_generation(params["model"], stats)
+            self._record_spans(stats)
+            await self._cache_store(prompt, cache_key, params_key, code)
             return code
 
+        if flight_key is None:
+            return await run()
+
+        if not self._flights.in_flight(flight_key):
+            scheduler.admit(timeout)
+        try:
+            return await self._flights.do(flight_key, run, timeout=timeout)
+        except asyncio.TimeoutError:
+            raise self._deadline_error(timeout, scheduler)
+
+    @staticmethod
+    def _record_spans(stats: GenerationStats):
+        """Add the generation's phases to the current request's timing spans"""
+        record_span("queue_wait", stats.queue_wait)
+        record_span("prompt_eval", stats.prompt_eval_time)
+        record_span("generation", stats.generation_time)
+
+    @staticmethod
+    def _deadline_error(timeout: float, scheduler: InferenceScheduler) -> ServiceOverloadedError:
+        return ServiceOverloadedError(
+            f"Request deadline of {timeout}s exceeded",
+            retry_after=scheduler.retry_after(),
+            status_code=503,
+        )
+
+    async def generate_stream(
+        self,
+        prompt: str,
+        bypass_cache: bool = False,
+        refresh_cache: bool = False,
+        priority: str = "normal",
+        timeout: Optional[float] = None,
+        model: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+        top_k: Optional[int] = None,
+        top_p: Optional[float] = None,
+        stop: Optional[List[str]] = None,
+        template: Optional[str] = None,
+        repeat_penalty: Optional[float] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream generated tokens as they are produced
+
+        Yields {"token": str} events followed by a final {"done": True, ...}
+        event carrying prompt tokens, time-to-first-token and tokens/sec.
+        Cache hits are sent as a single token. Concurrent identical streams
+        share one generation and receive the same tokens.
+        """
+        params = self._generation_params(
+            self.registry.resolve(model, prompt), max_tokens, temperature, top_k, top_p, stop, template, repeat_penalty
+        )
+        prepared = self._prepare_prompt(prompt, params)
+        cache_key, params_key = self._cache_keys(prompt, params, bypass_cache)
+
+        if not refresh_cache:
+            cached = await self._cache_lookup(prompt, cache_key, params_key)
+            if cached is not None:
+                yield {"token": cached}
+                yield {"done": True, "cached": True, "prompt_tokens": prepared.prompt_tokens}
+                return
+
+        await self.ensure_initialized()
+
+        async with self.registry.use(params["model"]) as loaded:
+            scheduler = loaded.scheduler
+            timeout = self._request_timeout(timeout)
+            flight_key = None if bypass_cache else make_cache_key(prompt, params)
+            if flight_key is None:
+                async for event in self._stream_tokens(prompt, prepared, params, cache_key, params_key, scheduler, priority, timeout):
+                    yield event
+                return
+
+            if not self._flights.in_flight(flight_key, stream=True):
+                scheduler.admit(timeout)
+            events = self._flights.subscribe(
+                flight_key,
+                lambda: self._stream_tokens(prompt, prepared, params, cache_key, params_key, scheduler, priority, None),
+                timeout=timeout,
+            )
+            try:
+                async for event in events:
+                    yield event
+            except asyncio.TimeoutError:
+                raise self._deadline_error(timeout, scheduler)
+            finally:
+                await events.aclose()
+
+    async def _stream_tokens(
+        self,
+        prompt: str,
+        prepared: PreparedPrompt,
+        params: Dict[str, Any],
+        cache_key: Optional[str],
+        params_key: Optional[str],
+        scheduler: InferenceScheduler,
+        priority: str,
+        timeout: Optional[float],
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Run one streamed generation through the scheduler"""
+        stream = TokenStream(asyncio.get_running_loop(), self.settings.STREAM_QUEUE_SIZE, self._stop_matcher(params))
+        full_prompt = prepared.text
+        model_kwargs = self._model_kwargs(params)
+        stream.stats.max_tokens = model_kwargs.get("max_tokens")
+
+        def run(model):
+            stream.stats.mark_started()
+            try:
+                model.generate(
+                    full_prompt,
+                    callback=lambda token_id, token: stream.push(token),
+                    **model_kwargs
+                )
+            except Exception as e:
+                stream.finish(e)
+            else:
+                stream.finish()
+            if stream.stats.aborted is not None:
+                metrics.record_generation(params["model"], stream.stats)
+
+        async def submit():
+            try:
+                await scheduler.submit(
+                    run, priority=PRIORITIES[priority], timeout=timeout, on_cancel=stream.stats.cancel
+                )
+            except Exception as e:
+                # Rejected, expired or failed before the worker could finish the stream
+                stream.abort(e)
+
+        worker = asyncio.create_task(submit())
+        completed = False
+        try:
+            async for token in stream:
+                yield {"token": token}
+            completed = True
+        except CacheCowException:
+            raise
         except Exception as e:
-            self.logger.error(f"Error generating response: {str(e)}")
+            self.logger.error(f"Error streaming response: {str(e)}")
             raise Exception(f"Failed to generate response: {str(e)}")
+        finally:
+            stream.close()
+            if not completed:
+                worker.cancel()
+
+        await worker
+        metrics.record_generation(params["model"], stream.stats)
+        self._record_spans(stream.stats)
+        stats = stream.stats.as_dict()
+        self.logger.info(
+            f"Streamed {stats['tokens']} tokens (ttft={stats['ttft_ms']}ms, "
+            f"{stats['tokens_per_second']} tokens/s)"
+        )
+        code = stream.text.strip()
+        if code:
+            await self._cache_store(prompt, cache_key, params_key, code)
+        yield {"done": True, "cached": False, "prompt_tokens": prepared.prompt_tokens, **stats}
 
     def __del__(self):
         """Cleanup when service is destroyed"""
-        if self._model:
-            self.logger.info("Cleaning up GPT-4ALL model resources")
-            del self._model
\ No newline at end of file
+        if self.cache is not None:
+            self.cache.close()
\ No newline at end of file
@@ -0,0 +1,296 @@
+"""HTTP-worker side of the split deployment: a pooled client for the inference daemon
+
+RemoteService offers the GPT4ALLService methods the routes use and forwards
+them to the daemon (inference_daemon.py), so a worker holds no models and
+any number of workers can share one daemon. Connections are kept open and
+reused; one carries a single request at a time, which also makes the pool
+size the worker's limit on requests in flight to the daemon. Stats and
+readiness are served from a snapshot of the daemon's status refreshed in
+the background, so /status and /ready never wait on the daemon. The status
+poller and /metrics use a connection of their own, so they are never
+queued behind long generations and streams holding the pool.
+"""
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from src.config import get_settings
+from src.utils.logger import get_logger
+from src.utils.exceptions import ModelLoadError
+from src.services.prompt_manager import PreparedPrompt
+from src.services.inference_protocol import DEFAULT_CODEC, MAX_FRAME_BYTES, encode, read_frame, rebuild_error
+
+
+class InferenceClient:
+    """Pool of Unix-socket connections to the inference daemon"""
+
+    def __init__(self, path: str, pool_size: int, codec: int = DEFAULT_CODEC):
+        self.path = path
+        self.codec = codec
+        self._slots = asyncio.Semaphore(max(1, pool_size))
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self.opened = 0
+        self.reused = 0
+
+    @asynccontextmanager
+    async def _connection(self):
+        """An idle connection (or a new one); dropped instead of reused if the request did not finish"""
+        async with self._slots:
+            connection = None
+            while self._idle and connection is None:
+                reader, writer = self._idle.pop()
+                if reader.at_eof() or writer.is_closing():
+                    writer.close()  # the daemon went away (or restarted) while it was idle
+                else:
+                    connection = reader, writer
+                    self.reused += 1
+            if connection is None:
+                try:
+                    connection = await asyncio.open_unix_connection(self.path, limit=MAX_FRAME_BYTES)
+                except OSError as e:
+                    raise ModelLoadError(f"Inference daemon unavailable: {str(e)}")
+                self.opened += 1
+
+            finished = False
+            try:
+                yield connection
+                finished = True
+            except (asyncio.IncompleteReadError, ConnectionError) as e:
+                raise ModelLoadError(f"Lost connection to the inference daemon: {e!r}")
+            finally:
+                if finished:
+                    self._idle.append(connection)
+                else:
+                    # The daemon treats a closed connection as a cancelled request
+                    connection[1].close()
+
+    async def _send(self, writer: asyncio.StreamWriter, op: str, args: Dict[str, Any]):
+        writer.write(encode({"op": op, "args": args}, self.codec))
+        await writer.drain()
+
+    async def call(self, op: str, **args) -> Any:
+        """Run op on the daemon and return its result"""
+        async with self._connection() as (reader, writer):
+            await self._send(writer, op, args)
+            reply, _ = await read_frame(reader)
+        if "error" in reply:
+            raise rebuild_error(reply["error"])
+        return reply["ok"]
+
+    async def stream(self, op: str, **args) -> AsyncIterator[Dict[str, Any]]:
+        """Run a streaming op on the daemon, yielding its events"""
+        error = None
+        async with self._connection() as (reader, writer):
+            await self._send(writer, op, args)
+            while True:
+                message, _ = await read_frame(reader)
+                if "event" in message:
+                    yield message["event"]
+                    continue
+                error = message.get("error")
+                break
+        if error is not None:
+            raise rebuild_error(error)
+
+    async def open_stream(self, op: str, **args) -> AsyncIterator[Dict[str, Any]]:
+        """Like stream, but errors the daemon reports before the first event are raised here"""
+        events = self.stream(op, **args)
+        try:
+            first = [await events.__anext__()]
+        except StopAsyncIteration:
+            first = []
+
+        async def replay() -> AsyncIterator[Dict[str, Any]]:
+            try:
+                for event in first:
+                    yield event
+                async for event in events:
+                    yield event
+            finally:
+                await events.aclose()
+
+        return replay()
+
+    def close(self):
+        for _, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"socket": self.path, "idle": len(self._idle), "opened": self.opened, "reused": self.reused}
+
+
+class RemoteBatch:
+    """Batch handle backed by the daemon"""
+
+    def __init__(self, client: InferenceClient, info: Dict[str, Any]):
+        self._client = client
+        self._info = info
+        self.id = info["batch_id"]
+        self.items = info["items"]
+
+    def info(self) -> Dict[str, Any]:
+        return self._info
+
+    def follow(self) -> AsyncIterator[Dict[str, Any]]:
+        return self._client.stream("batch_follow", batch_id=self.id)
+
+
+class RemoteProject:
+    """Project job handle backed by the daemon"""
+
+    def __init__(self, info: Dict[str, Any]):
+        self._info = info
+        self.id = info["project_id"]
+
+    def info(self) -> Dict[str, Any]:
+        return self._info
+
+
+class RemoteService:
+    """GPT4ALLService stand-in for HTTP workers; the models live in the inference daemon"""
+
+    def __init__(self, path: str):
+        self.settings = get_settings()
+        self.logger = get_logger(__name__)
+        self.client = InferenceClient(path, self.settings.INFERENCE_CLIENT_POOL_SIZE)
+        self.control = InferenceClient(path, 1)  # status and metrics
+        self._created_at = time.perf_counter()
+        self._status: Optional[Dict[str, Any]] = None
+        self._status_error: Optional[str] = None
+        self._poller: Optional[asyncio.Task] = None
+
+    async def ensure_initialized(self):
+        """Start following the daemon's status (the daemon loads the models itself)"""
+        if self._poller is None:
+            self._poller = asyncio.create_task(self._poll_status())
+
+    async def _poll_status(self):
+        while True:
+            await self.refresh_status()
+            await asyncio.sleep(self.settings.INFERENCE_STATUS_INTERVAL_SECONDS)
+
+    async def refresh_status(self):
+        try:
+            self._status = await self.control.call("status")
+            self._status_error = None
+        except Exception as e:
+            if self._status_error is None:
+                self.logger.warning(f"Inference daemon status unavailable: {str(e)}")
+            self._status, self._status_error = None, str(e)
+
+    def _snapshot(self, key: str) -> Any:
+        return self._status[key] if self._status is not None else None
+
+    def readiness(self) -> Dict[str, Any]:
+        if self._status is not None:
+            return self._status["readiness"]
+        return {
+            "status": "error" if self._status_error else "loading",
+            "ready": False,
+            "phases": {},
+            "seconds_since_start": round(time.perf_counter() - self._created_at, 3),
+            "error": self._status_error,
+        }
+
+    def is_model_loaded(self) -> bool:
+        return bool(self._snapshot("model_loaded"))
+
+    def model_stats(self) -> Optional[Dict[str, Any]]:
+        return self._snapshot("models")
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        return self._snapshot("cache")
+
+    def scheduler_stats(self) -> Optional[Dict[str, Any]]:
+        return self._snapshot("scheduler")
+
+    def worker_stats(self) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        return self._snapshot("workers")
+
+    def coalescing_stats(self) -> Optional[Dict[str, Any]]:
+        return self._snapshot("coalescing")
+
+    def session_stats(self) -> Optional[Dict[str, Any]]:
+        return self._snapshot("sessions")
+
+    def batch_stats(self) -> Optional[Dict[str, Any]]:
+        return self._snapshot("batches")
+
+    def project_stats(self) -> Optional[Dict[str, Any]]:
+        return self._snapshot("projects")
+
+    def abort_stats(self) -> Optional[Dict[str, Any]]:
+        return self._snapshot("aborted")
+
+    def prompt_stats(self) -> Optional[Dict[str, Any]]:
+        return self._snapshot("prompts")
+
+    def sandbox_stats(self) -> Optional[Dict[str, Any]]:
+        return self._snapshot("sandbox")
+
+    async def inference_metrics(self) -> str:
+        return await self.control.call("metrics")
+
+    async def generate_result(self, prompt: str, **kwargs) -> Tuple[str, PreparedPrompt]:
+        result = await self.client.call("generate", prompt=prompt, **kwargs)
+        # The daemon keeps the rendered prompt; workers only report its size
+        return result["code"], PreparedPrompt("", result["prompt_tokens"], result["max_tokens"])
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        code, _ = await self.generate_result(prompt, **kwargs)
+        return code
+
+    def generate_stream(self, prompt: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        return self.client.stream("stream", prompt=prompt, **kwargs)
+
+    async def run_workflow(self, **kwargs) -> Dict[str, Any]:
+        return await self.client.call("workflow", **kwargs)
+
+    async def create_session(self, system_prompt: Optional[str] = None) -> Dict[str, Any]:
+        return await self.client.call("session_create", system_prompt=system_prompt)
+
+    async def get_session(self, session_id: str) -> Dict[str, Any]:
+        return await self.client.call("session_get", session_id=session_id)
+
+    async def delete_session(self, session_id: str):
+        await self.client.call("session_delete", session_id=session_id)
+
+    async def session_generate(self, session_id: str, prompt: str, **kwargs) -> Dict[str, Any]:
+        return await self.client.call("session_generate", session_id=session_id, prompt=prompt, **kwargs)
+
+    async def start_batch(self, items: List[Dict[str, Any]], priority: str = "low") -> RemoteBatch:
+        return RemoteBatch(self.client, await self.client.call("batch_start", items=items, priority=priority))
+
+    async def get_batch(self, batch_id: str) -> RemoteBatch:
+        return RemoteBatch(self.client, await self.client.call("batch_get", batch_id=batch_id))
+
+    async def cancel_batch(self, batch_id: str) -> RemoteBatch:
+        return RemoteBatch(self.client, await self.client.call("batch_cancel", batch_id=batch_id))
+
+    async def create_project(self, name: str, description: str, template: str) -> RemoteProject:
+        return RemoteProject(await self.client.call("project_create", name=name, description=description, template=template))
+
+    async def get_project(self, project_id: str) -> RemoteProject:
+        return RemoteProject(await self.client.call("project_get", project_id=project_id))
+
+    async def project_file(self, project_id: str, path: str) -> str:
+        return await self.client.call("project_file", project_id=project_id, path=path)
+
+    async def project_events(self, project_id: str) -> AsyncIterator[Dict[str, Any]]:
+        return await self.client.open_stream("project_events", project_id=project_id)
+
+    def resume_projects(self):
+        """Project jobs are resumed by the daemon"""
+
+    async def start_sandbox(self):
+        """Sandbox workers run under the daemon"""
+
+    async def shutdown(self):
+        """Stop following the daemon and close the pooled connections (the daemon keeps running)"""
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+        self.client.close()
+        self.control.close()
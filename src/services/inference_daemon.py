@@ -0,0 +1,189 @@
+"""Inference daemon: serves one GPT4ALLService to HTTP workers over a Unix socket
+
+In the split deployment the models, schedulers, caches and background jobs
+live in this single process, so model memory is paid once and scheduling
+stays global, while any number of stateless HTTP workers parse, validate
+and serialize requests. Each connection carries one request at a time
+(see inference_protocol); a client that closes its connection mid-request
+cancels that request, which stops its generation like an HTTP disconnect.
+"""
+import os
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict
+
+from src.utils.logger import get_logger
+from src.services.gpt4all_service import GPT4ALLService
+from src.services.inference_protocol import encode, error_payload, read_frame
+
+
+class InferenceDaemon:
+    """Unix-socket RPC server in front of a GPT4ALLService"""
+
+    def __init__(self, service: GPT4ALLService, path: str):
+        self.service = service
+        self.path = path
+        self.logger = get_logger(__name__)
+        self._server = None
+
+        s = service
+        self._calls: Dict[str, Callable[[Dict[str, Any]], Awaitable[Any]]] = {
+            "status": self._status,
+            "metrics": lambda args: s.inference_metrics(),
+            "generate": self._generate,
+            "workflow": lambda args: s.run_workflow(**args),
+            "session_create": lambda args: s.create_session(**args),
+            "session_get": lambda args: s.get_session(**args),
+            "session_delete": lambda args: s.delete_session(**args),
+            "session_generate": lambda args: s.session_generate(**args),
+            "batch_start": self._batch_start,
+            "batch_get": self._batch_get,
+            "batch_cancel": self._batch_cancel,
+            "project_create": self._project_create,
+            "project_get": self._project_get,
+            "project_file": self._project_file,
+        }
+        self._streams: Dict[str, Callable[[Dict[str, Any]], Awaitable[AsyncIterator[Dict[str, Any]]]]] = {
+            "stream": self._generate_stream,
+            "batch_follow": self._batch_follow,
+            "project_events": lambda args: s.project_events(**args),
+        }
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # left over from a previous run
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        os.chmod(self.path, 0o600)
+        self.logger.info(f"Inference daemon listening on {self.path}")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _receive(self, reader: asyncio.StreamReader, requests: asyncio.Queue, closed: asyncio.Event):
+        """Queue incoming requests; a None and the closed event mark the end of the connection"""
+        try:
+            while True:
+                requests.put_nowait(await read_frame(reader))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            self.logger.warning(f"Bad frame from inference client: {str(e)}")
+        finally:
+            requests.put_nowait(None)
+            closed.set()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        requests: asyncio.Queue = asyncio.Queue()
+        closed = asyncio.Event()
+        receiver = asyncio.create_task(self._receive(reader, requests, closed))
+        try:
+            while True:
+                frame = await requests.get()
+                if frame is None:
+                    return
+                task = asyncio.ensure_future(self._serve(*frame, writer))
+                hangup = asyncio.ensure_future(closed.wait())
+                await asyncio.wait({task, hangup}, return_when=asyncio.FIRST_COMPLETED)
+                hangup.cancel()
+                if not task.done():
+                    # The client closed the connection mid-request: it gave up on it
+                    task.cancel()
+                    await asyncio.wait({task})
+                    return
+                if not task.result():
+                    return
+        except Exception as e:
+            self.logger.warning(f"Inference connection failed: {str(e)}")
+        finally:
+            receiver.cancel()
+            writer.close()
+
+    async def _serve(self, request: Dict[str, Any], codec: int, writer: asyncio.StreamWriter) -> bool:
+        """Answer one request; returns whether the connection is still usable"""
+        op, args = request.get("op"), request.get("args") or {}
+        try:
+            if op in self._streams:
+                events = await self._streams[op](args)
+                try:
+                    async for event in events:
+                        writer.write(encode({"event": event}, codec))
+                        await writer.drain()
+                finally:
+                    await events.aclose()
+                reply = {"end": True}
+            elif op in self._calls:
+                reply = {"ok": await self._calls[op](args)}
+            else:
+                reply = {"error": error_payload(ValueError(f"Unknown operation: {op}"))}
+        except asyncio.CancelledError:
+            raise
+        except ConnectionError:
+            return False
+        except Exception as e:
+            reply = {"error": error_payload(e)}
+        writer.write(encode(reply, codec))
+        await writer.drain()
+        return True
+
+    async def _status(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        s = self.service
+        return {
+            "readiness": s.readiness(),
+            "model_loaded": s.is_model_loaded(),
+            "models": s.model_stats(),
+            "cache": s.cache_stats(),
+            "scheduler": s.scheduler_stats(),
+            "workers": s.worker_stats(),
+            "coalescing": s.coalescing_stats(),
+            "sessions": s.session_stats(),
+            "batches": s.batch_stats(),
+            "projects": s.project_stats(),
+            "aborted": s.abort_stats(),
+            "prompts": s.prompt_stats(),
+            "sandbox": s.sandbox_stats(),
+        }
+
+    async def _generate(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        code, prepared = await self.service.generate_result(**args)
+        return {"code": code, "prompt_tokens": prepared.prompt_tokens, "max_tokens": prepared.max_tokens}
+
+    async def _generate_stream(self, args: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        events = self.service.generate_stream(**args)
+        first = await events.__anext__()  # surfaces validation and load errors as replies
+
+        async def replay() -> AsyncIterator[Dict[str, Any]]:
+            try:
+                yield first
+                async for event in events:
+                    yield event
+            finally:
+                await events.aclose()
+
+        return replay()
+
+    async def _batch_start(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        return (await self.service.start_batch(**args)).info()
+
+    async def _batch_get(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        return (await self.service.get_batch(**args)).info()
+
+    async def _batch_cancel(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        return (await self.service.cancel_batch(**args)).info()
+
+    async def _batch_follow(self, args: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        return (await self.service.get_batch(**args)).follow()
+
+    async def _project_create(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        return (await self.service.create_project(**args)).info()
+
+    async def _project_get(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        return (await self.service.get_project(**args)).info()
+
+    async def _project_file(self, args: Dict[str, Any]) -> str:
+        # Front ends run on the same host, so they can serve the file directly
+        return os.path.abspath(await self.service.project_file(**args))
@@ -0,0 +1,80 @@
+"""Framing between the HTTP front end and the inference daemon
+
+Each message is a frame: a 4-byte big-endian payload length, a 1-byte
+codec ID and the payload. Payloads are msgpack when the msgpack package is
+installed and JSON otherwise; the receiver decodes by the codec ID, and the
+daemon answers in the codec it was asked in, so mixed installs still work.
+
+Messages:
+  request:  {"op": str, "args": {...}}
+  reply:    {"ok": result} | {"error": {...}}
+  stream:   {"event": {...}} per event, then {"end": True} or {"error": {...}}
+"""
+import json
+import struct
+import asyncio
+from typing import Any, Dict, Tuple
+
+from src.utils import exceptions
+from src.utils.exceptions import CacheCowException
+
+try:
+    import msgpack
+except ImportError:  # optional: JSON is used without it
+    msgpack = None
+
+JSON = 0
+MSGPACK = 1
+DEFAULT_CODEC = MSGPACK if msgpack is not None else JSON
+
+_HEADER = struct.Struct(">IB")
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+
+def encode(message: Any, codec: int = DEFAULT_CODEC) -> bytes:
+    if codec == MSGPACK:
+        payload = msgpack.packb(message, use_bin_type=True)
+    else:
+        payload = json.dumps(message, separators=(",", ":")).encode()
+    return _HEADER.pack(len(payload), codec) + payload
+
+
+def decode(payload: bytes, codec: int) -> Any:
+    if codec == MSGPACK:
+        if msgpack is None:
+            raise ValueError("Received a msgpack frame but msgpack is not installed")
+        return msgpack.unpackb(payload, raw=False)
+    return json.loads(payload)
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[Any, int]:
+    """Next message and its codec; raises asyncio.IncompleteReadError at EOF"""
+    length, codec = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    if length > MAX_FRAME_BYTES:
+        raise ValueError(f"Frame of {length} bytes exceeds the {MAX_FRAME_BYTES} byte limit")
+    return decode(await reader.readexactly(length), codec), codec
+
+
+def error_payload(error: Exception) -> Dict[str, Any]:
+    """Wire form of an exception (CacheCowExceptions keep their type and status)"""
+    if isinstance(error, CacheCowException):
+        return {
+            "type": type(error).__name__,
+            "message": error.message,
+            "status_code": error.status_code,
+            "retry_after": getattr(error, "retry_after", None),
+        }
+    return {"type": "Exception", "message": str(error), "status_code": 500, "retry_after": None}
+
+
+def rebuild_error(payload: Dict[str, Any]) -> Exception:
+    """The exception an error payload stands for, so callers can catch it by type"""
+    cls = getattr(exceptions, payload["type"], None)
+    if not (isinstance(cls, type) and issubclass(cls, CacheCowException)):
+        return Exception(payload["message"])
+    # Subclass constructors take differing arguments; restore the common fields directly
+    error = cls.__new__(cls)
+    CacheCowException.__init__(error, payload["message"], payload["status_code"])
+    if payload.get("retry_after") is not None:
+        error.retry_after = payload["retry_after"]
+    return error
@@ -0,0 +1,266 @@
+"""Admission-controlled scheduler that owns a model instance"""
+import math
+import time
+import asyncio
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from src.utils.logger import get_logger
+from src.utils.exceptions import ServiceOverloadedError
+from src.utils.metrics import QUEUE_WAIT
+from src.services.single_flight import DEADLINE, cancel_reason
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2
+
+PRIORITIES = {
+    "high": PRIORITY_HIGH,
+    "normal": PRIORITY_NORMAL,
+    "low": PRIORITY_BACKGROUND,
+}
+
+# Smoothing factor for the service/wait time moving averages
+_EWMA_ALPHA = 0.2
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    sequence: int
+    fn: Callable[[Any], Any] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    deadline: Optional[float] = field(compare=False, default=None)
+
+
+class InferenceScheduler:
+    """Runs model jobs from a bounded priority queue with a concurrency limit
+
+    Jobs are callables taking the model; they run on a dedicated thread pool
+    sized to the concurrency limit, so inference never competes with the
+    default executor. When the queue is full, submit() fails fast with a 429
+    whose Retry-After is derived from the measured service time. Jobs whose
+    deadline passes while queued are dropped with a 503.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        concurrency: int = 1,
+        max_queue: int = 32,
+        name: str = "inference",
+        model_name: str = "default",
+    ):
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+        self.name = name
+        self.model_name = model_name
+        self.logger = get_logger(__name__)
+        self._queue_wait_metric = QUEUE_WAIT.labels(model_name)
+
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._workers: List[asyncio.Task] = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._running: Dict[int, _Job] = {}  # jobs executing on the thread pool, by sequence
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.expired = 0
+        self.cancelled = 0
+        self._avg_service_time: Optional[float] = None
+        self._avg_wait_time: Optional[float] = None
+        self._max_wait_time = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self):
+        """Start worker tasks on the running event loop"""
+        if self.running:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix=self.name
+        )
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"{self.name}-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+        self.logger.info(
+            f"Started {self.name} scheduler (concurrency={self.concurrency}, queue={self.max_queue})"
+        )
+
+    async def stop(self):
+        """Stop workers and fail queued and running jobs"""
+        # A running job's thread cannot be interrupted, but its caller must not wait for it
+        jobs = list(self._running.values())
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._queue is not None:
+            while not self._queue.empty():
+                jobs.append(self._queue.get_nowait())
+        for job in jobs:
+            if not job.future.done():
+                job.future.set_exception(
+                    ServiceOverloadedError("Inference scheduler stopped", retry_after=1, status_code=503)
+                )
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def estimate_wait(self, depth: Optional[int] = None) -> Optional[float]:
+        """Estimated seconds until a newly queued job starts running"""
+        if self._avg_service_time is None:
+            return None
+        depth = self.queue_depth if depth is None else depth
+        busy = max(0, self._active + depth - self.concurrency + 1)
+        return busy * self._avg_service_time / self.concurrency
+
+    def retry_after(self) -> int:
+        """Whole seconds a rejected client should wait before retrying"""
+        wait = self.estimate_wait()
+        return max(1, math.ceil(wait)) if wait is not None else 1
+
+    def admit(self, timeout: Optional[float] = None):
+        """Fail fast if a new job cannot be queued or cannot start within timeout"""
+        if not self.running:
+            raise ServiceOverloadedError("Inference scheduler is not running", retry_after=1, status_code=503)
+
+        if self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            raise ServiceOverloadedError(
+                f"Inference queue is full ({self.max_queue} requests waiting)",
+                retry_after=self.retry_after(),
+            )
+
+        if timeout is not None:
+            expected_wait = self.estimate_wait()
+            if expected_wait is not None and expected_wait > timeout:
+                self.rejected += 1
+                raise ServiceOverloadedError(
+                    f"Estimated queue wait ({expected_wait:.1f}s) exceeds the request deadline",
+                    retry_after=self.retry_after(),
+                    status_code=503,
+                )
+
+    async def submit(
+        self,
+        fn: Callable[[Any], Any],
+        priority: int = PRIORITY_NORMAL,
+        timeout: Optional[float] = None,
+        on_cancel: Optional[Callable[[str], None]] = None,
+    ) -> Any:
+        """Queue fn(model) and wait for its result
+
+        Raises ServiceOverloadedError (429) if the queue is full, and (503) if
+        the deadline cannot be met or passes before the job completes. If the
+        caller is cancelled or the deadline passes while fn is running,
+        on_cancel is called with "cancelled" or "deadline" so fn can stop
+        early (worker threads cannot be interrupted from the outside).
+        """
+        self.admit(timeout)
+
+        now = time.monotonic()
+        deadline = now + timeout if timeout is not None else None
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(priority, next(self._sequence), fn, future, now, deadline)
+        self._queue.put_nowait(job)
+        self.submitted += 1
+
+        try:
+            if timeout is None:
+                return await future
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self.expired += 1
+            if on_cancel is not None:
+                on_cancel(DEADLINE)
+            raise ServiceOverloadedError(
+                f"Request deadline of {timeout}s exceeded",
+                retry_after=self.retry_after(),
+                status_code=503,
+            )
+        except asyncio.CancelledError as e:
+            self.cancelled += 1
+            if on_cancel is not None:
+                on_cancel(cancel_reason(e))
+            raise
+        finally:
+            # Queued jobs with a cancelled future are skipped by the workers
+            if not future.done():
+                future.cancel()
+
+    def _record(self, attribute: str, value: float):
+        previous = getattr(self, attribute)
+        setattr(self, attribute, value if previous is None else previous + _EWMA_ALPHA * (value - previous))
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            if job.future.done():
+                continue
+
+            started = time.monotonic()
+            if job.deadline is not None and started > job.deadline:
+                self.expired += 1
+                job.future.set_exception(
+                    ServiceOverloadedError("Request deadline passed while queued", retry_after=self.retry_after(), status_code=503)
+                )
+                continue
+
+            wait = started - job.enqueued_at
+            self._record("_avg_wait_time", wait)
+            self._max_wait_time = max(self._max_wait_time, wait)
+            self._queue_wait_metric.observe(wait)
+
+            self._active += 1
+            self._running[job.sequence] = job
+            try:
+                result = await loop.run_in_executor(self._executor, job.fn, self.model)
+            except Exception as e:
+                self.failed += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                self.completed += 1
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self._active -= 1
+                self._running.pop(job.sequence, None)
+                self._record("_avg_service_time", time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        avg_service = self._avg_service_time
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue": self.max_queue,
+            "concurrency": self.concurrency,
+            "active": self._active,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "cancelled": self.cancelled,
+            "avg_wait_ms": round(self._avg_wait_time * 1000, 2) if self._avg_wait_time is not None else None,
+            "max_wait_ms": round(self._max_wait_time * 1000, 2),
+            "avg_service_ms": round(avg_service * 1000, 2) if avg_service is not None else None,
+            "service_rate_per_s": round(self.concurrency / avg_service, 3) if avg_service else None,
+        }
@@ -0,0 +1,382 @@
+"""Registry of resident models with memory-budgeted loading and LRU eviction"""
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+from src.config import Settings
+from src.utils.logger import get_logger
+from src.utils.exceptions import ModelLoadError, ServiceOverloadedError, ValidationError
+from src.services.autotune import Tuning, TuningStore, available_cpus, calibrate, thread_candidates
+from src.services.inference_scheduler import InferenceScheduler
+from src.services.worker_pool import ModelWorkerPool, load_factory
+from src.utils.metrics import MODEL_DOWNLOAD, MODEL_LOAD
+
+_MB = 1024 * 1024
+
+
+@dataclass
+class LoadedModel:
+    """A resident model together with the scheduler that owns it"""
+    name: str
+    model: Any
+    scheduler: InferenceScheduler
+    memory_bytes: int
+    load_ms: float
+    pinned: bool = False
+    active: int = 0  # requests currently using the model
+    loaded_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.monotonic)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "memory_mb": round(self.memory_bytes / _MB, 1),
+            "pinned": self.pinned,
+            "active": self.active,
+            "load_ms": self.load_ms,
+            "idle_seconds": round(time.monotonic() - self.last_used, 1),
+            "workers": self.model.size if isinstance(self.model, ModelWorkerPool) else None,
+        }
+
+
+class ModelRegistry:
+    """Loads models on demand and keeps the resident set within a RAM budget
+
+    Memory per model is estimated as the GGUF file size (weights are mmapped
+    and shared across worker processes) plus a fixed context overhead per
+    replica. When loading a model would exceed MODEL_MEMORY_BUDGET_MB, idle
+    unpinned models are unloaded least recently used first. Requests hold a
+    model through use(), which keeps it from being evicted mid-request.
+    Dedicated instances (chat sessions) come from open_instance() and count
+    against the same budget. Memory is reserved under one registry-wide lock
+    before a load starts, so concurrent loads cannot overcommit the budget.
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.logger = get_logger(__name__)
+        self.budget_bytes = settings.MODEL_MEMORY_BUDGET_MB * _MB
+        self._models: Dict[str, LoadedModel] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._budget_lock = asyncio.Lock()  # one reserve-and-evict step at a time, across models
+        self._reserved_bytes = 0  # models being loaded
+        self._instance_bytes = 0  # instances handed out by open_instance()
+        self.instances = 0
+        self._tuning_store = TuningStore(settings.AUTOTUNE_PATH)
+        self._tunings: Dict[str, Tuning] = {}
+
+        self.loads = 0
+        self.evictions = 0
+        self.load_failures = 0
+
+    @property
+    def available(self) -> List[str]:
+        """Models requests may select"""
+        names = [self.settings.MODEL_NAME, *self.settings.MODELS, *self.settings.MODEL_ROUTES]
+        return list(dict.fromkeys(names))
+
+    def resolve(self, requested: Optional[str], prompt: str) -> str:
+        """Pick the model for a request: explicit choice, else routing by prompt size"""
+        if requested:
+            if requested not in self.available:
+                raise ValidationError(f"Unknown model: {requested}")
+            return requested
+        # Smallest route whose prompt-size limit fits the prompt
+        for name, max_chars in sorted(self.settings.MODEL_ROUTES.items(), key=lambda item: item[1]):
+            if len(prompt) <= max_chars:
+                return name
+        return self.settings.MODEL_NAME
+
+    def is_loaded(self, name: Optional[str] = None) -> bool:
+        return name in self._models if name else bool(self._models)
+
+    def get(self, name: str) -> Optional[LoadedModel]:
+        return self._models.get(name)
+
+    def resident(self) -> List[LoadedModel]:
+        return list(self._models.values())
+
+    def model_path(self, name: str) -> str:
+        return os.path.join(self.settings.MODEL_DIR, name)
+
+    def n_threads(self, name: str) -> int:
+        """Threads per model instance: calibrated if tuned, else the configured default"""
+        tuning = self._tunings.get(name)
+        if tuning is not None:
+            return tuning.n_threads
+        return self.settings.WORKER_THREADS if self.settings.WORKER_POOL_SIZE > 0 else self.settings.N_THREADS
+
+    def context_length(self, name: str) -> int:
+        """Context window (n_ctx) the model is loaded with"""
+        return self.settings.MODEL_CONTEXT_LENGTHS.get(name, self.settings.CONTEXT_LENGTH)
+
+    def n_batch(self, name: str) -> int:
+        """Prompt batch size: calibrated if tuned, else the configured default"""
+        tuning = self._tunings.get(name)
+        return tuning.n_batch if tuning is not None else self.settings.N_BATCH
+
+    def load_kwargs(self, name: str) -> Dict[str, Any]:
+        """Constructor arguments for a model instance"""
+        return {
+            "model_name": name,
+            "model_path": self.settings.MODEL_DIR,
+            "allow_download": False,  # We handle downloads separately
+            "n_threads": self.n_threads(name),
+            "n_ctx": self.context_length(name),
+        }
+
+    def create_instance(self, name: str):
+        """Construct an in-process model (blocking; run in a thread)"""
+        factory = load_factory(self.settings.MODEL_FACTORY)
+        return factory(**self.load_kwargs(name))
+
+    def calibrate(
+        self,
+        name: str,
+        thread_counts: Optional[Sequence[int]] = None,
+        batch_sizes: Optional[Sequence[int]] = None,
+    ) -> Tuning:
+        """Measure thread counts x batch sizes for a model (blocking; takes a while)
+
+        Thread candidates are limited to the CPUs available to each worker
+        process, since every replica runs its own threads.
+        """
+        factory = load_factory(self.settings.MODEL_FACTORY)
+        replicas = max(1, self.settings.WORKER_POOL_SIZE)
+        return calibrate(
+            lambda n_threads: factory(**{**self.load_kwargs(name), "n_threads": n_threads}),
+            thread_counts or thread_candidates(max(1, available_cpus() // replicas)),
+            batch_sizes or self.settings.AUTOTUNE_BATCH_SIZES,
+            self.settings.AUTOTUNE_MAX_TOKENS,
+            model_size=os.path.getsize(self.model_path(name)),
+        )
+
+    async def _autotune(self, name: str):
+        """Use the stored tuning for this host and model, calibrating first if there is none"""
+        if not self.settings.AUTOTUNE or name in self._tunings:
+            return
+        tuning = self._tuning_store.get(name, os.path.getsize(self.model_path(name)))
+        if tuning is None:
+            self.logger.info(f"Calibrating threads and batch size for {name} (AUTOTUNE)...")
+            try:
+                tuning = await asyncio.to_thread(self.calibrate, name)
+                await asyncio.to_thread(self._tuning_store.put, name, tuning)
+            except Exception as e:
+                # Calibration is an optimization; fall back to the configured values
+                self.logger.warning(f"Calibration of {name} failed, using configured threads/n_batch: {str(e)}")
+                return
+            self.logger.info(f"Calibrated {name} in {tuning.calibration_seconds}s")
+        self._tunings[name] = tuning
+        self.logger.info(f"Using n_threads={tuning.n_threads} n_batch={tuning.n_batch} for {name}")
+
+    async def ensure_file(self, name: str):
+        """Ensure the model file exists and is valid"""
+        # Imported here: requests and tqdm are only needed when checking/downloading
+        from src.utils.model_downloader import download_model, load_manifest
+        try:
+            os.makedirs(self.settings.MODEL_DIR, exist_ok=True)
+            self.logger.info(f"Created/verified model directory at {self.settings.MODEL_DIR}")
+
+            model_path = self.model_path(name)
+            self.logger.info(f"Checking for model at {model_path}")
+            url = self.settings.MODEL_URLS.get(name)
+
+            if not os.path.exists(model_path):
+                # Downloads land atomically, so a missing file may still have a resumable .part
+                self.logger.info("Model file not found. Starting download...")
+                with MODEL_DOWNLOAD.labels(name).time():
+                    await asyncio.to_thread(download_model, url=url, dest=model_path)
+                self.logger.info("Model download completed successfully")
+            else:
+                file_size = os.path.getsize(model_path)
+                self.logger.info(f"Found existing model file of size {file_size / _MB:.2f} MB")
+                expected_size = load_manifest(self.settings.MODEL_MANIFEST_PATH, name).get("size")
+                if expected_size and file_size != expected_size:
+                    self.logger.warning(f"Existing model file is {file_size} bytes, manifest expects {expected_size}")
+                    self.logger.info("Redownloading model...")
+                    os.replace(model_path, f"{model_path}.invalid")
+                    with MODEL_DOWNLOAD.labels(name).time():
+                        await asyncio.to_thread(download_model, url=url, dest=model_path)
+                else:
+                    self.logger.info(f"Using existing model at {model_path}")
+        except Exception as e:
+            self.logger.error(f"Error ensuring model file: {str(e)}")
+            raise ModelLoadError(f"Error ensuring model file: {str(e)}")
+
+    def _estimate_memory(self, name: str) -> int:
+        path = self.model_path(name)
+        weights = os.path.getsize(path) if os.path.exists(path) else 0
+        replicas = max(1, self.settings.WORKER_POOL_SIZE)
+        return weights + replicas * self.settings.MODEL_CONTEXT_OVERHEAD_MB * _MB
+
+    def resident_bytes(self) -> int:
+        """Memory of resident models, models being loaded and dedicated instances"""
+        models = sum(loaded.memory_bytes for loaded in self._models.values())
+        return models + self._reserved_bytes + self._instance_bytes
+
+    def instance_bytes(self) -> int:
+        """Memory of one dedicated instance: its context (weights are mmapped and shared)"""
+        return self.settings.MODEL_CONTEXT_OVERHEAD_MB * _MB
+
+    async def _make_room(self, needed: int):
+        """Unload idle, unpinned models (LRU first) until needed bytes fit the budget
+
+        Call with _budget_lock held.
+        """
+        if not self.budget_bytes:
+            return
+        candidates = sorted(
+            (m for m in self._models.values() if not m.pinned and m.active == 0),
+            key=lambda m: m.last_used,
+        )
+        while self.resident_bytes() + needed > self.budget_bytes and candidates:
+            victim = candidates.pop(0)
+            if victim.active or self._models.get(victim.name) is not victim:
+                continue  # taken by a request (or unloaded) while others were being evicted
+            self.logger.info(f"Evicting model {victim.name} to stay within the memory budget")
+            await self.unload(victim.name)
+            self.evictions += 1
+        if self.resident_bytes() + needed > self.budget_bytes and self.resident_bytes():
+            raise ServiceOverloadedError(
+                f"Not enough model memory budget to load another model ({needed // _MB} MB needed)",
+                retry_after=30,
+                status_code=503,
+            )
+
+    async def load(self, name: str) -> LoadedModel:
+        """Load a model (downloading it if needed) unless it is already resident"""
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            loaded = self._models.get(name)
+            if loaded is not None:
+                return loaded
+
+            await self.ensure_file(name)
+            await self._autotune(name)
+            memory = self._estimate_memory(name)
+            async with self._budget_lock:
+                await self._make_room(memory)
+                self._reserved_bytes += memory
+
+            # Only the load itself runs outside the budget lock
+            started = time.perf_counter()
+            try:
+                self.logger.info(f"Loading model {name}...")
+
+                # Enable GPU mode by removing CPU-only restrictions
+                if "CUDA_VISIBLE_DEVICES" in os.environ:
+                    del os.environ["CUDA_VISIBLE_DEVICES"]
+
+                if self.settings.WORKER_POOL_SIZE > 0:
+                    model = ModelWorkerPool(
+                        self.settings.MODEL_FACTORY,
+                        self.load_kwargs(name),
+                        size=self.settings.WORKER_POOL_SIZE,
+                        health_interval=self.settings.WORKER_HEALTH_INTERVAL_SECONDS,
+                        max_requests=self.settings.WORKER_MAX_REQUESTS,
+                        max_rss_mb=self.settings.WORKER_MAX_RSS_MB,
+                    )
+                    await asyncio.to_thread(model.start)
+                    concurrency = model.size
+                    self.logger.info(f"Model {name} loaded in {model.size} worker processes")
+                else:
+                    # Load model in a thread pool to avoid blocking
+                    model = await asyncio.to_thread(self.create_instance, name)
+                    concurrency = self.settings.INFERENCE_CONCURRENCY
+                    self.logger.info(f"Model {name} loaded successfully")
+            except Exception as e:
+                self.load_failures += 1
+                self.logger.error(f"Error loading model: {str(e)}")
+                raise ModelLoadError(f"Failed to load GPT-4ALL model {name}: {str(e)}")
+            finally:
+                # Accounted as a resident model from here on (no await before it is added)
+                self._reserved_bytes -= memory
+
+            # The scheduler owns the model from here on; all inference goes through it
+            scheduler = InferenceScheduler(
+                model,
+                concurrency=concurrency,
+                max_queue=self.settings.INFERENCE_QUEUE_SIZE,
+                name=f"inference-{name}",
+                model_name=name,
+            )
+            scheduler.start()
+            load_seconds = time.perf_counter() - started
+            MODEL_LOAD.labels(name).observe(load_seconds)
+            loaded = LoadedModel(
+                name=name,
+                model=model,
+                scheduler=scheduler,
+                memory_bytes=memory,
+                load_ms=round(load_seconds * 1000, 2),
+                pinned=name in self.settings.PINNED_MODELS,
+            )
+            self._models[name] = loaded
+            self.loads += 1
+            return loaded
+
+    async def open_instance(self, name: str) -> Any:
+        """A dedicated in-process instance of a model, counted against the memory budget
+
+        Release it with close_instance(). The caller should hold the model
+        through use(), so its weights are resident and counted already.
+        """
+        memory = self.instance_bytes()
+        async with self._budget_lock:
+            await self._make_room(memory)
+            self._instance_bytes += memory
+            self.instances += 1
+        try:
+            return await asyncio.to_thread(self.create_instance, name)
+        except BaseException:
+            self.close_instance()
+            raise
+
+    def close_instance(self):
+        """Return the budget of an instance from open_instance()"""
+        self._instance_bytes -= self.instance_bytes()
+        self.instances -= 1
+
+    @asynccontextmanager
+    async def use(self, name: str) -> AsyncIterator[LoadedModel]:
+        """Hold a model for the duration of a request, loading it on demand"""
+        loaded = self._models.get(name) or await self.load(name)
+        loaded.active += 1
+        loaded.last_used = time.monotonic()
+        try:
+            yield loaded
+        finally:
+            loaded.active -= 1
+            loaded.last_used = time.monotonic()
+
+    async def unload(self, name: str):
+        loaded = self._models.pop(name, None)
+        if loaded is None:
+            return
+        await loaded.scheduler.stop()
+        if isinstance(loaded.model, ModelWorkerPool):
+            await asyncio.to_thread(loaded.model.close)
+        self.logger.info(f"Unloaded model {name}")
+
+    async def close(self):
+        for name in list(self._models):
+            await self.unload(name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "resident": [loaded.info() for loaded in self.resident()],
+            "available": self.available,
+            "resident_mb": round(self.resident_bytes() / _MB, 1),
+            "instances": self.instances,
+            "budget_mb": self.settings.MODEL_MEMORY_BUDGET_MB or None,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "load_failures": self.load_failures,
+            "tuning": {
+                name: {"n_threads": tuning.n_threads, "n_batch": tuning.n_batch}
+                for name, tuning in self._tunings.items()
+            } or None,
+        }
@@ -0,0 +1,336 @@
+"""Asynchronous project-generation jobs persisted on disk"""
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import asyncio
+from dataclasses import asdict, dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from src.utils.logger import get_logger
+from src.utils.exceptions import ProjectNotFoundError, ServiceOverloadedError
+from src.services.streaming import EventLog
+from src.services.batch_manager import generate_when_admitted
+from src.services.project_templates import get_template, plan_generated, render_skeleton
+
+_FENCED_BLOCK = re.compile(r"```[^\n]*\n(.*?)```", re.DOTALL)
+
+
+def strip_code_fences(text: str) -> str:
+    """Contents of the first fenced code block, or the text itself if there is none"""
+    match = _FENCED_BLOCK.search(text)
+    content = match.group(1) if match else text
+    return content.strip() + "\n"
+
+
+@dataclass
+class ProjectFile:
+    path: str
+    source: str  # "skeleton" (static template) or "model"
+    instruction: Optional[str] = None
+    status: str = "pending"  # pending, running, done or failed
+    bytes: int = 0
+    duration_ms: Optional[float] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class ProjectJob:
+    id: str
+    name: str
+    description: str
+    template: str
+    files: List[ProjectFile]
+    status: str = "pending"  # pending, running, completed or failed
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ProjectJob":
+        return cls(**{**data, "files": [ProjectFile(**f) for f in data["files"]]})
+
+    def counts(self) -> Dict[str, int]:
+        return {
+            "files_total": len(self.files),
+            "files_done": sum(1 for f in self.files if f.status == "done"),
+            "files_failed": sum(1 for f in self.files if f.status == "failed"),
+            "files_from_skeleton": sum(1 for f in self.files if f.source == "skeleton"),
+        }
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "project_id": self.id,
+            "name": self.name,
+            "template": self.template,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            **self.counts(),
+            "files": [
+                {key: value for key, value in asdict(f).items() if key != "instruction"}
+                for f in self.files
+            ],
+        }
+
+
+class ProjectJobManager:
+    """Plans, generates and persists project jobs
+
+    Each job lives in <root>/<job_id>/: job.json holds the plan and per-file
+    state and is rewritten (atomically) whenever a file finishes, and the
+    project itself is written incrementally under files/. Skeleton files of
+    the template are rendered without the model; the remaining files are
+    generated concurrently, sharing max_parallel_files slots across all
+    jobs. Jobs interrupted by a restart are resumed by resume(), which only
+    generates files that are not done yet. Finished jobs are deleted, on
+    disk too, ttl seconds after they finish or, oldest first, once more than
+    max_jobs are kept.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[..., Awaitable[str]],
+        root: str,
+        max_parallel_files: int,
+        priority: str,
+        max_jobs: int,
+        ttl: float,
+    ):
+        self.generate = generate
+        self.root = root
+        self.priority = priority
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.logger = get_logger(__name__)
+        self._slots = asyncio.Semaphore(max(1, max_parallel_files))
+        self._jobs: Dict[str, ProjectJob] = {}
+        self._logs: Dict[str, EventLog] = {}
+        self._save_locks: Dict[str, asyncio.Lock] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+        self.files_generated = 0
+        self.files_from_skeleton = 0
+        self.resumed = 0
+        self.pruned = 0
+        self._load()
+        self._sweep()
+
+    def _job_dir(self, job_id: str) -> str:
+        return os.path.join(self.root, job_id)
+
+    def output_dir(self, job_id: str) -> str:
+        return os.path.join(self._job_dir(job_id), "files")
+
+    def _load(self):
+        """Read persisted jobs"""
+        if not os.path.isdir(self.root):
+            return
+        for job_id in os.listdir(self.root):
+            manifest = os.path.join(self._job_dir(job_id), "job.json")
+            try:
+                with open(manifest) as f:
+                    job = ProjectJob.from_dict(json.load(f))
+            except (OSError, ValueError, TypeError) as e:
+                self.logger.warning(f"Skipping unreadable project job {job_id}: {str(e)}")
+                continue
+            self._jobs[job.id] = job
+        self.logger.info(f"Loaded {len(self._jobs)} project jobs from {self.root}")
+
+    def submit(self, name: str, description: str, template: str) -> ProjectJob:
+        """Plan a project and start generating it"""
+        get_template(template)  # raises ValidationError for unknown templates
+        self._sweep()
+        if len(self._jobs) >= self.max_jobs:
+            raise ServiceOverloadedError(f"Too many project jobs ({self.max_jobs}) running", retry_after=60)
+        files = [ProjectFile(path, "skeleton") for path, _ in render_skeleton(template, name, description)]
+        files += [ProjectFile(path, "model", instruction) for path, instruction in plan_generated(template, name, description)]
+        job = ProjectJob(id=uuid.uuid4().hex, name=name, description=description, template=template, files=files)
+
+        os.makedirs(self.output_dir(job.id), exist_ok=True)
+        self._write_manifest(job.id, asdict(job))
+        self._jobs[job.id] = job
+        self._start(job)
+        self.logger.info(f"Started project job {job.id} ({template}, {len(files)} files)")
+        return job
+
+    def resume(self):
+        """Restart jobs that were interrupted (e.g. by a server restart)"""
+        for job in self._jobs.values():
+            if job.status in ("pending", "running") and job.id not in self._tasks:
+                self.resumed += 1
+                self.logger.info(f"Resuming project job {job.id}")
+                self._start(job)
+
+    def get(self, job_id: str) -> ProjectJob:
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise ProjectNotFoundError(job_id)
+        return job
+
+    def file_path(self, job_id: str, path: str) -> str:
+        """Location on disk of a finished file of a job"""
+        job = self.get(job_id)
+        if not any(f.path == path and f.status == "done" for f in job.files):
+            raise ProjectNotFoundError(f"{job_id}/{path}")
+        return os.path.join(self.output_dir(job_id), path)
+
+    def events(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Progress events of a job (replayed from the start of the current run)"""
+        job = self.get(job_id)
+        log = self._logs.get(job_id)
+        if log is None:
+            # Finished before this process started: only the final state is known
+            log = EventLog()
+            log.publish({"done": True, "project_id": job.id, "status": job.status, **job.counts()})
+            log.close()
+        return log.follow()
+
+    def _sweep(self):
+        """Delete finished jobs past their retention time, then the oldest beyond max_jobs"""
+        finished = sorted(
+            (job for job in self._jobs.values() if job.status in ("completed", "failed") and job.id not in self._tasks),
+            key=lambda job: job.updated_at,
+        )
+        now = time.time()
+        excess = len(self._jobs) - self.max_jobs + 1  # room for one more
+        for job in finished:
+            if now - job.updated_at <= self.ttl and excess <= 0:
+                break
+            self._delete(job)
+            excess -= 1
+
+    def _delete(self, job: ProjectJob):
+        self._jobs.pop(job.id, None)
+        self._logs.pop(job.id, None)
+        self._save_locks.pop(job.id, None)
+        shutil.rmtree(self._job_dir(job.id), ignore_errors=True)
+        self.pruned += 1
+
+    def _start(self, job: ProjectJob):
+        self._logs[job.id] = EventLog()
+        self._save_locks.setdefault(job.id, asyncio.Lock())
+        task = asyncio.create_task(self._run(job))
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+
+    async def _run(self, job: ProjectJob):
+        log = self._logs[job.id]
+        job.status = "running"
+        log.publish({"event": "started", "project_id": job.id, **job.counts()})
+        try:
+            skeleton = dict(render_skeleton(job.template, job.name, job.description))
+            for file in job.files:
+                if file.source == "skeleton" and not self._is_written(job, file):
+                    await self._write_file(job, file, skeleton[file.path])
+                    file.status = "done"
+                    self.files_from_skeleton += 1
+                    log.publish({"event": "file_done", "path": file.path, "source": "skeleton", "bytes": file.bytes})
+            await self._save(job)
+
+            await asyncio.gather(*(
+                self._generate_file(job, file)
+                for file in job.files
+                if file.source == "model" and not self._is_written(job, file)
+            ))
+            failed = [f.path for f in job.files if f.status == "failed"]
+            job.status = "failed" if failed else "completed"
+            job.error = f"Failed to generate {', '.join(failed)}" if failed else None
+        except asyncio.CancelledError:
+            # Shutting down: the job stays "running" on disk and is resumed on the next start
+            await self._save(job)
+            raise
+        except Exception as e:
+            self.logger.error(f"Project job {job.id} failed: {str(e)}")
+            job.status = "failed"
+            job.error = str(e)
+        await self._save(job)
+        log.publish({"done": True, "project_id": job.id, "status": job.status, "error": job.error, **job.counts()})
+        log.close()
+        self.logger.info(f"Project job {job.id} {job.status}")
+
+    def _is_written(self, job: ProjectJob, file: ProjectFile) -> bool:
+        """Done and still on disk (finished files are not regenerated on resume)"""
+        return file.status == "done" and os.path.exists(os.path.join(self.output_dir(job.id), file.path))
+
+    def _file_prompt(self, job: ProjectJob, file: ProjectFile) -> str:
+        paths = "\n".join(f"- {f.path}" for f in job.files)
+        return (
+            f"Project: {job.name}\n"
+            f"Description: {job.description}\n"
+            f"Template: {get_template(job.template).description}\n"
+            f"Project files:\n{paths}\n\n"
+            f"Write the complete contents of {file.path}. {file.instruction}"
+        )
+
+    async def _generate_file(self, job: ProjectJob, file: ProjectFile):
+        log = self._logs[job.id]
+        async with self._slots:
+            file.status = "running"
+            file.error = None
+            log.publish({"event": "file_started", "path": file.path})
+            started = time.perf_counter()
+            try:
+                code = await generate_when_admitted(self.generate, self._file_prompt(job, file), priority=self.priority)
+                await self._write_file(job, file, strip_code_fences(code))
+            except Exception as e:
+                file.status = "failed"
+                file.error = str(e)
+                self.logger.warning(f"Project job {job.id}: failed to generate {file.path}: {str(e)}")
+                log.publish({"event": "file_failed", "path": file.path, "error": file.error})
+            else:
+                file.status = "done"
+                self.files_generated += 1
+                log.publish({"event": "file_done", "path": file.path, "source": "model", "bytes": file.bytes})
+            finally:
+                file.duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        await self._save(job)
+
+    async def _write_file(self, job: ProjectJob, file: ProjectFile, content: str):
+        root = os.path.realpath(self.output_dir(job.id))
+        path = os.path.realpath(os.path.join(root, file.path))
+        if not path.startswith(root + os.sep):
+            raise ValueError(f"Refusing to write outside the project: {file.path}")
+        await asyncio.to_thread(_atomic_write, path, content)
+        file.bytes = len(content.encode())
+
+    async def _save(self, job: ProjectJob):
+        job.updated_at = time.time()
+        data = asdict(job)  # snapshot on the loop; written in a thread
+        async with self._save_locks[job.id]:
+            await asyncio.to_thread(self._write_manifest, job.id, data)
+
+    def _write_manifest(self, job_id: str, data: Dict[str, Any]):
+        _atomic_write(os.path.join(self._job_dir(job_id), "job.json"), json.dumps(data, indent=2))
+
+    async def close(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        statuses: Dict[str, int] = {}
+        for job in self._jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "jobs": len(self._jobs),
+            "running": len(self._tasks),
+            "by_status": statuses,
+            "files_generated": self.files_generated,
+            "files_from_skeleton": self.files_from_skeleton,
+            "resumed": self.resumed,
+            "pruned": self.pruned,
+        }
+
+
+def _atomic_write(path: str, content: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
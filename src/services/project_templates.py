@@ -0,0 +1,195 @@
+"""Project templates: static skeleton files plus the files the model writes"""
+import re
+import json
+import string
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from src.utils.exceptions import ValidationError
+
+_PYTHON_GITIGNORE = """__pycache__/
+*.py[cod]
+.venv/
+venv/
+.env
+.pytest_cache/
+dist/
+build/
+*.egg-info/
+"""
+
+_NODE_GITIGNORE = """node_modules/
+.env
+coverage/
+dist/
+"""
+
+
+def _toml_string(value: str) -> str:
+    """value as a TOML basic string"""
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+    escaped = re.sub(r"[\x00-\x1f\x7f]", lambda m: f"\\u{ord(m.group()):04x}", escaped)
+    return f'"{escaped}"'
+
+
+def _pyproject(values: Dict[str, str]) -> str:
+    return (
+        "[project]\n"
+        f"name = {_toml_string(values['name'])}\n"
+        'version = "0.1.0"\n'
+        f"description = {_toml_string(values['description'])}\n"
+        'requires-python = ">=3.9"\n'
+        "\n"
+        "[build-system]\n"
+        'requires = ["setuptools>=61"]\n'
+        'build-backend = "setuptools.build_meta"\n'
+    )
+
+
+def _package_json(values: Dict[str, str]) -> str:
+    package = {
+        "name": values["name"],
+        "version": "0.1.0",
+        "description": values["description"],
+        "main": "src/index.js",
+        "scripts": {"start": "node src/index.js", "test": "jest"},
+        "dependencies": {"express": "^4.19.0"},
+        "devDependencies": {"jest": "^29.7.0", "supertest": "^7.0.0"},
+    }
+    return json.dumps(package, indent=2) + "\n"
+
+
+# Static content: text with placeholders, or a function of the values for structured files
+Content = Union[str, Callable[[Dict[str, str]], str]]
+
+
+@dataclass(frozen=True)
+class ProjectTemplate:
+    """skeleton maps paths to static content; generated maps paths to instructions for the model
+
+    Paths, text content and instructions may use {name}, {package} and
+    {description}. Files whose syntax needs escaping (JSON, TOML) are built
+    by a function of the values instead.
+    """
+    name: str
+    description: str
+    skeleton: Dict[str, Content]
+    generated: Dict[str, str]
+
+
+TEMPLATES: Dict[str, ProjectTemplate] = {
+    template.name: template
+    for template in (
+        ProjectTemplate(
+            name="python-fastapi",
+            description="FastAPI web service with pydantic models and pytest tests",
+            skeleton={
+                ".gitignore": _PYTHON_GITIGNORE,
+                "requirements.txt": "fastapi\nuvicorn\npydantic\npytest\nhttpx\n",
+                "README.md": "# {name}\n\n{description}\n\n## Running\n\n```\npip install -r requirements.txt\nuvicorn app.main:app --reload\n```\n\n## Tests\n\n```\npytest\n```\n",
+                "app/__init__.py": "",
+                "tests/__init__.py": "",
+            },
+            generated={
+                "app/main.py": "The FastAPI application entry point. Create `app`, include the router from app/routes.py and add a /health endpoint.",
+                "app/models.py": "Pydantic models for the project's domain objects and request/response bodies.",
+                "app/routes.py": "An APIRouter named `router` with the endpoints this project needs, using the models from app/models.py.",
+                "tests/test_routes.py": "pytest tests for the endpoints using fastapi.testclient.TestClient and the app from app/main.py.",
+            },
+        ),
+        ProjectTemplate(
+            name="python-cli",
+            description="Command-line tool built with argparse",
+            skeleton={
+                ".gitignore": _PYTHON_GITIGNORE,
+                "requirements.txt": "pytest\n",
+                "README.md": "# {name}\n\n{description}\n\n## Usage\n\n```\npython -m {package} --help\n```\n",
+                "{package}/__init__.py": "",
+                "{package}/__main__.py": "from {package}.cli import main\n\nif __name__ == \"__main__\":\n    main()\n",
+                "tests/__init__.py": "",
+            },
+            generated={
+                "{package}/cli.py": "The argparse command-line interface with a `main()` function that parses arguments and calls into {package}/core.py.",
+                "{package}/core.py": "The core logic of the tool as plain functions, independent of the command line.",
+                "tests/test_core.py": "pytest tests for the functions in {package}/core.py.",
+            },
+        ),
+        ProjectTemplate(
+            name="python-library",
+            description="Installable Python package with pytest tests",
+            skeleton={
+                ".gitignore": _PYTHON_GITIGNORE,
+                "README.md": "# {name}\n\n{description}\n\n## Installation\n\n```\npip install .\n```\n",
+                "pyproject.toml": _pyproject,
+                "tests/__init__.py": "",
+            },
+            generated={
+                "{package}/__init__.py": "The package's public API: import and re-export the main functions and classes from {package}/core.py.",
+                "{package}/core.py": "The library's main functions and classes with docstrings.",
+                "tests/test_core.py": "pytest tests for {package}/core.py.",
+            },
+        ),
+        ProjectTemplate(
+            name="node-express",
+            description="Express web service with Jest tests",
+            skeleton={
+                ".gitignore": _NODE_GITIGNORE,
+                "package.json": _package_json,
+                "README.md": "# {name}\n\n{description}\n\n## Running\n\n```\nnpm install\nnpm start\n```\n",
+            },
+            generated={
+                "src/app.js": "Create and export the Express app, mounting the router from src/routes.js.",
+                "src/index.js": "Start the server from src/app.js on process.env.PORT or 3000.",
+                "src/routes.js": "An express.Router with the endpoints this project needs.",
+                "test/routes.test.js": "Jest tests for the endpoints using supertest and the app from src/app.js.",
+            },
+        ),
+    )
+}
+
+
+def package_name(name: str) -> str:
+    """Python package name for a project name ("My App" -> "my_app")"""
+    package = re.sub(r"[^0-9a-zA-Z]+", "_", name).strip("_").lower()
+    if not package or package[0].isdigit():
+        package = f"project_{package}"
+    return package
+
+
+@lru_cache(maxsize=None)
+def _parse(text: str) -> Tuple[Tuple[str, Optional[str]], ...]:
+    """(literal, placeholder) pieces of a template text, parsed once per text"""
+    return tuple((literal, field) for literal, field, _, _ in string.Formatter().parse(text))
+
+
+def _substitute(text: str, values: Dict[str, str]) -> str:
+    return "".join(literal + (values[field] if field is not None else "") for literal, field in _parse(text))
+
+
+def _values(name: str, description: str) -> Dict[str, str]:
+    return {"name": name, "package": package_name(name), "description": description}
+
+
+def render_skeleton(template: str, name: str, description: str) -> List[Tuple[str, str]]:
+    """Static files of a template for a project (no model involved)"""
+    values = _values(name, description)
+    return [
+        (_substitute(path, values), content(values) if callable(content) else _substitute(content, values))
+        for path, content in get_template(template).skeleton.items()
+    ]
+
+
+def plan_generated(template: str, name: str, description: str) -> List[Tuple[str, str]]:
+    """(path, instruction) for each file the model has to write"""
+    values = _values(name, description)
+    return [
+        (_substitute(path, values), _substitute(instruction, values))
+        for path, instruction in get_template(template).generated.items()
+    ]
+
+
+def get_template(template: str) -> ProjectTemplate:
+    if template not in TEMPLATES:
+        raise ValidationError(f"Unknown template: {template} (available: {', '.join(sorted(TEMPLATES))})")
+    return TEMPLATES[template]
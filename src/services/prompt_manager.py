@@ -0,0 +1,219 @@
+"""Prompt templates, token counting and context-window budgeting
+
+Every prompt is rendered through a named template and counted before it
+reaches the model, so a prompt that cannot fit the model's context window
+is rejected (or cut down) up front instead of spending a long prompt
+evaluation and then losing context inside the backend. Templates are
+split around their {prompt} placeholder once, and the token counts of
+their fixed parts are memoized like any other text, so only the user's
+text is counted per request.
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Dict, Protocol
+
+from src.utils.logger import get_logger
+from src.utils.exceptions import PromptTooLongError, ValidationError
+
+OVERFLOW_STRATEGIES = ("reject", "truncate_start", "truncate_middle")
+
+# Inserted where truncate_middle removed text
+TRUNCATION_MARKER = "\n...\n"
+
+# Words (with their leading whitespace), single symbols, and trailing whitespace
+_PIECE_RE = re.compile(r"\s*\w+|\s*[^\w\s]|\s+")
+
+
+class Tokenizer(Protocol):
+    """Anything that counts the tokens of a text"""
+
+    def count(self, text: str) -> int:
+        ...
+
+
+class EstimatingTokenizer:
+    """Offline approximation of a BPE tokenizer (no vocabulary needed)
+
+    Counts a token per symbol and per newline, one more for indentation,
+    and a token per four characters of each word. That matches LLaMA-style
+    vocabularies on code within a few percent and errs on the high side.
+    """
+
+    def count(self, text: str) -> int:
+        tokens = 0
+        for piece in _PIECE_RE.findall(text):
+            word = piece.lstrip()
+            leading = piece[:len(piece) - len(word)]
+            newlines = leading.count("\n")
+            indent = len(leading.rsplit("\n", 1)[-1])
+            tokens += newlines + (indent > 1) + (len(word) + 3) // 4
+        return tokens
+
+
+class HuggingFaceTokenizer:
+    """Exact counts from a tokenizer.json (requires the tokenizers package)"""
+
+    def __init__(self, path: str):
+        from tokenizers import Tokenizer as _Tokenizer
+        self._tokenizer = _Tokenizer.from_file(path)
+
+    def count(self, text: str) -> int:
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def create_tokenizer(spec: str) -> Tokenizer:
+    """"estimate", or the path of a Hugging Face tokenizer.json"""
+    if spec == "estimate":
+        return EstimatingTokenizer()
+    try:
+        return HuggingFaceTokenizer(spec)
+    except Exception as e:
+        get_logger(__name__).warning(f"Could not load tokenizer {spec} ({str(e)}); estimating token counts instead")
+        return EstimatingTokenizer()
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """Text around the user's prompt, split once at the {prompt} placeholder"""
+    name: str
+    description: str
+    prefix: str
+    suffix: str
+
+    @classmethod
+    def compile(cls, name: str, description: str, source: str) -> "PromptTemplate":
+        prefix, placeholder, suffix = source.partition("{prompt}")
+        if not placeholder:
+            raise ValueError(f"Template {name} has no {{prompt}} placeholder")
+        return cls(name, description, prefix, suffix)
+
+    def render(self, prompt: str) -> str:
+        # Concatenation, not str.format: braces in prompts are left alone
+        return f"{self.prefix}{prompt}{self.suffix}"
+
+
+TEMPLATES: Dict[str, PromptTemplate] = {
+    template.name: template
+    for template in (
+        PromptTemplate.compile(
+            "code",
+            "Write code for a request, returning only code",
+            "Write code for the following request:\n{prompt}\n\nReturn only the code without explanations:\n",
+        ),
+        PromptTemplate.compile(
+            "complete",
+            "Continue the given code",
+            "Complete the following code. Return only the completed code:\n{prompt}",
+        ),
+        PromptTemplate.compile(
+            "tests",
+            "Write unit tests for the given code",
+            "Write unit tests for the following code:\n{prompt}\n\nReturn only the test code without explanations:\n",
+        ),
+        PromptTemplate.compile("raw", "The prompt exactly as sent", "{prompt}"),
+    )
+}
+
+
+def get_template(name: str) -> PromptTemplate:
+    if name not in TEMPLATES:
+        raise ValidationError(f"Unknown prompt template: {name} (available: {', '.join(sorted(TEMPLATES))})")
+    return TEMPLATES[name]
+
+
+@dataclass
+class PreparedPrompt:
+    text: str  # what the model is given
+    prompt_tokens: int
+    max_tokens: int  # possibly lowered to fit the context window
+    truncated_tokens: int = 0  # removed from the user's prompt by a truncation strategy
+
+
+class PromptManager:
+    """Renders prompts and fits them, plus max_tokens, into a context window
+
+    When prompt + max_tokens exceeds the window, max_tokens is lowered to
+    what is left, down to min_output_tokens. If even that does not fit,
+    the overflow strategy applies: "reject" raises PromptTooLongError (413),
+    "truncate_start" drops the beginning of the user's prompt and
+    "truncate_middle" its middle, keeping the template intact.
+    """
+
+    def __init__(self, tokenizer: Tokenizer, overflow: str, min_output_tokens: int, cache_size: int):
+        if overflow not in OVERFLOW_STRATEGIES:
+            raise ValueError(f"Unknown context overflow strategy {overflow!r} (use one of {', '.join(OVERFLOW_STRATEGIES)})")
+        self.tokenizer = tokenizer
+        self.overflow = overflow
+        self.min_output_tokens = min_output_tokens
+        self._count: Callable[[str], int] = lru_cache(maxsize=cache_size)(tokenizer.count)
+
+        self.prepared = 0
+        self.clamped = 0  # requests whose max_tokens was lowered
+        self.truncated = 0
+        self.rejected = 0
+
+    def count(self, text: str) -> int:
+        """Token count of text (memoized)"""
+        return self._count(text)
+
+    def prepare(self, prompt: str, template: str, max_tokens: int, context_length: int) -> PreparedPrompt:
+        compiled = get_template(template)
+        overhead = self.count(compiled.prefix) + self.count(compiled.suffix)
+        prompt_tokens = overhead + self.count(prompt)
+        self.prepared += 1
+
+        if prompt_tokens + max_tokens <= context_length:
+            return PreparedPrompt(compiled.render(prompt), prompt_tokens, max_tokens)
+
+        output_tokens = min(max_tokens, self.min_output_tokens)
+        if prompt_tokens + output_tokens <= context_length:
+            self.clamped += 1
+            return PreparedPrompt(compiled.render(prompt), prompt_tokens, context_length - prompt_tokens)
+
+        budget = context_length - output_tokens - overhead
+        if self.overflow == "reject" or budget <= 0:
+            self.rejected += 1
+            raise PromptTooLongError(prompt_tokens, output_tokens, context_length)
+
+        kept = self._truncate(prompt, budget)
+        self.truncated += 1
+        kept_tokens = overhead + self.count(kept)
+        return PreparedPrompt(
+            compiled.render(kept),
+            kept_tokens,
+            context_length - kept_tokens,
+            truncated_tokens=prompt_tokens - kept_tokens,
+        )
+
+    def _truncate(self, prompt: str, budget: int) -> str:
+        """Longest cut of prompt (per the overflow strategy) within budget tokens"""
+        def cut(chars: int) -> str:
+            if self.overflow == "truncate_start":
+                return prompt[len(prompt) - chars:]
+            head = chars // 2
+            return prompt[:head] + TRUNCATION_MARKER + prompt[len(prompt) - (chars - head):]
+
+        # Token counts grow with the characters kept: binary search the cut
+        low, high = 0, len(prompt)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.tokenizer.count(cut(middle)) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        return cut(low)
+
+    def stats(self) -> Dict[str, Any]:
+        cache = self._count.cache_info()
+        lookups = cache.hits + cache.misses
+        return {
+            "tokenizer": type(self.tokenizer).__name__,
+            "overflow": self.overflow,
+            "prepared": self.prepared,
+            "max_tokens_clamped": self.clamped,
+            "truncated": self.truncated,
+            "rejected": self.rejected,
+            "token_cache_entries": cache.currsize,
+            "token_cache_hit_ratio": round(cache.hits / lookups, 4) if lookups else 0.0,
+        }
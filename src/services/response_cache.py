@@ -0,0 +1,226 @@
+"""Two-tier cache for generated responses (in-memory LRU + SQLite on disk)"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from src.utils.logger import get_logger
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize a prompt for cache lookups (trim and collapse whitespace)"""
+    return " ".join(prompt.split())
+
+
+def make_cache_key(prompt: str, params: Dict[str, Any]) -> str:
+    """Build a cache key from the normalized prompt and generation parameters"""
+    payload = json.dumps(
+        {"prompt": normalize_prompt(prompt), "params": params},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """Persistent cache tier stored in a SQLite database"""
+
+    # Prune expired/overflow rows every N writes instead of on every insert
+    PRUNE_INTERVAL = 256
+
+    def __init__(self, path: str, max_entries: int, ttl_seconds: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.logger = get_logger(__name__)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self.evictions = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)"
+            )
+            conn.commit()
+            self._conn = conn
+            self.logger.info(f"Opened response cache database at {self.path}")
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached value or None if missing or expired"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key: str, value: str):
+        """Insert or replace a cached value"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, now, now + self.ttl_seconds),
+            )
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= self.PRUNE_INTERVAL:
+                self._prune(conn, now)
+            conn.commit()
+
+    def delete(self, key: str):
+        """Remove a cached value"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            conn.commit()
+
+    def _prune(self, conn: sqlite3.Connection, now: float):
+        """Drop expired rows and the oldest rows beyond max_entries (lock held)"""
+        self._writes_since_prune = 0
+        removed = conn.execute(
+            "DELETE FROM responses WHERE expires_at < ?", (now,)
+        ).rowcount
+        (count,) = conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            removed += conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY created_at LIMIT ?)",
+                (overflow,),
+            ).rowcount
+        self.evictions += removed
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class ResponseCache:
+    """Bounded in-memory LRU with TTL, optionally backed by a DiskCache"""
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        disk: Optional[DiskCache] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk = disk
+        self.logger = get_logger(__name__)
+        # key -> (value, expires_at); only touched from the event loop
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.writes = 0
+        self.disk_errors = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """Look up a key in the memory tier only"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: str):
+        """Store a value in the memory tier, evicting the least recently used entry"""
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def lookup(self, key: str) -> Optional[str]:
+        """Look up a key in memory, then on disk (promoting disk hits to memory)"""
+        value = self.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+
+        if self.disk is not None:
+            try:
+                value = await asyncio.to_thread(self.disk.get, key)
+            except Exception as e:
+                self.disk_errors += 1
+                self.logger.warning(f"Response cache disk lookup failed: {str(e)}")
+                value = None
+            if value is not None:
+                self.disk_hits += 1
+                self.put(key, value)
+                return value
+
+        self.misses += 1
+        return None
+
+    async def store(self, key: str, value: str):
+        """Store a value in both tiers"""
+        self.put(key, value)
+        self.writes += 1
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.set, key, value)
+            except Exception as e:
+                self.disk_errors += 1
+                self.logger.warning(f"Response cache disk write failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters"""
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "writes": self.writes,
+            "disk_enabled": self.disk is not None,
+            "disk_evictions": self.disk.evictions if self.disk is not None else 0,
+            "disk_errors": self.disk_errors,
+        }
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
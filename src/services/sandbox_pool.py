@@ -0,0 +1,288 @@
+"""Pool of prewarmed sandbox processes for executing generated code
+
+Starting an interpreter per execution costs hundreds of milliseconds, so
+the pool keeps size worker processes (sandbox_worker.py) started, each in
+its own namespaces and filesystem root, with the preload modules imported.
+A run takes an idle worker, which forks an unprivileged child under the
+CPU/memory/file rlimits and the wall clock limit. Workers are replaced after
+max_runs runs, after any run that hit a limit, and whenever one stops
+responding; replacements start in the background so the next run does not
+wait for them. If the workers cannot isolate themselves on this host the
+pool does not start and every execution fails with SandboxUnavailableError.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from src.utils.logger import get_logger
+from src.utils.exceptions import SandboxUnavailableError, ServiceOverloadedError
+from src.utils import metrics
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+
+
+@dataclass
+class ExecutionResult:
+    exit_code: int
+    stdout: str
+    stderr: str
+    limit: Optional[str]  # "cpu", "memory" or "timeout" when the run was stopped by a limit
+    truncated: bool
+    duration_ms: float
+    cpu_ms: float
+    queue_ms: float
+
+
+class WorkerFailedError(Exception):
+    pass
+
+
+class _SandboxWorker:
+    """Parent-side handle for one sandbox process"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.pid: Optional[int] = None
+        self.isolation: Optional[str] = None
+        self.uid: Optional[int] = None
+        self.runs = 0
+
+    async def start(self, config: Dict[str, Any], timeout: float, stream_limit: int):
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, "-I", WORKER_SCRIPT, json.dumps(config),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            cwd=config["workdir"],
+            env={"PATH": os.defpath, "LANG": "C.UTF-8", "HOME": config["workdir"]},
+            limit=stream_limit,
+        )
+        try:
+            ready = json.loads(await asyncio.wait_for(self.process.stdout.readline(), timeout))
+        except (asyncio.TimeoutError, ValueError) as e:
+            await self.kill()
+            raise WorkerFailedError(f"Sandbox worker {self.index} did not start: {e!r}")
+        if "error" in ready:
+            await self.kill()
+            raise SandboxUnavailableError(ready["error"])
+        self.pid, self.isolation, self.uid = ready["ready"], ready["isolation"], ready["uid"]
+
+    async def run(self, job: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        try:
+            self.process.stdin.write((json.dumps(job) + "\n").encode())
+            await self.process.stdin.drain()
+            line = await asyncio.wait_for(self.process.stdout.readline(), timeout)
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            raise WorkerFailedError(f"Sandbox worker {self.index} stopped responding: {e!r}")
+        if not line:
+            raise WorkerFailedError(f"Sandbox worker {self.index} exited (code {self.process.returncode})")
+        self.runs += 1
+        result = json.loads(line)
+        if "error" in result:
+            raise WorkerFailedError(f"Sandbox worker {self.index} failed: {result['error']}")
+        return result
+
+    async def kill(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.kill()
+            await self.process.wait()
+
+
+class SandboxPool:
+    """Prewarmed sandbox workers with a bounded wait queue"""
+
+    def __init__(
+        self,
+        size: int,
+        max_runs: int,
+        queue_size: int,
+        cpu_seconds: float,
+        memory_mb: int,
+        wall_seconds: float,
+        max_file_mb: int,
+        max_output_bytes: int,
+        preload: List[str],
+        workdir: Optional[str] = None,
+        scratch_mb: int = 64,
+        uid: int = 65534,
+        gid: int = 65534,
+        start_timeout: float = 30.0,
+    ):
+        self.size = max(1, size)
+        self.max_runs = max_runs
+        self.queue_size = queue_size
+        self.wall_seconds = wall_seconds
+        self.start_timeout = start_timeout
+        self.workdir = workdir or os.path.join(tempfile.gettempdir(), "cachecow-sandbox")
+        self.config = {
+            "cpu_seconds": cpu_seconds,
+            "memory_mb": memory_mb,
+            "wall_seconds": wall_seconds,
+            "max_file_mb": max_file_mb,
+            "max_output_bytes": max_output_bytes,
+            "preload": preload,
+            "workdir": self.workdir,
+            "scratch_mb": scratch_mb,
+            "uid": uid,
+            "gid": gid,
+        }
+        # A result line holds both outputs, JSON-escaped (up to 6 bytes per byte)
+        self._stream_limit = 2 ** 16 + 12 * max_output_bytes
+        self.logger = get_logger(__name__)
+
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: set = set()
+        self._start_lock = asyncio.Lock()
+        self._replacements: set = set()
+        self._busy = 0
+        self._waiting = 0
+        self._next_index = 0
+        self._closed = False
+
+        self.runs = 0
+        self.reused = 0  # runs on a worker that had already served a run
+        self.rejected = 0
+        self.workers_started = 0
+        self.start_ms_total = 0.0
+        self.recycled: Dict[str, int] = {}
+        self.isolation: Optional[str] = None
+        self.uid: Optional[int] = None
+        self.unavailable: Optional[str] = None  # why the sandbox cannot run code on this host
+
+    async def start(self):
+        """Start the workers (idempotent; runs wait for it)"""
+        async with self._start_lock:
+            if self._idle is not None:
+                return
+            if self.unavailable is not None:
+                raise SandboxUnavailableError(self.unavailable)
+            os.makedirs(self.workdir, exist_ok=True)
+            idle: asyncio.Queue = asyncio.Queue()
+            workers = await asyncio.gather(*(self._spawn() for _ in range(self.size)), return_exceptions=True)
+            errors = [w for w in workers if isinstance(w, BaseException)]
+            if errors:
+                for worker in list(self._workers):
+                    await worker.kill()
+                self._workers.clear()
+                if isinstance(errors[0], SandboxUnavailableError):
+                    # A property of the host, not a transient failure: stop trying
+                    self.unavailable = f"Code execution is disabled: {errors[0].message}"
+                    raise SandboxUnavailableError(self.unavailable)
+                raise errors[0]
+            for worker in workers:
+                idle.put_nowait(worker)
+            self._idle = idle
+            self.logger.info(f"Started {self.size} sandbox workers (isolation: {self.isolation}, uid {self.uid})")
+
+    async def _spawn(self) -> _SandboxWorker:
+        worker = _SandboxWorker(self._next_index)
+        self._next_index += 1
+        started = time.perf_counter()
+        await worker.start(self.config, self.start_timeout, self._stream_limit)
+        self._workers.add(worker)
+        self.workers_started += 1
+        self.start_ms_total += (time.perf_counter() - started) * 1000
+        self.isolation, self.uid = worker.isolation, worker.uid
+        return worker
+
+    def _recycle(self, worker: _SandboxWorker, reason: str):
+        """Kill worker and start a replacement in the background"""
+        self.recycled[reason] = self.recycled.get(reason, 0) + 1
+        metrics.SANDBOX_RECYCLES.labels(reason).inc()
+        task = asyncio.create_task(self._replace(worker))
+        self._replacements.add(task)
+        task.add_done_callback(self._replacements.discard)
+
+    async def _replace(self, worker: _SandboxWorker):
+        self._workers.discard(worker)
+        await worker.kill()
+        delay = 0.5
+        while not self._closed:
+            try:
+                self._idle.put_nowait(await self._spawn())
+                return
+            except Exception as e:
+                self.logger.error(f"Failed to start sandbox worker, retrying in {delay}s: {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    async def execute(self, code: str, stdin: str = "", timeout: Optional[float] = None) -> ExecutionResult:
+        """Run code on an idle worker, waiting for one if all are busy"""
+        if self._waiting >= self.queue_size:
+            self.rejected += 1
+            metrics.SANDBOX_RUNS.labels("rejected").inc()
+            raise ServiceOverloadedError(f"Sandbox queue is full ({self.queue_size} waiting)", retry_after=1)
+        await self.start()
+
+        queued_at = time.perf_counter()
+        self._waiting += 1
+        try:
+            worker = await self._idle.get()
+        finally:
+            self._waiting -= 1
+        queue_seconds = time.perf_counter() - queued_at
+        metrics.SANDBOX_QUEUE_WAIT.observe(queue_seconds)
+
+        timeout = min(timeout or self.wall_seconds, self.wall_seconds)
+        reused = worker.runs > 0
+        self._busy += 1
+        try:
+            # The worker enforces the limit; this only catches a hung worker
+            result = await worker.run({"code": code, "stdin": stdin, "timeout": timeout}, timeout + 5.0)
+        except WorkerFailedError as e:
+            self.logger.warning(str(e))
+            self._recycle(worker, "failed")
+            metrics.SANDBOX_RUNS.labels("failed").inc()
+            raise
+        except asyncio.CancelledError:
+            # Abandoned mid-run: the worker's state is unknown, replace it
+            self._recycle(worker, "cancelled")
+            raise
+        finally:
+            self._busy -= 1
+
+        self.runs += 1
+        self.reused += reused
+        if result["limit"]:
+            self._recycle(worker, result["limit"])
+        elif self.max_runs and worker.runs >= self.max_runs:
+            self._recycle(worker, "max_runs")
+        else:
+            self._idle.put_nowait(worker)
+        metrics.SANDBOX_RUNS.labels(result["limit"] or ("success" if result["exit_code"] == 0 else "error")).inc()
+        metrics.SANDBOX_RUN_SECONDS.observe(result["duration_ms"] / 1000)
+        return ExecutionResult(**result, queue_ms=round(queue_seconds * 1000, 2))
+
+    async def close(self):
+        """Stop replacing workers and kill every worker"""
+        self._closed = True
+        for task in list(self._replacements):
+            task.cancel()
+        for worker in list(self._workers):
+            await worker.kill()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "started": self._idle is not None,
+            "size": self.size,
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "busy": self._busy,
+            "waiting": self._waiting,
+            "queue_size": self.queue_size,
+            "runs": self.runs,
+            "reused": self.reused,
+            "reuse_ratio": round(self.reused / self.runs, 4) if self.runs else 0.0,
+            "rejected": self.rejected,
+            "workers_started": self.workers_started,
+            "avg_worker_start_ms": round(self.start_ms_total / self.workers_started, 2) if self.workers_started else None,
+            "recycled": dict(self.recycled),
+            "isolation": self.isolation,
+            "uid": self.uid,
+            "unavailable": self.unavailable,
+            "limits": {key: self.config[key] for key in ("cpu_seconds", "memory_mb", "wall_seconds", "max_file_mb", "max_output_bytes")},
+        }
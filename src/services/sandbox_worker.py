@@ -0,0 +1,367 @@
+"""Sandbox worker process: runs untrusted code isolated and under resource limits
+
+Started by SandboxPool as "python -I sandbox_worker.py <config json>"; it
+uses only the standard library and never imports the application. On start
+the worker moves into new mount and network namespaces (and a user namespace
+when it is not root) and pivots into a root of its own: a read-only tmpfs
+holding read-only bind mounts of the system and Python directories, a few
+/dev nodes and a small private /tmp. Nothing else of the host filesystem is
+visible and the network namespace has no interfaces besides a down
+loopback. If any of this fails the worker reports an error instead of
+becoming ready, and the pool refuses to run code.
+
+The worker then imports the preload modules and forks for every run: the
+child enters a fresh PID namespace, drops its privileges (to the configured
+uid when started as root, otherwise by shedding every capability it holds in
+the user namespace) and runs the code in a process below the namespace's
+init, so a run cannot signal or outlive anything outside its own run. Each
+run gets the rlimits, a private 0700 scratch directory and captured
+stdin/stdout/stderr; the worker enforces the wall-clock limit and reports
+the outcome.
+
+Protocol (one JSON object per line):
+  pool -> worker (stdin):  {"code": str, "stdin": str, "timeout": float}
+  worker -> pool (stdout): {"ready": pid, "isolation": str, "uid": int} or {"error": str} once, then per run
+                           {"exit_code", "stdout", "stderr", "limit", "truncated", "duration_ms", "cpu_ms"}
+"""
+import os
+import sys
+import json
+import time
+import ctypes
+import select
+import signal
+import shutil
+import resource
+import tempfile
+import importlib
+import traceback
+
+CLONE_NEWNS = 0x00020000
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWPID = 0x20000000
+CLONE_NEWNET = 0x40000000
+
+MS_RDONLY = 0x1
+MS_NOSUID = 0x2
+MS_NODEV = 0x4
+MS_NOEXEC = 0x8
+MS_REMOUNT = 0x20
+MS_NOATIME = 0x400
+MS_NODIRATIME = 0x800
+MS_BIND = 0x1000
+MS_REC = 0x4000
+MS_PRIVATE = 0x40000
+MS_RELATIME = 0x200000
+MNT_DETACH = 0x2
+
+PR_CAPBSET_DROP = 24
+PR_SET_SECUREBITS = 28
+PR_SET_NO_NEW_PRIVS = 38
+# SECBIT_NOROOT, SECBIT_NO_SETUID_FIXUP and SECBIT_KEEP_CAPS_LOCKED, each locked
+SECUREBITS_NO_PRIVILEGES = 0x2F
+LINUX_CAPABILITY_VERSION_3 = 0x20080522
+
+SYS_PIVOT_ROOT = {"x86_64": 155, "aarch64": 41, "riscv64": 41, "ppc64le": 203, "s390x": 217}
+
+# Host paths bind-mounted read-only into the sandbox root (plus Python's prefixes)
+SYSTEM_PATHS = ("/usr", "/bin", "/sbin", "/lib", "/lib32", "/lib64", "/libx32")
+DEVICES = ("null", "zero", "random", "urandom")
+
+# Exit status a child uses to report that it ran out of memory (MemoryError)
+MEMORY_EXIT = 86
+
+_libc = ctypes.CDLL(None, use_errno=True)
+_userns = False  # privileges are dropped by shedding capabilities rather than switching uid
+_cap_last = 40
+
+
+def _check(result: int, what: str):
+    if result != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, f"{what}: {os.strerror(errno)}")
+
+
+def _mount(source, target, fstype, flags: int, data=None):
+    encode = lambda value: value.encode() if value is not None else None
+    _check(_libc.mount(encode(source), encode(target), encode(fstype), ctypes.c_ulong(flags), encode(data)), f"mount {target}")
+
+
+def _bind_readonly(source: str, target: str):
+    _mount(source, target, None, MS_BIND)
+    # Keep the flags the host mount already has: a user namespace may not clear them
+    host = os.statvfs(source).f_flag
+    kept = host & (MS_NOEXEC | MS_NOATIME | MS_NODIRATIME) | (MS_RELATIME if host & os.ST_RELATIME else 0)
+    _mount(None, target, None, MS_BIND | MS_REMOUNT | MS_RDONLY | MS_NOSUID | MS_NODEV | kept)
+
+
+def _write(path: str, text: str):
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def _isolate(root: str, scratch_mb: int) -> str:
+    """Enter new namespaces and pivot into a minimal read-only root; raises OSError if the host does not allow it"""
+    global _userns, _cap_last
+    uid, gid = os.getuid(), os.getgid()
+    _userns = uid != 0
+    _check(_libc.unshare(CLONE_NEWNS | CLONE_NEWNET | (CLONE_NEWUSER if _userns else 0)), "unshare")
+    if _userns:
+        _write("/proc/self/setgroups", "deny")
+        _write("/proc/self/uid_map", f"0 {uid} 1")
+        _write("/proc/self/gid_map", f"0 {gid} 1")
+    with open("/proc/sys/kernel/cap_last_cap") as f:
+        _cap_last = int(f.read())
+    machine = os.uname().machine
+    if machine not in SYS_PIVOT_ROOT:
+        raise OSError(f"pivot_root is not supported on {machine}")
+
+    _mount(None, "/", None, MS_REC | MS_PRIVATE)  # nothing mounted here propagates to the host
+    _mount("sandbox", root, "tmpfs", MS_NOSUID | MS_NODEV, "mode=0755,size=1m")
+    prefixes = {sys.prefix, sys.base_prefix, sys.exec_prefix, sys.base_exec_prefix}
+    bound = []
+    for path in sorted({os.path.abspath(p) for p in (*SYSTEM_PATHS, *prefixes)}, key=len):
+        if not os.path.lexists(path) or any(path.startswith(b + "/") for b in bound):
+            continue
+        target = root + path
+        os.makedirs(os.path.dirname(target), mode=0o755, exist_ok=True)
+        if os.path.islink(path):
+            os.symlink(os.readlink(path), target)  # e.g. /bin -> usr/bin on merged-/usr systems
+            continue
+        os.makedirs(target, mode=0o755, exist_ok=True)
+        _bind_readonly(os.path.realpath(path), target)
+        bound.append(path)
+    os.mkdir(root + "/dev", 0o755)
+    for name in DEVICES:
+        open(f"{root}/dev/{name}", "w").close()
+        _mount(f"/dev/{name}", f"{root}/dev/{name}", None, MS_BIND)
+    os.mkdir(root + "/tmp")
+    _mount("sandbox-tmp", root + "/tmp", "tmpfs", MS_NOSUID | MS_NODEV, f"mode=0711,size={scratch_mb}m")
+
+    os.chdir(root)
+    _check(_libc.syscall(SYS_PIVOT_ROOT[machine], b".", b"."), "pivot_root")
+    _check(_libc.umount2(b".", MNT_DETACH), "umount old root")
+    os.chdir("/")
+    _mount(None, "/", None, MS_REMOUNT | MS_RDONLY | MS_NOSUID | MS_NODEV)
+    return "user, mount, network and pid namespaces" if _userns else "mount, network and pid namespaces"
+
+
+def _drop_privileges(uid: int, gid: int):
+    if _userns:
+        # Root in the user namespace is already the unprivileged user running the service;
+        # take away the capabilities it holds there, for this process and anything it executes
+        _check(_libc.prctl(PR_SET_SECUREBITS, SECUREBITS_NO_PRIVILEGES, 0, 0, 0), "prctl securebits")
+        for cap in range(_cap_last + 1):
+            _check(_libc.prctl(PR_CAPBSET_DROP, cap, 0, 0, 0), "prctl capbset")
+        header = (ctypes.c_uint32 * 2)(LINUX_CAPABILITY_VERSION_3, 0)
+        _check(_libc.capset(header, (ctypes.c_uint32 * 6)()), "capset")
+    else:
+        os.setgroups([])
+        os.setresgid(gid, gid, gid)
+        os.setresuid(uid, uid, uid)  # leaving uid 0 clears every capability
+    _check(_libc.prctl(PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0), "prctl no_new_privs")
+
+
+def _set_limits(limits: dict, timeout: float):
+    cpu = max(1, int(min(limits["cpu_seconds"], timeout) + 0.999))
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))  # SIGXCPU, then SIGKILL a second later
+    if limits["memory_mb"]:
+        memory = limits["memory_mb"] * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    # Python ignores SIGXFSZ, so oversized writes fail with OSError (EFBIG) instead
+    file_size = limits["max_file_mb"] * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_FSIZE, (file_size, file_size))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (64, 64))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+def _execute(job: dict):
+    """Run the user's code; returns its exit status"""
+    sys.stdin = open(0, "r", closefd=False)
+    sys.stdout = open(1, "w", closefd=False)
+    sys.stderr = open(2, "w", closefd=False)
+    try:
+        exec(compile(job["code"], "<workflow>", "exec"), {"__name__": "__main__", "__builtins__": __builtins__})
+        exit_code = 0
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        if not isinstance(e.code, (int, type(None))):
+            print(e.code, file=sys.stderr)
+    except MemoryError:
+        exit_code = MEMORY_EXIT
+        print("MemoryError: memory limit exceeded", file=sys.stderr)
+    except BaseException as e:
+        # Skip this frame: the traceback starts in the user's code
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        exit_code = 1
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return exit_code
+
+
+def _child(job: dict, limits: dict, files, workdir: str, status_fd: int):
+    """Run one job in the forked child; never returns
+
+    The child makes a new PID namespace whose init waits for the process
+    running the code, writes its wait status to status_fd and exits, which
+    kills whatever the run left behind.
+    """
+    exit_code = 1
+    try:
+        os.setpgid(0, 0)  # the worker kills the whole group on timeout
+        for target, f in enumerate(files):
+            os.dup2(f.fileno(), target)
+        os.dup2(status_fd, 3)
+        os.closerange(4, resource.getrlimit(resource.RLIMIT_NOFILE)[0])  # protocol pipes included
+        os.chdir(workdir)
+        os.environ.update(HOME=workdir, TMPDIR=workdir)
+        _set_limits(limits, job["timeout"])
+        _check(_libc.unshare(CLONE_NEWPID), "unshare pid namespace")
+        _drop_privileges(limits["uid"], limits["gid"])
+
+        init = os.fork()
+        if init == 0:
+            runner = os.fork()
+            if runner == 0:
+                os.close(3)
+                os._exit(_execute(job) & 0xFF)
+            _, status = os.waitpid(runner, 0)
+            os.write(3, str(status).encode())
+            os._exit(0)
+        os.waitpid(init, 0)
+        exit_code = 0
+    except BaseException:
+        try:
+            traceback.print_exc()
+        except BaseException:
+            pass
+    os._exit(exit_code)
+
+
+def _wait(pid: int, timeout: float):
+    """Wait for the child up to timeout; returns (status, rusage, timed_out)"""
+    timed_out = False
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        pidfd = None
+    if pidfd is not None:
+        try:
+            ready, _, _ = select.select([pidfd], [], [], timeout)
+            timed_out = not ready
+        finally:
+            os.close(pidfd)
+    else:
+        deadline = time.monotonic() + timeout
+        while os.waitid(os.P_PID, pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is None:
+            if time.monotonic() >= deadline:
+                timed_out = True
+                break
+            time.sleep(0.005)
+    if timed_out:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    _, status, rusage = os.wait4(pid, 0)
+    return status, rusage, timed_out
+
+
+def _read(f, limit: int):
+    f.seek(0)
+    data = f.read(limit + 1)
+    return data[:limit].decode("utf-8", errors="replace"), len(data) > limit
+
+
+def run(job: dict, limits: dict) -> dict:
+    """Fork a child for job, wait for it and collect its output"""
+    timeout = min(job.get("timeout") or limits["wall_seconds"], limits["wall_seconds"])
+    job["timeout"] = timeout
+    workdir = tempfile.mkdtemp(prefix="run-", dir="/tmp")
+    if not _userns:
+        os.chown(workdir, limits["uid"], limits["gid"])
+    files = [open(os.memfd_create(name), "w+b") for name in ("stdin", "stdout", "stderr")]
+    status_r, status_w = os.pipe()
+    try:
+        files[0].write(job.get("stdin", "").encode())
+        files[0].flush()
+        files[0].seek(0)
+        started = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            _child(job, limits, files, workdir, status_w)
+        os.close(status_w)
+        status_w = None
+        _, rusage, timed_out = _wait(pid, timeout)
+        duration = time.perf_counter() - started
+        reported = os.read(status_r, 32)
+        if not reported and not timed_out:
+            error, _ = _read(files[2], limits["max_output_bytes"])
+            raise RuntimeError(f"Run did not start: {error.strip() or 'no status reported'}")
+
+        limit = None
+        exit_code = os.waitstatus_to_exitcode(int(reported)) if reported else -signal.SIGKILL
+        if timed_out:
+            limit = "timeout"
+        elif exit_code in (-signal.SIGXCPU, -signal.SIGKILL):
+            limit = "cpu"
+        elif exit_code == MEMORY_EXIT:
+            limit, exit_code = "memory", 1
+
+        stdout, stdout_truncated = _read(files[1], limits["max_output_bytes"])
+        stderr, stderr_truncated = _read(files[2], limits["max_output_bytes"])
+        return {
+            "exit_code": exit_code,
+            "stdout": stdout,
+            "stderr": stderr,
+            "limit": limit,
+            "truncated": stdout_truncated or stderr_truncated,
+            "duration_ms": round(duration * 1000, 2),
+            "cpu_ms": round((rusage.ru_utime + rusage.ru_stime) * 1000, 2),
+        }
+    finally:
+        for f in files:
+            f.close()
+        for fd in (status_r, status_w):
+            if fd is not None:
+                os.close(fd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    limits = json.loads(sys.argv[1])
+    # Keep the protocol pipes away from fds 0-2, which runs write to
+    requests = os.fdopen(os.dup(0), "rb")
+    responses = os.fdopen(os.dup(1), "wb")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+
+    host_uid = os.getuid()
+
+    def send(message: dict):
+        responses.write((json.dumps(message) + "\n").encode())
+        responses.flush()
+
+    try:
+        isolation = _isolate(limits["workdir"], limits["scratch_mb"])
+    except Exception as e:
+        send({"error": f"Cannot isolate the sandbox: {e}"})
+        sys.exit(1)
+    for module in limits["preload"]:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+
+    send({"ready": os.getpid(), "isolation": isolation, "uid": host_uid if _userns else limits["uid"]})
+    for line in requests:
+        try:
+            result = run(json.loads(line), limits)
+        except Exception as e:
+            result = {"error": f"{type(e).__name__}: {e}"}
+        send(result)
+
+
+if __name__ == "__main__":
+    main()
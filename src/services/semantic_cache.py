@@ -0,0 +1,163 @@
+"""Embedding-similarity cache for near-duplicate prompts"""
+import re
+import zlib
+import asyncio
+from typing import Any, Dict, List, Optional, Protocol
+
+import numpy as np
+
+from src.utils.logger import get_logger
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+class Embedder(Protocol):
+    """Anything that turns a prompt into a fixed-size vector"""
+
+    def embed(self, text: str) -> np.ndarray:
+        ...
+
+
+class HashingEmbedder:
+    """Offline hashing-vectorizer embedder (words, word bigrams and char trigrams)"""
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        words = _WORD_RE.findall(text.lower())
+        features = [f"w:{w}" for w in words]
+        features += [f"b:{a}_{b}" for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f"#{word}#"
+            features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+        return features
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            # Low bits pick the bucket, one high bit picks the sign
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return vector
+
+
+class GPT4AllEmbedder:
+    """Embedder backed by gpt4all's Embed4All (loaded on first use)"""
+
+    def __init__(self, model_name: Optional[str] = None):
+        self.model_name = model_name
+        self._embedder = None
+
+    def embed(self, text: str) -> np.ndarray:
+        if self._embedder is None:
+            from gpt4all import Embed4All
+            self._embedder = Embed4All(self.model_name) if self.model_name else Embed4All()
+        return np.asarray(self._embedder.embed(text), dtype=np.float32)
+
+
+def create_embedder(kind: str, dim: int) -> Embedder:
+    """Create an embedder by name ("hashing" or "gpt4all")"""
+    if kind == "hashing":
+        return HashingEmbedder(dim)
+    if kind == "gpt4all":
+        return GPT4AllEmbedder()
+    raise ValueError(f"Unknown semantic cache embedder: {kind}")
+
+
+class SemanticCache:
+    """Bounded vector index answering prompts by cosine similarity
+
+    Vectors are L2-normalized and stored in a preallocated matrix so inserts
+    write a single row and lookups are one matrix-vector product. Entries
+    are only comparable within the same params group (model and sampling
+    parameters), and the least recently used row is overwritten when full.
+    """
+
+    def __init__(self, embedder: Embedder, max_entries: int, threshold: float):
+        self.embedder = embedder
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.logger = get_logger(__name__)
+
+        self._matrix: Optional[np.ndarray] = None  # allocated once the dimension is known
+        self._groups = np.zeros(max_entries, dtype=np.int64)
+        self._last_used = np.zeros(max_entries, dtype=np.int64)
+        self._values: List[Optional[str]] = [None] * max_entries
+        self._size = 0
+        self._clock = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def group_id(params_key: str) -> int:
+        """Map a params fingerprint to an int64 group id"""
+        return int(params_key[:15], 16)
+
+    async def embed(self, prompt: str) -> Optional[np.ndarray]:
+        """Embed and normalize a prompt off the event loop"""
+        vector = await asyncio.to_thread(self.embedder.embed, prompt)
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            return None
+        return vector / norm
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def search(self, vector: np.ndarray, group: int) -> Optional[str]:
+        """Return the cached value of the most similar entry above the threshold"""
+        if self._matrix is None or self._size == 0:
+            self.misses += 1
+            return None
+        scores = self._matrix[:self._size] @ vector
+        scores[self._groups[:self._size] != group] = -1.0
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._last_used[best] = self._tick()
+        return self._values[best]
+
+    def add(self, vector: np.ndarray, group: int, value: str):
+        """Append an entry, overwriting the least recently used row when full"""
+        if self._matrix is None:
+            self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+        if self._size < self.max_entries:
+            row = self._size
+            self._size += 1
+        else:
+            row = int(np.argmin(self._last_used))
+            self.evictions += 1
+        self._matrix[row] = vector
+        self._groups[row] = group
+        self._values[row] = value
+        self._last_used[row] = self._tick()
+
+    async def lookup(self, prompt: str, params_key: str) -> Optional[str]:
+        vector = await self.embed(prompt)
+        if vector is None:
+            self.misses += 1
+            return None
+        return self.search(vector, self.group_id(params_key))
+
+    async def store(self, prompt: str, params_key: str, value: str):
+        vector = await self.embed(prompt)
+        if vector is not None:
+            self.add(vector, self.group_id(params_key), value)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
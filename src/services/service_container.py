@@ -1,20 +1,26 @@
 """Container for global service instances"""
-from typing import Optional
+from typing import Optional, Union
+from src.config import get_settings
 from src.services.gpt4all_service import GPT4ALLService
+from src.services.inference_client import RemoteService
 
-# Global GPT4ALL service instance
-gpt_service: Optional[GPT4ALLService] = None
+# Global GPT4ALL service instance (a client of the inference daemon when INFERENCE_SOCKET is set)
+gpt_service: Optional[Union[GPT4ALLService, RemoteService]] = None
 
-def init_gpt_service() -> GPT4ALLService:
+def _create_service() -> Union[GPT4ALLService, RemoteService]:
+    socket = get_settings().INFERENCE_SOCKET
+    return RemoteService(socket) if socket else GPT4ALLService()
+
+def init_gpt_service() -> Union[GPT4ALLService, RemoteService]:
     """Initialize the GPT4ALL service"""
     global gpt_service
     if gpt_service is None:
-        gpt_service = GPT4ALLService()
+        gpt_service = _create_service()
     return gpt_service
 
-def get_gpt_service() -> Optional[GPT4ALLService]:
+def get_gpt_service() -> Optional[Union[GPT4ALLService, RemoteService]]:
     """Get the GPT4ALL service instance"""
     global gpt_service
     if gpt_service is None:
-        gpt_service = GPT4ALLService()
-    return gpt_service
\ No newline at end of file
+        gpt_service = _create_service()
+    return gpt_service
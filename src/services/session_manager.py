@@ -0,0 +1,317 @@
+"""Persistent chat sessions that keep a live model context between turns"""
+import time
+import uuid
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.utils.logger import get_logger
+from src.utils.exceptions import SessionNotFoundError
+from src.services.prompt_manager import PromptManager
+
+
+@dataclass
+class ChatSession:
+    id: str
+    system_prompt: str
+    created_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.monotonic)
+    turns: List[Tuple[str, str]] = field(default_factory=list)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    last_prompt_eval_ms: Optional[float] = None
+    activations: int = 0
+    # Live state: a dedicated model instance with an open chat_session()
+    model: Any = None
+    context: Any = None
+    context_tokens: int = 0  # tokens in the live context: replayed transcript plus turns since
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    @property
+    def live(self) -> bool:
+        return self.model is not None
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.id,
+            "live": self.live,
+            "turns": len(self.turns),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "last_prompt_eval_ms": self.last_prompt_eval_ms,
+            "activations": self.activations,
+            "created_at": self.created_at,
+        }
+
+
+class SessionManager:
+    """Keeps chat sessions and their live model contexts within a budget
+
+    A live session owns a model instance with an open chat_session(), so
+    the system prompt and earlier turns stay in the model's KV state and
+    only the new turn is evaluated. Weights are mmapped and shared between
+    instances; the per-session cost is the context buffers, which is why the
+    number of live contexts is capped separately from the number of
+    sessions, and each counts against the model memory budget (open_model
+    takes it from the registry). Contexts beyond the cap, or idle past the
+    timeout, are closed least recently used first; their transcript is kept
+    and replayed into the system prompt when the session is next used.
+
+    Everything is counted with the prompt manager's tokenizer against the
+    model's context window. A live context that would overflow on the next
+    turn is restarted, and a replayed transcript keeps only the most recent
+    turns that fit next to the new prompt and its output.
+    """
+
+    def __init__(
+        self,
+        open_model: Callable[[], Awaitable[Any]],
+        release_model: Callable[[], None],
+        prompts: PromptManager,
+        context_length: int,
+        max_sessions: int,
+        max_live: int,
+        idle_timeout: float,
+        session_ttl: float,
+        max_tokens: int,
+    ):
+        self.open_model = open_model
+        self.release_model = release_model
+        self.prompts = prompts
+        self.context_length = context_length
+        self.max_sessions = max_sessions
+        self.max_live = max_live
+        self.idle_timeout = idle_timeout
+        self.session_ttl = session_ttl
+        self.max_tokens = max_tokens
+        self.logger = get_logger(__name__)
+        self._sessions: Dict[str, ChatSession] = {}
+
+        self.created = 0
+        self.expired = 0
+        self.context_evictions = 0
+        self.context_resets = 0  # live contexts restarted before they overflowed
+        self.turns_dropped = 0  # turns left out of replayed transcripts
+        self.activations = 0
+
+    def create(self, system_prompt: str) -> ChatSession:
+        self._sweep()
+        while len(self._sessions) >= self.max_sessions:
+            victim = min(
+                (s for s in self._sessions.values() if not s.lock.locked()),
+                key=lambda s: s.last_used,
+                default=None,
+            )
+            if victim is None:
+                break
+            self._remove(victim)
+            self.expired += 1
+        session = ChatSession(id=uuid.uuid4().hex, system_prompt=system_prompt)
+        self._sessions[session.id] = session
+        self.created += 1
+        return session
+
+    def get(self, session_id: str) -> ChatSession:
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise SessionNotFoundError(session_id)
+        return session
+
+    async def delete(self, session_id: str):
+        session = self.get(session_id)
+        async with session.lock:
+            self._remove(session)
+
+    def _remove(self, session: ChatSession):
+        self._close_context(session)
+        self._sessions.pop(session.id, None)
+
+    def _close_context(self, session: ChatSession):
+        if session.context is not None:
+            try:
+                session.context.__exit__(None, None, None)
+            except Exception as e:
+                self.logger.warning(f"Error closing session {session.id} context: {str(e)}")
+        if session.model is not None:
+            self.release_model()
+        session.context = None
+        session.model = None
+        session.context_tokens = 0
+
+    def _sweep(self):
+        """Close idle contexts and drop expired sessions"""
+        now = time.monotonic()
+        for session in list(self._sessions.values()):
+            if session.lock.locked():
+                continue
+            idle = now - session.last_used
+            if idle > self.session_ttl:
+                self._remove(session)
+                self.expired += 1
+            elif session.live and idle > self.idle_timeout:
+                self._close_context(session)
+                self.context_evictions += 1
+
+    def _make_room(self, keep: ChatSession):
+        """Close least recently used live contexts until one more fits"""
+        live = [s for s in self._sessions.values() if s.live and s is not keep]
+        # Sessions mid-turn stay live and keep counting; only idle ones can be closed
+        candidates = sorted((s for s in live if not s.lock.locked()), key=lambda s: s.last_used)
+        remaining = len(live)
+        while remaining + 1 > self.max_live and candidates:
+            self._close_context(candidates.pop(0))
+            self.context_evictions += 1
+            remaining -= 1
+
+    def _activation_prompt(self, session: ChatSession, budget: int) -> Tuple[str, int]:
+        """System prompt for a (re)activated session and its token count
+
+        Earlier turns are replayed newest first for as long as they fit in
+        budget tokens; older ones are left out.
+        """
+        header = f"{session.system_prompt}\n\nConversation so far:\n"
+        used = self.prompts.count(header)
+        kept: List[str] = []
+        for user, assistant in reversed(session.turns):
+            turn = f"User: {user}\nAssistant: {assistant}"
+            cost = self.prompts.count(turn) + 1  # and the blank line between turns
+            if used + cost > budget:
+                break
+            kept.append(turn)
+            used += cost
+        self.turns_dropped += len(session.turns) - len(kept)
+        if not kept:
+            return session.system_prompt, self.prompts.count(session.system_prompt)
+        return header + "\n\n".join(reversed(kept)), used
+
+    async def _activate(self, session: ChatSession, budget: int):
+        """Take a model instance for the session and open its chat context"""
+        system_prompt, tokens = self._activation_prompt(session, budget)
+        model = await self.open_model()
+
+        def open_context():
+            context = model.chat_session(system_prompt)
+            context.__enter__()
+            return context
+
+        try:
+            context = await asyncio.to_thread(open_context)
+        except BaseException:
+            self.release_model()
+            raise
+        session.model, session.context, session.context_tokens = model, context, tokens
+
+    async def generate(
+        self,
+        session_id: str,
+        prompt: str,
+        submit: Callable[[Callable[[Any], Any], Callable[[str], None]], Awaitable[Any]],
+        max_tokens: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Run one turn; submit(fn, on_cancel) queues a job on the inference scheduler"""
+        self._sweep()
+        session = self.get(session_id)
+        async with session.lock:
+            session.last_used = time.monotonic()
+            max_tokens = max_tokens or self.max_tokens
+            # Room this turn needs: the prompt and its output (at most half the window)
+            needed = self.prompts.count(prompt) + min(max_tokens, self.context_length // 2)
+            if session.live and session.context_tokens + needed > self.context_length:
+                # Restart from a trimmed transcript instead of overflowing the live context
+                self._close_context(session)
+                self.context_resets += 1
+            if not session.live:
+                self._make_room(session)
+                await self._activate(session, self.context_length - needed)
+                session.activations += 1
+                self.activations += 1
+
+            # Fits the turn into what is left of the window (clamps max_tokens, or 413)
+            prepared = self.prompts.prepare(prompt, "raw", max_tokens, self.context_length - session.context_tokens)
+
+            started: List[float] = []
+            first_token_at: List[float] = []
+            tokens = [0]
+            loop = asyncio.get_running_loop()
+            finished = loop.create_future()
+            state = threading.Lock()  # orders "cancelled" against the job starting
+            cancelled = threading.Event()
+            running = threading.Event()
+
+            def callback(token_id: int, token: str) -> bool:
+                if not first_token_at:
+                    first_token_at.append(time.perf_counter())
+                tokens[0] += 1
+                return not cancelled.is_set()
+
+            def cancel(reason: str = "cancelled"):
+                with state:
+                    cancelled.set()
+
+            model = session.model
+
+            def run(_scheduler_model: Any) -> str:
+                # The session's own model serves the turn; the scheduler only bounds concurrency
+                with state:
+                    if cancelled.is_set():
+                        return ""
+                    running.set()
+                try:
+                    started.append(time.perf_counter())
+                    return model.generate(prepared.text, max_tokens=prepared.max_tokens, callback=callback)
+                finally:
+                    loop.call_soon_threadsafe(finished.set_result, None)
+
+            try:
+                response = await submit(run, cancel)
+            except BaseException:
+                cancel()
+                # The model thread cannot be interrupted: it stops at its next token. The
+                # context (and the instance's memory budget) is released only once it has
+                interrupted = False
+                while running.is_set() and not finished.done():
+                    try:
+                        await asyncio.shield(finished)
+                    except asyncio.CancelledError:
+                        interrupted = True
+                # A failed or abandoned turn leaves the context in an unknown state
+                self._close_context(session)
+                if interrupted:
+                    raise asyncio.CancelledError()
+                raise
+
+            text = (response or "").strip()
+            prompt_eval_ms = (first_token_at[0] - started[0]) * 1000 if first_token_at else None
+            session.turns.append((prompt, text))
+            session.prompt_tokens += prepared.prompt_tokens
+            session.completion_tokens += tokens[0]
+            session.context_tokens += prepared.prompt_tokens + tokens[0]
+            session.last_prompt_eval_ms = round(prompt_eval_ms, 2) if prompt_eval_ms is not None else None
+            session.last_used = time.monotonic()
+
+            return {
+                "code": text,
+                "turn": len(session.turns),
+                "completion_tokens": tokens[0],
+                "prompt_eval_ms": session.last_prompt_eval_ms,
+                "session": session.info(),
+            }
+
+    def close(self):
+        for session in list(self._sessions.values()):
+            self._close_context(session)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "live": sum(1 for s in self._sessions.values() if s.live),
+            "max_sessions": self.max_sessions,
+            "max_live": self.max_live,
+            "created": self.created,
+            "expired": self.expired,
+            "context_evictions": self.context_evictions,
+            "context_resets": self.context_resets,
+            "turns_dropped": self.turns_dropped,
+            "activations": self.activations,
+        }
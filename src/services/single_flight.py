@@ -0,0 +1,152 @@
+"""Coalescing of identical in-flight requests"""
+import time
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from src.services.streaming import EventLog
+
+
+# Why shared work was cancelled: its callers went away, or their deadlines passed
+CANCELLED = "cancelled"
+DEADLINE = "deadline"
+
+
+def cancel_reason(error: asyncio.CancelledError) -> str:
+    """CANCELLED or DEADLINE for a CancelledError raised inside a cancelled flight"""
+    return DEADLINE if error.args and error.args[0] == DEADLINE else CANCELLED
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _Stream:
+    def __init__(self):
+        self.log = EventLog()
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers = 0
+
+
+class SingleFlight:
+    """Runs one task per key and shares its result with every concurrent caller
+
+    Each caller waits on the shared task through asyncio.shield, so a caller
+    that is cancelled or times out only detaches itself; the shared work is
+    cancelled once its last waiter is gone. Streams are fanned out the same
+    way: later subscribers replay the events produced so far, then follow
+    the live stream.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._streams: Dict[str, _Stream] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.aborted = 0
+        self.stream_leaders = 0
+        self.stream_coalesced = 0
+
+    def in_flight(self, key: str, stream: bool = False) -> bool:
+        """Whether a call (or stream) for key is already running"""
+        return key in (self._streams if stream else self._flights)
+
+    async def do(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """Await factory() once per key; raises asyncio.TimeoutError past timeout"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.create_task(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(self._flights, key, flight))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        reason = CANCELLED
+        try:
+            return await asyncio.wait_for(asyncio.shield(flight.task), timeout)
+        except asyncio.TimeoutError:
+            reason = DEADLINE
+            raise
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # The reason travels as the CancelledError message (see cancel_reason)
+                flight.task.cancel(reason)
+                self.aborted += 1
+
+    async def subscribe(
+        self,
+        key: str,
+        factory: Callable[[], AsyncIterator[Dict[str, Any]]],
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Iterate a shared event stream; raises asyncio.TimeoutError past timeout"""
+        stream = self._streams.get(key)
+        if stream is None:
+            stream = _Stream()
+            self._streams[key] = stream
+            stream.task = asyncio.create_task(self._pump(factory, stream.log))
+            stream.task.add_done_callback(lambda _: self._forget(self._streams, key, stream))
+            self.stream_leaders += 1
+            coalesced = False
+        else:
+            self.stream_coalesced += 1
+            coalesced = True
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        stream.subscribers += 1
+        events = stream.log.follow()
+        try:
+            while True:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                try:
+                    event = await asyncio.wait_for(events.__anext__(), remaining)
+                except StopAsyncIteration:
+                    return
+                yield {**event, "coalesced": True} if coalesced and event.get("done") else event
+        finally:
+            await events.aclose()
+            stream.subscribers -= 1
+            if stream.subscribers == 0 and not stream.task.done():
+                stream.task.cancel()
+                self.aborted += 1
+
+    @staticmethod
+    async def _pump(factory: Callable[[], AsyncIterator[Dict[str, Any]]], log: EventLog):
+        events = factory()
+        try:
+            async for event in events:
+                log.publish(event)
+        except asyncio.CancelledError:
+            log.close(asyncio.CancelledError())
+            raise
+        except Exception as e:
+            log.close(e)
+        else:
+            log.close()
+        finally:
+            await events.aclose()
+
+    @staticmethod
+    def _forget(registry: Dict[str, Any], key: str, entry: Any):
+        if registry.get(key) is entry:
+            del registry[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._flights),
+            "streams_in_flight": len(self._streams),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "stream_leaders": self.stream_leaders,
+            "stream_coalesced": self.stream_coalesced,
+            "aborted": self.aborted,
+        }
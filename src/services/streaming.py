@@ -0,0 +1,303 @@
+"""Bridge between a token-producing worker thread and an asyncio consumer"""
+import time
+import asyncio
+import threading
+import concurrent.futures
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+
+@dataclass
+class GenerationStats:
+    """Per-request timing for a streamed generation"""
+    started_at: float = field(default_factory=time.perf_counter)
+    job_started_at: Optional[float] = None  # when a worker picked the request up
+    first_token_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    tokens: int = 0
+    max_tokens: Optional[int] = None
+    aborted: Optional[str] = None  # why generation stopped early ("cancelled" or "deadline")
+    stop_sequence_hit: bool = False
+    _cancel_reason: Optional[str] = field(default=None, repr=False)
+    _cancelled: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def mark_started(self):
+        self.job_started_at = time.perf_counter()
+
+    def cancel(self, reason: str = "cancelled"):
+        """Ask the generating thread to stop at its next token (safe from any thread)"""
+        if self._cancel_reason is None:
+            self._cancel_reason = reason
+        self._cancelled.set()
+
+    def should_stop(self) -> bool:
+        """Checked by the generating thread after each token; records an early stop"""
+        if not self._cancelled.is_set():
+            return False
+        self.aborted = self._cancel_reason
+        return True
+
+    @property
+    def tokens_saved(self) -> int:
+        """Tokens not generated because of an early stop (up to max_tokens)"""
+        if self.aborted is None or self.max_tokens is None:
+            return 0
+        return max(0, self.max_tokens - self.tokens)
+
+    def record_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.tokens += 1
+
+    def callback(self, token_id: int, token: str) -> bool:
+        """GPT4All token callback: records timing and stops generation once cancelled"""
+        self.record_token()
+        return not self.should_stop()
+
+    def finish(self):
+        if self.finished_at is None:
+            self.finished_at = time.perf_counter()
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def queue_wait(self) -> Optional[float]:
+        if self.job_started_at is None:
+            return None
+        return self.job_started_at - self.started_at
+
+    @property
+    def prompt_eval_time(self) -> Optional[float]:
+        if self.first_token_at is None or self.job_started_at is None:
+            return None
+        return self.first_token_at - self.job_started_at
+
+    @property
+    def generation_time(self) -> Optional[float]:
+        if self.first_token_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.first_token_at
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        # Decode rate: tokens after the first over the time spent producing them
+        if self.first_token_at is None or self.finished_at is None or self.tokens < 2:
+            return None
+        elapsed = self.finished_at - self.first_token_at
+        return (self.tokens - 1) / elapsed if elapsed > 0 else None
+
+    def as_dict(self) -> Dict[str, Any]:
+        ttft = self.time_to_first_token
+        tps = self.tokens_per_second
+        total = (self.finished_at or time.perf_counter()) - self.started_at
+        return {
+            "tokens": self.tokens,
+            "ttft_ms": round(ttft * 1000, 2) if ttft is not None else None,
+            "tokens_per_second": round(tps, 2) if tps is not None else None,
+            "total_ms": round(total * 1000, 2),
+        }
+
+
+CODE_FENCE = "```"
+
+
+class StopMatcher:
+    """Incremental stop-sequence detection over a stream of tokens
+
+    feed() returns the text that is safe to emit: a tail that could be the
+    start of a stop sequence is held back until later tokens decide it, so
+    each token is checked in O(token + longest sequence) and generation can
+    halt on the token that completes a match. Stop sequences are cut from
+    the output. With close_code_block, the fence closing the first fenced
+    code block also stops generation; that fence is kept so the block
+    stays well-formed.
+    """
+
+    def __init__(self, sequences: Sequence[str] = (), close_code_block: bool = False):
+        self.sequences = tuple(s for s in sequences if s)
+        self.close_code_block = close_code_block
+        self._watched = self.sequences + ((CODE_FENCE,) if close_code_block else ())
+        self._pending = ""
+        self._fence_floor = 0  # fences before this offset of the pending text are already counted
+        self._in_block = False
+        self.stopped = False
+
+    def _stop_at(self, text: str) -> Optional[int]:
+        """Length of the output if text contains a stop, else None"""
+        end = None
+        for sequence in self.sequences:
+            index = text.find(sequence)
+            if index != -1 and (end is None or index < end):
+                end = index
+        if self.close_code_block:
+            index = text.find(CODE_FENCE, self._fence_floor)
+            while index != -1 and not self._in_block and (end is None or index < end):
+                self._in_block = True
+                self._fence_floor = index + len(CODE_FENCE)
+                index = text.find(CODE_FENCE, self._fence_floor)
+            if index != -1 and self._in_block and (end is None or index < end):
+                end = index + len(CODE_FENCE)
+        return end
+
+    def _held(self, text: str) -> int:
+        """Length of the longest tail of text that starts a watched sequence"""
+        longest = 0
+        for sequence in self._watched:
+            for length in range(min(len(sequence) - 1, len(text)), longest, -1):
+                if text.endswith(sequence[:length]):
+                    longest = length
+                    break
+        return longest
+
+    def feed(self, token: str) -> str:
+        """Add a token and return the text that can be emitted now"""
+        if self.stopped:
+            return ""
+        text = self._pending + token
+        end = self._stop_at(text)
+        if end is not None:
+            self.stopped = True
+            self._pending = ""
+            return text[:end]
+        ready = len(text) - self._held(text)
+        self._pending = text[ready:]
+        self._fence_floor = max(0, self._fence_floor - ready)
+        return text[:ready]
+
+    def flush(self) -> str:
+        """Text still held back when generation ends without a stop"""
+        text, self._pending = self._pending, ""
+        return text
+
+
+class _Finished:
+    def __init__(self, error: Optional[BaseException] = None):
+        self.error = error
+
+
+class TokenStream:
+    """Bounded queue of tokens fed from a worker thread
+
+    push() is called from the model's token callback and blocks while the
+    queue is full, so a slow client applies backpressure to generation
+    instead of buffering the whole completion. Its return value is meant to
+    be returned from the callback: once the consumer closes the stream (or
+    the optional StopMatcher sees a stop sequence) it returns False and the
+    model stops generating.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int, stop: Optional[StopMatcher] = None):
+        self._loop = loop
+        self._stop = stop
+        self._queue: asyncio.Queue = asyncio.Queue(max(2, maxsize))  # room for the end marker after close()
+        self._closed = threading.Event()
+        self._chunks: List[str] = []
+        self._pending: Optional[concurrent.futures.Future] = None
+        self.stats = GenerationStats()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.is_set()
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def _put(self, item: Any):
+        self._pending = asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop)
+        try:
+            self._pending.result()
+        except concurrent.futures.CancelledError:
+            pass  # Consumer went away while we were blocked on a full queue
+
+    def push(self, token: str) -> bool:
+        """Hand a token to the consumer (worker thread side)"""
+        if not self._closed.is_set():
+            self.stats.record_token()
+            text = self._stop.feed(token) if self._stop is not None else token
+            if text:
+                self._chunks.append(text)
+                self._put(text)
+        if self._stop is not None and self._stop.stopped:
+            self.stats.stop_sequence_hit = True
+            return False
+        return not self.stats.should_stop()
+
+    def finish(self, error: Optional[BaseException] = None):
+        """Signal the end of generation (worker thread side)"""
+        self.stats.finish()
+        if self._closed.is_set():
+            return
+        rest = self._stop.flush() if self._stop is not None and error is None else ""
+        if rest:
+            self._chunks.append(rest)
+            self._put(rest)
+        self._put(_Finished(error))
+
+    def close(self):
+        """Stop consuming; unblocks the producer and makes push() return False"""
+        self._closed.set()
+        self.stats.cancel()
+        self.stats.finish()
+        if self._pending is not None:
+            self._pending.cancel()
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    def abort(self, error: BaseException):
+        """End the stream with an error from the event loop side"""
+        self.close()
+        self._queue.put_nowait(_Finished(error))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        item = await self._queue.get()
+        if isinstance(item, _Finished):
+            if item.error is not None:
+                raise item.error
+            raise StopAsyncIteration
+        return item
+
+
+class EventLog:
+    """Append-only event list that any number of readers can replay and follow"""
+
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self.closed = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, event: Dict[str, Any]):
+        self.events.append(event)
+        self._notify()
+
+    def close(self, error: Optional[BaseException] = None):
+        """End the log; readers raise error (if any) after the last event"""
+        self.closed = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the events so far, then new ones until the log is closed"""
+        position = 0
+        while True:
+            while position < len(self.events):
+                event = self.events[position]
+                position += 1
+                yield event
+            if self.closed:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
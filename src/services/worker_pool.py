@@ -0,0 +1,318 @@
+"""Multi-process pool of model replicas
+
+Each worker process loads its own model instance and serves requests over a
+multiprocessing pipe. GGUF weights are mmapped by llama.cpp, so replicas
+share the read-only weight pages through the OS page cache instead of each
+holding a private copy; only context/KV buffers are per process.
+
+ModelWorkerPool.generate() mirrors GPT4All.generate() (including the
+per-token callback), so the inference scheduler can drive a pool exactly as
+it drives an in-process model.
+"""
+import os
+import importlib
+import threading
+import multiprocessing
+from typing import Any, Callable, Dict, List, Optional
+
+from src.utils.logger import get_logger
+from src.utils.exceptions import ModelLoadError
+
+
+def load_factory(path: str) -> Callable[..., Any]:
+    """Resolve a "module:attribute" import path (e.g. "gpt4all:GPT4All")"""
+    module_name, _, attribute = path.partition(":")
+    if not module_name or not attribute:
+        raise ValueError(f"Model factory must look like 'module:attribute', got {path!r}")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def _anon_rss_bytes() -> int:
+    """Private resident memory of this process (excludes mmapped weights)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _worker_main(conn, factory_path: str, model_kwargs: Dict[str, Any]):
+    """Worker process entry point
+
+    Protocol (tuples over the pipe):
+      parent -> worker: ("generate", prompt, kwargs, stream) | ("cancel",) | ("ping",) | ("shutdown",)
+      worker -> parent: ("ready", pid) | ("token", text) | ("result", text) | ("done", None)
+                        | ("error", message) | ("pong", anon_rss_bytes)
+    """
+    try:
+        model = load_factory(factory_path)(**model_kwargs)
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+        return
+    conn.send(("ready", os.getpid()))
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        op = message[0]
+
+        if op == "generate":
+            _, prompt, kwargs, stream = message
+
+            def callback(token_id: int, token: str) -> bool:
+                if stream:
+                    conn.send(("token", token))
+                # A cancel from the parent stops generation at the next token
+                while conn.poll():
+                    if conn.recv()[0] == "cancel":
+                        return False
+                return True
+
+            try:
+                text = model.generate(prompt, callback=callback, **kwargs)
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+            else:
+                conn.send(("done", None) if stream else ("result", text))
+        elif op == "ping":
+            conn.send(("pong", _anon_rss_bytes()))
+        elif op == "shutdown":
+            return
+        # Late "cancel" messages for finished requests are ignored
+
+
+class WorkerCrashedError(Exception):
+    pass
+
+
+class _Worker:
+    """Parent-side handle for one worker process"""
+
+    def __init__(self, index: int, pool: "ModelWorkerPool"):
+        self.index = index
+        self.pool = pool
+        self.lock = threading.Lock()  # one request at a time per worker
+        self.inflight = 0
+        self.requests = 0
+        self.restarts = 0
+        self.process = None
+        self.conn = None
+        self.pid: Optional[int] = None
+        self.anon_rss = 0
+
+    def start(self):
+        ctx = self.pool.context
+        parent_conn, child_conn = ctx.Pipe()
+        process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.pool.factory_path, self.pool.model_kwargs),
+            name=f"model-worker-{self.index}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        self.process, self.conn = process, parent_conn
+
+        if not parent_conn.poll(self.pool.start_timeout):
+            self.kill()
+            raise ModelLoadError(f"Model worker {self.index} did not start within {self.pool.start_timeout}s")
+        try:
+            status, payload = parent_conn.recv()
+        except EOFError:
+            status, payload = "error", f"exited with code {process.exitcode}"
+        if status != "ready":
+            self.kill()
+            raise ModelLoadError(f"Model worker {self.index} failed to load model: {payload}")
+        self.pid = payload
+        self.requests = 0
+
+    def kill(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.process is not None:
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join(5)
+                if self.process.is_alive():
+                    self.process.kill()
+                    self.process.join()
+            self.process = None
+
+    def restart(self, reason: str):
+        self.pool.logger.warning(f"Restarting model worker {self.index} (pid {self.pid}): {reason}")
+        self.kill()
+        self.restarts += 1
+        self.start()
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def generate(self, prompt: str, callback: Optional[Callable[[int, str], bool]], kwargs: Dict[str, Any]) -> str:
+        """Run one request on this worker (caller holds self.lock)"""
+        stream = callback is not None
+        chunks: List[str] = []
+        cancelled = False
+        try:
+            self.conn.send(("generate", prompt, kwargs, stream))
+            while True:
+                status, payload = self.conn.recv()
+                if status == "token":
+                    chunks.append(payload)
+                    if not cancelled and callback(len(chunks) - 1, payload) is False:
+                        cancelled = True
+                        self.conn.send(("cancel",))
+                elif status == "result":
+                    return payload
+                elif status == "done":
+                    return "".join(chunks)
+                elif status == "error":
+                    raise RuntimeError(payload)
+        except (EOFError, OSError) as e:
+            raise WorkerCrashedError(f"Model worker {self.index} died during generation: {e}")
+        finally:
+            self.requests += 1
+
+    def ping(self, timeout: float) -> bool:
+        """Check responsiveness (caller holds self.lock)"""
+        try:
+            self.conn.send(("ping",))
+            if not self.conn.poll(timeout):
+                return False
+            status, payload = self.conn.recv()
+        except (EOFError, OSError):
+            return False
+        if status != "pong":
+            return False
+        self.anon_rss = payload
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "pid": self.pid,
+            "alive": self.alive(),
+            "inflight": self.inflight,
+            "requests": self.requests,
+            "restarts": self.restarts,
+            "anon_rss_mb": round(self.anon_rss / 1024 / 1024, 1),
+        }
+
+
+class ModelWorkerPool:
+    """Pool of model replicas in separate processes, dispatched least-loaded first"""
+
+    def __init__(
+        self,
+        factory_path: str,
+        model_kwargs: Dict[str, Any],
+        size: int,
+        health_interval: float = 10.0,
+        max_requests: int = 0,
+        max_rss_mb: int = 0,
+        start_timeout: float = 600.0,
+    ):
+        self.factory_path = factory_path
+        self.model_kwargs = model_kwargs
+        self.size = size
+        self.health_interval = health_interval
+        self.max_requests = max_requests
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024
+        self.start_timeout = start_timeout
+        self.logger = get_logger(__name__)
+        # spawn: forking a process that already runs an event loop and threads is unsafe
+        self.context = multiprocessing.get_context("spawn")
+
+        self._workers = [_Worker(i, self) for i in range(size)]
+        self._dispatch_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health_thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start all workers in parallel and the health-check thread (blocking)"""
+        errors: List[Exception] = []
+
+        def start_worker(worker: _Worker):
+            try:
+                worker.start()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=start_worker, args=(w,)) for w in self._workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            self.close()
+            raise errors[0]
+
+        self._health_thread = threading.Thread(target=self._health_loop, name="model-worker-health", daemon=True)
+        self._health_thread.start()
+        self.logger.info(f"Started {self.size} model workers ({self.factory_path})")
+
+    def _acquire(self) -> _Worker:
+        with self._dispatch_lock:
+            worker = min(self._workers, key=lambda w: w.inflight)
+            worker.inflight += 1
+        return worker
+
+    def generate(self, prompt: str, callback: Optional[Callable[[int, str], bool]] = None, **kwargs) -> str:
+        """Generate on the least-loaded worker; same contract as GPT4All.generate"""
+        worker = self._acquire()
+        try:
+            with worker.lock:
+                if not worker.alive():
+                    worker.restart("process not running")
+                try:
+                    return worker.generate(prompt, callback, kwargs)
+                except WorkerCrashedError:
+                    worker.restart("crashed during generation")
+                    raise
+                finally:
+                    if self.max_requests and worker.requests >= self.max_requests and worker.alive():
+                        worker.restart(f"recycled after {worker.requests} requests")
+        finally:
+            with self._dispatch_lock:
+                worker.inflight -= 1
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            for worker in self._workers:
+                # Busy workers are evidently alive; check them next round
+                if not worker.lock.acquire(blocking=False):
+                    continue
+                try:
+                    if self._stop.is_set():
+                        return
+                    if not worker.alive():
+                        worker.restart("process exited")
+                    elif not worker.ping(timeout=5.0):
+                        worker.restart("health check timed out")
+                    elif self.max_rss_bytes and worker.anon_rss > self.max_rss_bytes:
+                        worker.restart(f"private memory {worker.anon_rss // (1024 * 1024)}MB over limit")
+                except Exception as e:
+                    self.logger.error(f"Model worker {worker.index} health check failed: {str(e)}")
+                finally:
+                    worker.lock.release()
+
+    def close(self):
+        """Stop the health checks and shut down every worker"""
+        self._stop.set()
+        for worker in self._workers:
+            if worker.conn is not None:
+                try:
+                    worker.conn.send(("shutdown",))
+                except OSError:
+                    pass
+            if worker.process is not None:
+                worker.process.join(5)
+            worker.kill()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [worker.stats() for worker in self._workers]
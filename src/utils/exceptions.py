@@ -11,3 +11,42 @@ class ModelLoadError(CacheCowException):
 class ValidationError(CacheCowException):
     def __init__(self, message: str):
         super().__init__(message, status_code=422)
+
+class ServiceOverloadedError(CacheCowException):
+    """Request rejected by admission control; retry_after is in seconds"""
+    def __init__(self, message: str, retry_after: int, status_code: int = 429):
+        self.retry_after = retry_after
+        super().__init__(message, status_code=status_code)
+
+class SandboxUnavailableError(CacheCowException):
+    """Code execution is disabled because the sandbox cannot be isolated on this host"""
+    def __init__(self, message: str):
+        super().__init__(message, status_code=503)
+
+class SessionNotFoundError(CacheCowException):
+    def __init__(self, session_id: str):
+        super().__init__(f"Session not found: {session_id}", status_code=404)
+
+class BatchNotFoundError(CacheCowException):
+    def __init__(self, batch_id: str):
+        super().__init__(f"Batch not found: {batch_id}", status_code=404)
+
+class ProjectNotFoundError(CacheCowException):
+    def __init__(self, project_id: str):
+        super().__init__(f"Project not found: {project_id}", status_code=404)
+
+class ClientDisconnectedError(CacheCowException):
+    """The client went away before the response was ready (499, as in nginx)"""
+    def __init__(self):
+        super().__init__("Client disconnected", status_code=499)
+
+class PromptTooLongError(CacheCowException):
+    """The prompt plus the tokens to generate do not fit the model's context window"""
+    def __init__(self, prompt_tokens: int, max_tokens: int, context_length: int):
+        self.prompt_tokens = prompt_tokens
+        self.context_length = context_length
+        super().__init__(
+            f"Prompt is {prompt_tokens} tokens; with {max_tokens} tokens to generate it exceeds "
+            f"the model's context window of {context_length} tokens",
+            status_code=413
+        )
@@ -1,30 +1,250 @@
-import logging
+"""Non-blocking structured logging with per-request context and timing spans
+
+Records are handed to a bounded queue on the calling thread and formatted
+and written by a background thread, so a slow stdout never blocks the event
+loop. When the queue is full records are dropped (and counted) instead of
+waiting. Each record carries the ID of the request it was logged for, and
+RequestLogMiddleware ends every request with one summary record holding
+its status, duration and timing spans.
+"""
 import sys
-from src.config import Settings
+import json
+import time
+import uuid
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from src.config import get_settings
+from src.utils.metrics import LOG_DROPPED, LOG_EMIT_SECONDS, LOG_RECORDS
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class RequestLog:
+    """Request ID and timing spans of the request being handled"""
+
+    __slots__ = ("request_id", "started", "spans")
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+
+    def add_span(self, name: str, seconds: float):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def mark(self, name: str):
+        """Record the time from the start of the request until now as a span"""
+        self.add_span(name, time.perf_counter() - self.started)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, time.perf_counter() - started)
+
+    def spans_ms(self) -> Dict[str, float]:
+        return {name: round(seconds * 1000, 2) for name, seconds in self.spans.items()}
+
+
+_request_log: ContextVar[Optional[RequestLog]] = ContextVar("request_log", default=None)
+
+
+def current_request() -> Optional[RequestLog]:
+    return _request_log.get()
+
+
+def record_span(name: str, seconds: Optional[float]):
+    """Add a span to the current request (no-op outside requests or without a value)"""
+    request = _request_log.get()
+    if request is not None and seconds is not None:
+        request.add_span(name, seconds)
+
+
+def mark(name: str):
+    """Record the time since the current request started as a span"""
+    request = _request_log.get()
+    if request is not None:
+        request.mark(name)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time a block as a span of the current request"""
+    request = _request_log.get()
+    if request is None:
+        yield
+        return
+    with request.span(name):
+        yield
+
+
+def loggable_prompt(prompt: str) -> Optional[str]:
+    """The prompt as it may be logged: sampled by LOG_PROMPT_SAMPLE_RATE, cut at LOG_PROMPT_MAX_CHARS"""
+    settings = get_settings()
+    if settings.LOG_PROMPT_SAMPLE_RATE <= 0 or random.random() >= settings.LOG_PROMPT_SAMPLE_RATE:
+        return None
+    limit = settings.LOG_PROMPT_MAX_CHARS
+    if len(prompt) <= limit:
+        return prompt
+    return f"{prompt[:limit]}... [{len(prompt) - limit} more chars]"
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including fields passed through extra="""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that tags records with the request ID and drops them when the queue is full"""
+
+    def emit(self, record: logging.LogRecord):
+        started = time.perf_counter()
+        try:
+            request = _request_log.get()
+            if request is not None:
+                record.request_id = request.request_id
+            super().emit(record)
+        finally:
+            LOG_RECORDS.inc()
+            LOG_EMIT_SECONDS.inc(time.perf_counter() - started)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge args (and render a traceback) here; JSON happens on the writer thread
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
 
 def setup_logger():
-    """Set up the application logger"""
-    settings = Settings()
-    
-    # Create logger
+    """Set up the application logger (safe to call more than once)"""
+    global _listener
+    settings = get_settings()
+
     logger = logging.getLogger("cachecow")
     logger.setLevel(settings.LOG_LEVEL)
-    
-    # Create console handler
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setLevel(settings.LOG_LEVEL)
-    
-    # Create formatter
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    handler.setFormatter(formatter)
-    
-    # Add handler to logger
-    logger.addHandler(handler)
-    
+    logger.propagate = False
+    if _listener is not None:
+        return logger
+
+    # The writer thread owns stdout; callers only enqueue
+    output = logging.StreamHandler(sys.stdout)
+    output.setLevel(settings.LOG_LEVEL)
+    if settings.LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    records: queue.Queue = queue.Queue(settings.LOG_QUEUE_SIZE)
+    logger.addHandler(_NonBlockingQueueHandler(records))
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
     return logger
 
+
+def stop_logging():
+    """Write out queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        logging.getLogger("cachecow").handlers.clear()
+
+
 def get_logger(name: str):
     """Get a logger instance"""
     return logging.getLogger(f"cachecow.{name}")
+
+
+class RequestLogMiddleware:
+    """ASGI middleware giving each request an ID and logging a summary when it ends
+
+    The ID comes from a valid X-Request-ID header or is generated, and is
+    echoed in the response. Successful requests are summarized at the
+    LOG_REQUEST_SAMPLE_RATE; errors (status >= 400) always are.
+    """
+
+    def __init__(self, app: Callable):
+        self.app = app
+        self.logger = get_logger("request")
+        self.sample_rate = get_settings().LOG_REQUEST_SAMPLE_RATE
+
+    @staticmethod
+    def _request_id(scope: Dict[str, Any]) -> str:
+        for name, value in scope.get("headers", ()):
+            if name == b"x-request-id":
+                candidate = value.decode("latin-1")
+                if 0 < len(candidate) <= 64 and candidate.replace("-", "").isalnum():
+                    return candidate
+        return uuid.uuid4().hex
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = RequestLog(self._request_id(scope))
+        token = _request_log.set(request)
+        status = [500]
+
+        async def send_wrapper(message: Dict[str, Any]):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request.request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_log.reset(token)
+            if status[0] >= 400 or self.sample_rate >= 1 or random.random() < self.sample_rate:
+                route = scope.get("route")
+                self.logger.info(
+                    "request",
+                    extra={
+                        "request_id": request.request_id,
+                        "method": scope.get("method"),
+                        "route": getattr(route, "path", None) or scope.get("path"),
+                        "status": status[0],
+                        "duration_ms": round((time.perf_counter() - request.started) * 1000, 2),
+                        "spans": request.spans_ms(),
+                    },
+                )
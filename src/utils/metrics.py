@@ -0,0 +1,441 @@
+"""In-process Prometheus-style metrics with per-thread sharded values
+
+Each metric child keeps one value array per writing thread, so the hot path
+is an unlocked list update on memory no other thread writes. The shards are
+only summed when /metrics is scraped. Gauges that describe current state
+(queue depth, resident models) are produced by collectors at scrape time
+instead of being updated on every request.
+"""
+import time
+import bisect
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers sub-millisecond cache hits up to multi-minute generations
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+DURATION_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+RATE_BUCKETS = (1.0, 2.0, 5.0, 10.0, 15.0, 20.0, 30.0, 50.0, 75.0, 100.0, 200.0, 500.0)
+TOKEN_BUCKETS = (1, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+LAG_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Family(NamedTuple):
+    """A metric as produced by a collector: name, type, help and samples"""
+    name: str
+    kind: str
+    help: str
+    samples: List[Tuple[Dict[str, str], float]]
+
+
+class _Shards:
+    """Per-thread value arrays; each thread only ever writes its own"""
+
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._arrays: List[List[float]] = []
+        self._lock = threading.Lock()  # only taken when a new thread first writes
+
+    def local(self) -> List[float]:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = [0.0] * self._size
+            with self._lock:
+                self._arrays.append(values)
+            self._local.values = values
+            return values
+
+    def totals(self) -> List[float]:
+        with self._lock:
+            arrays = list(self._arrays)
+        totals = [0.0] * self._size
+        for values in arrays:
+            for i, value in enumerate(values):
+                totals[i] += value
+        return totals
+
+
+class _CounterChild:
+    def __init__(self):
+        self._shards = _Shards(1)
+
+    def inc(self, amount: float = 1.0):
+        self._shards.local()[0] += amount
+
+    def value(self) -> float:
+        return self._shards.totals()[0]
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount: float = 1.0):
+        self._shards.local()[0] -= amount
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self._buckets = buckets
+        # Per-bucket counts, then +Inf, sum and count
+        self._shards = _Shards(len(buckets) + 3)
+
+    def observe(self, value: float):
+        values = self._shards.local()
+        values[bisect.bisect_left(self._buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+    def snapshot(self) -> Tuple[List[float], float, float]:
+        totals = self._shards.totals()
+        return totals[:-2], totals[-2], totals[-1]
+
+
+class _Timer:
+    """Context manager observing elapsed seconds into a histogram"""
+
+    def __init__(self, child: _HistogramChild):
+        self._child = child
+        self._started = 0.0
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._child.observe(time.perf_counter() - self._started)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: Any):
+        """Child for the given label values (created on first use)"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _items(self) -> List[Tuple[Dict[str, str], Any]]:
+        with self._lock:
+            items = list(self._children.items())
+        return [(dict(zip(self.labelnames, key)), child) for key, child in items]
+
+    def render(self, lines: List[str]):
+        lines.append(f"# HELP {self.name} {_escape_help(self.help)}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        for labels, child in self._items():
+            lines.append(f"{self.name}{_format_labels(labels)} {_format_value(child.value())}")
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        """Current value per combination of label values"""
+        return {tuple(labels.values()): child.value() for labels, child in self._items()}
+
+
+class Gauge(_Metric):
+    """Up/down gauge (e.g. in-flight requests); use collectors for set-style values"""
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self, lines: List[str]):
+        lines.append(f"# HELP {self.name} {_escape_help(self.help)}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        for labels, child in self._items():
+            counts, total, count = child.snapshot()
+            cumulative = 0.0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': le})} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {_format_value(count)}")
+
+
+class MetricsRegistry:
+    """Holds metrics and scrape-time collectors and renders the text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]):
+        """Add a callable producing Family objects at scrape time"""
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines: List[str] = []
+        for metric in metrics:
+            metric.render(lines)
+        for collector in collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                lines.append(f"# collector {getattr(collector, '__qualname__', collector)} failed: {e}")
+                continue
+            for family in families:
+                lines.append(f"# HELP {family.name} {_escape_help(family.help)}")
+                lines.append(f"# TYPE {family.name} {family.kind}")
+                for labels, value in family.samples:
+                    lines.append(f"{family.name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: Optional[float]) -> str:
+    if value is None:
+        return "NaN"
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+REGISTRY = MetricsRegistry()
+
+# HTTP
+HTTP_REQUESTS = REGISTRY.counter(
+    "cachecow_http_requests_total", "HTTP requests by route, method and status", ("route", "method", "status")
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "cachecow_http_request_duration_seconds", "HTTP request latency (streams: until the last byte)", ("route", "method")
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "cachecow_http_requests_in_flight", "HTTP requests currently being handled"
+)
+EVENT_LOOP_LAG = REGISTRY.histogram(
+    "cachecow_event_loop_lag_seconds", "How late the event loop ran a periodic timer", buckets=LAG_BUCKETS
+)
+
+# Inference
+QUEUE_WAIT = REGISTRY.histogram(
+    "cachecow_inference_queue_wait_seconds", "Time jobs spent queued before a worker picked them up", ("model",)
+)
+PROMPT_EVAL = REGISTRY.histogram(
+    "cachecow_prompt_eval_seconds", "Time from job start to the first generated token", ("model",)
+)
+GENERATION = REGISTRY.histogram(
+    "cachecow_generation_seconds", "Time from the first to the last generated token", ("model",)
+)
+TIME_TO_FIRST_TOKEN = REGISTRY.histogram(
+    "cachecow_time_to_first_token_seconds", "Time from submission (including queueing) to the first token", ("model",)
+)
+TOKENS_GENERATED = REGISTRY.counter(
+    "cachecow_tokens_generated_total", "Tokens generated", ("model",)
+)
+COMPLETION_TOKENS = REGISTRY.histogram(
+    "cachecow_completion_tokens", "Tokens generated per request", ("model",), buckets=TOKEN_BUCKETS
+)
+TOKENS_PER_SECOND = REGISTRY.histogram(
+    "cachecow_tokens_per_second", "Decode rate per request", ("model",), buckets=RATE_BUCKETS
+)
+GENERATIONS_ABORTED = REGISTRY.counter(
+    "cachecow_generations_aborted_total",
+    "Generations stopped early because the caller went away (cancelled) or its deadline passed",
+    ("model", "reason"),
+)
+STOP_SEQUENCE_HITS = REGISTRY.counter(
+    "cachecow_stop_sequence_hits_total", "Generations ended by a stop sequence or a closed code block", ("model",)
+)
+TOKENS_SAVED = REGISTRY.counter(
+    "cachecow_tokens_saved_total", "Tokens not generated thanks to early stops (up to max_tokens)", ("model",)
+)
+
+PROMPT_TOKENS = REGISTRY.histogram(
+    "cachecow_prompt_tokens", "Prompt tokens per request (template included)", ("model",), buckets=TOKEN_BUCKETS
+)
+CONTEXT_OVERFLOWS = REGISTRY.counter(
+    "cachecow_context_overflows_total",
+    "Requests that did not fit the context window, by action (clamped max_tokens, truncated or rejected)",
+    ("model", "action"),
+)
+
+# Models
+MODEL_LOAD = REGISTRY.histogram(
+    "cachecow_model_load_seconds", "Model load duration", ("model",), buckets=DURATION_BUCKETS
+)
+MODEL_DOWNLOAD = REGISTRY.histogram(
+    "cachecow_model_download_seconds", "Model download duration", ("model",), buckets=DURATION_BUCKETS
+)
+
+# Logging
+LOG_RECORDS = REGISTRY.counter(
+    "cachecow_log_records_total", "Log records emitted by the application"
+)
+LOG_DROPPED = REGISTRY.counter(
+    "cachecow_log_records_dropped_total", "Log records dropped because the log queue was full"
+)
+LOG_EMIT_SECONDS = REGISTRY.counter(
+    "cachecow_log_emit_seconds_total", "Time callers spent handing records to the log queue"
+)
+
+# Sandbox (/workflow code execution)
+SANDBOX_RUNS = REGISTRY.counter(
+    "cachecow_sandbox_runs_total", "Sandbox executions by outcome (success, error, a limit, failed or rejected)", ("outcome",)
+)
+SANDBOX_RUN_SECONDS = REGISTRY.histogram(
+    "cachecow_sandbox_run_seconds", "Wall time of sandbox executions"
+)
+SANDBOX_QUEUE_WAIT = REGISTRY.histogram(
+    "cachecow_sandbox_queue_wait_seconds", "Time executions waited for an idle sandbox worker"
+)
+SANDBOX_RECYCLES = REGISTRY.counter(
+    "cachecow_sandbox_recycles_total", "Sandbox workers replaced, by reason", ("reason",)
+)
+
+# Caches
+CACHE_LOOKUPS = REGISTRY.counter(
+    "cachecow_cache_lookups_total", "Response cache lookups by tier and result", ("tier", "result")
+)
+
+
+def record_generation(model: str, stats: Any):
+    """Record the timings of a finished generation (a streaming.GenerationStats)"""
+    ttft = stats.time_to_first_token
+    if ttft is not None:
+        TIME_TO_FIRST_TOKEN.labels(model).observe(ttft)
+    prompt_eval = stats.prompt_eval_time
+    if prompt_eval is not None:
+        PROMPT_EVAL.labels(model).observe(prompt_eval)
+    generation = stats.generation_time
+    if generation is not None:
+        GENERATION.labels(model).observe(generation)
+    tps = stats.tokens_per_second
+    if tps is not None:
+        TOKENS_PER_SECOND.labels(model).observe(tps)
+    TOKENS_GENERATED.labels(model).inc(stats.tokens)
+    COMPLETION_TOKENS.labels(model).observe(stats.tokens)
+    if stats.stop_sequence_hit:
+        STOP_SEQUENCE_HITS.labels(model).inc()
+    if stats.aborted is not None:
+        GENERATIONS_ABORTED.labels(model, stats.aborted).inc()
+        TOKENS_SAVED.labels(model).inc(stats.tokens_saved)
+
+
+async def monitor_event_loop_lag(interval: float):
+    """Sample event-loop lag until cancelled; blocking calls on the loop show up here"""
+    loop = asyncio.get_running_loop()
+    lag = EVENT_LOOP_LAG.labels()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag.observe(max(0.0, loop.time() - started - interval))
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route request counts, latency and in-flight requests"""
+
+    def __init__(self, app: Callable):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message: Dict[str, Any]):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.labels()
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            # Label by route template (set by the router) to keep cardinality bounded
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            HTTP_REQUESTS.labels(path, method, status[0]).inc()
+            HTTP_LATENCY.labels(path, method).observe(time.perf_counter() - started)
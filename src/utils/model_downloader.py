@@ -1,82 +1,363 @@
 import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set
+
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
-from src.config import Settings
+from src.config import get_settings
 from src.utils.logger import get_logger
 from src.utils.exceptions import ModelLoadError
 
 logger = get_logger(__name__)
 
-def download_model():
-    """Download the GPT4ALL model if it doesn't exist"""
-    settings = Settings()
-    model_path = settings.MODEL_PATH
+READ_CHUNK_SIZE = 1024 * 1024  # Socket read / file write size
+PIECE_RETRIES = 3
+STATE_SAVE_INTERVAL = 2.0  # Seconds between progress checkpoints
 
-    # Create models directory if it doesn't exist
-    os.makedirs(os.path.dirname(model_path), exist_ok=True)
 
-    # Remove incomplete/corrupted model file if it exists
-    if os.path.exists(model_path):
-        os.remove(model_path)
-        logger.info("Removed existing model file for fresh download")
+def load_manifest(manifest_path: str, model_name: str) -> Dict[str, Any]:
+    """Return the manifest entry ({"url", "sha256", "size"}) for a model, if any"""
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path) as f:
+            return json.load(f).get(model_name, {})
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable model manifest {manifest_path}: {str(e)}")
+        return {}
+
+
+def _probe(session: requests.Session, url: str) -> Dict[str, Any]:
+    """HEAD the URL for size, range support and any published SHA-256"""
+    response = session.head(url, allow_redirects=True, timeout=60)
+    response.raise_for_status()
+    info = {
+        "size": int(response.headers.get("content-length", 0)),
+        "ranges": response.headers.get("accept-ranges", "").lower() == "bytes",
+        "sha256": None,
+    }
+    # Hugging Face publishes the LFS object's SHA-256 as X-Linked-Etag on the
+    # redirect response, and the real size as X-Linked-Size
+    for hop in [*response.history, response]:
+        etag = hop.headers.get("x-linked-etag", "").strip('"')
+        if len(etag) == 64:
+            info["sha256"] = etag.lower()
+        linked_size = hop.headers.get("x-linked-size")
+        if linked_size and not info["size"]:
+            info["size"] = int(linked_size)
+    return info
+
+
+class _OrderedHasher:
+    """SHA-256 over pieces that finish out of order
+
+    Pieces are hashed in file order on a background thread while the
+    download continues. Piece data handed over in memory is hashed directly;
+    pieces fed without data (resumed from an earlier run, or dropped when
+    too many are buffered) are read back from the file, which at that point
+    is still in the page cache.
+    """
+
+    def __init__(self, fd: int, piece_size: int, piece_count: int, size: int, max_buffered: int):
+        self.fd = fd
+        self.piece_size = piece_size
+        self.piece_count = piece_count
+        self.size = size
+        self.max_buffered = max_buffered
+        self._sha = hashlib.sha256()
+        self._pending: Dict[int, Optional[bytes]] = {}
+        self._next = 0
+        self._cond = threading.Condition()
+        self._error: Optional[BaseException] = None
+        self._aborted = False
+        self._thread = threading.Thread(target=self._run, name="model-hasher", daemon=True)
+        self._thread.start()
+
+    def feed(self, index: int, data: Optional[bytes]):
+        with self._cond:
+            buffered = sum(1 for value in self._pending.values() if value is not None)
+            self._pending[index] = data if buffered < self.max_buffered else None
+            self._cond.notify()
+
+    def abort(self):
+        """Stop the hashing thread (the download failed)"""
+        with self._cond:
+            self._aborted = True
+            self._cond.notify()
+
+    def _read_piece(self, index: int) -> bytes:
+        offset = index * self.piece_size
+        length = min(self.piece_size, self.size - offset)
+        chunks = []
+        while length > 0:
+            chunk = os.pread(self.fd, min(length, READ_CHUNK_SIZE * 8), offset)
+            if not chunk:
+                raise ModelLoadError(f"Unexpected end of file while hashing piece {index}")
+            chunks.append(chunk)
+            offset += len(chunk)
+            length -= len(chunk)
+        return b"".join(chunks)
+
+    def _run(self):
+        try:
+            while self._next < self.piece_count:
+                with self._cond:
+                    while self._next not in self._pending and not self._aborted:
+                        self._cond.wait()
+                    if self._aborted:
+                        return
+                    data = self._pending.pop(self._next)
+                self._sha.update(data if data is not None else self._read_piece(self._next))
+                self._next += 1
+        except BaseException as e:
+            self._error = e
+
+    def hexdigest(self) -> str:
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._sha.hexdigest()
+
+
+class _DownloadState:
+    """Completed-piece checkpoint stored next to the .part file"""
+
+    def __init__(self, path: str, url: str, size: int, piece_size: int):
+        self.path = path
+        self.url = url
+        self.size = size
+        self.piece_size = piece_size
+        self.done: Set[int] = set()
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+
+    def load(self) -> bool:
+        """Load a compatible checkpoint; returns False if none applies"""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if (data.get("url"), data.get("size"), data.get("piece_size")) != (self.url, self.size, self.piece_size):
+            return False
+        self.done = set(data.get("done", []))
+        return True
+
+    def mark_done(self, index: int):
+        with self._lock:
+            self.done.add(index)
+            if time.monotonic() - self._saved_at >= STATE_SAVE_INTERVAL:
+                self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"url": self.url, "size": self.size, "piece_size": self.piece_size, "done": sorted(self.done)}, f)
+        os.replace(tmp_path, self.path)
+        self._saved_at = time.monotonic()
 
-    # Use a stable, direct download URL for GGUF model
-    url = "https://huggingface.co/TheBloke/Llama-2-7B-Chat-GGUF/resolve/main/llama-2-7b-chat.Q4_0.gguf"
+    def save(self):
+        with self._lock:
+            self._save()
 
+
+def _fetch_piece(
+    session: requests.Session,
+    url: str,
+    fd: int,
+    index: int,
+    piece_size: int,
+    size: int,
+    pbar: tqdm,
+) -> bytes:
+    """Download one byte range and write it at its offset"""
+    start = index * piece_size
+    end = min(start + piece_size, size) - 1
+    last_error: Optional[Exception] = None
+    for attempt in range(PIECE_RETRIES):
+        received = bytearray()
+        try:
+            with session.get(url, headers={"Range": f"bytes={start}-{end}"}, stream=True, timeout=(30, 300)) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise ModelLoadError(f"Server ignored range request (status {response.status_code})")
+                for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+                    os.pwrite(fd, chunk, start + len(received))
+                    received += chunk
+                    pbar.update(len(chunk))
+            if len(received) != end - start + 1:
+                raise ModelLoadError(f"Piece {index} is {len(received)} bytes, expected {end - start + 1}")
+            return bytes(received)
+        except (requests.exceptions.RequestException, ModelLoadError) as e:
+            pbar.update(-len(received))
+            last_error = e
+            logger.warning(f"Piece {index} failed (attempt {attempt + 1}/{PIECE_RETRIES}): {str(e)}")
+            time.sleep(2 ** attempt)
+    raise ModelLoadError(f"Failed to download piece {index}: {str(last_error)}")
+
+
+def _download_ranges(
+    session: requests.Session,
+    url: str,
+    part_path: str,
+    size: int,
+    piece_size: int,
+    connections: int,
+) -> str:
+    """Fetch missing pieces in parallel into the preallocated .part file; returns the SHA-256"""
+    piece_count = max(1, -(-size // piece_size))
+    state = _DownloadState(f"{part_path}.json", url, size, piece_size)
+    resumed = os.path.exists(part_path) and state.load()
+    if not resumed:
+        state.done = set()
+
+    fd = os.open(part_path, os.O_RDWR | os.O_CREAT)
     try:
-        logger.info(f"Downloading model from {url}")
-        logger.info("Attempting to download without auth...")
+        if os.fstat(fd).st_size != size:
+            os.ftruncate(fd, size)  # Preallocate so pieces can be written at their offsets
+        state.save()
 
-        # Stream with a longer timeout and larger chunk size
-        response = requests.get(url, stream=True, timeout=1800)  # 30 minute timeout
+        done_bytes = sum(min(piece_size, size - i * piece_size) for i in state.done)
+        if resumed:
+            logger.info(f"Resuming download: {done_bytes / 1024 / 1024:.2f} MB of {size / 1024 / 1024:.2f} MB already present")
 
-        # Log response details for debugging
-        logger.info(f"Response status code: {response.status_code}")
-        logger.info(f"Response headers: {response.headers}")
+        hasher = _OrderedHasher(fd, piece_size, piece_count, size, max_buffered=connections * 2)
+        for index in sorted(state.done):
+            hasher.feed(index, None)
+        missing: List[int] = [i for i in range(piece_count) if i not in state.done]
 
-        response.raise_for_status()
+        failed = threading.Event()
 
-        total_size = int(response.headers.get('content-length', 0))
-        logger.info(f"Expected model size: {total_size / 1024 / 1024:.2f} MB")
+        def worker(index: int):
+            if failed.is_set():
+                return
+            try:
+                data = _fetch_piece(session, url, fd, index, piece_size, size, pbar)
+            except Exception:
+                failed.set()
+                raise
+            state.mark_done(index)
+            hasher.feed(index, data)
 
-        if total_size < 500_000_000:  # Less than 500MB
-            raise ModelLoadError("Model file size is suspiciously small")
+        try:
+            with tqdm(desc="Downloading model", total=size, initial=done_bytes, unit="iB", unit_scale=True, unit_divisor=1024) as pbar:
+                with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="model-download") as pool:
+                    # Pieces are submitted in file order so the hasher rarely waits
+                    for future in [pool.submit(worker, index) for index in missing]:
+                        future.result()
+        except BaseException:
+            hasher.abort()
+            raise
+        finally:
+            # Checkpoint whatever finished so the next attempt resumes from it
+            state.save()
 
-        # Download with progress bar and verification
-        with open(model_path, 'wb') as f, tqdm(
-            desc="Downloading model",
-            total=total_size,
-            unit='iB',
-            unit_scale=True,
-            unit_divisor=1024,
+        os.fsync(fd)
+        return hasher.hexdigest()
+    finally:
+        os.close(fd)
+
+
+def _download_single(session: requests.Session, url: str, part_path: str) -> str:
+    """Sequential download for servers without range support; returns the SHA-256"""
+    sha = hashlib.sha256()
+    with session.get(url, stream=True, timeout=(30, 1800)) as response:
+        response.raise_for_status()
+        total_size = int(response.headers.get("content-length", 0))
+        with open(part_path, "wb", buffering=READ_CHUNK_SIZE * 8) as f, tqdm(
+            desc="Downloading model", total=total_size, unit="iB", unit_scale=True, unit_divisor=1024
         ) as pbar:
-            downloaded_size = 0
-            for chunk in response.iter_content(chunk_size=8192):
-                size = f.write(chunk)
-                pbar.update(size)
-                downloaded_size += size
-                if downloaded_size % (100 * 1024 * 1024) == 0:  # Log every 100MB
-                    logger.info(f"Downloaded {downloaded_size / 1024 / 1024:.2f} MB of {total_size / 1024 / 1024:.2f} MB")
+            for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+                f.write(chunk)
+                sha.update(chunk)
+                pbar.update(len(chunk))
+            f.flush()
+            os.fsync(f.fileno())
+    return sha.hexdigest()
+
+
+def download_model(
+    url: Optional[str] = None,
+    dest: Optional[str] = None,
+    sha256: Optional[str] = None,
+    connections: Optional[int] = None,
+    piece_size: Optional[int] = None,
+):
+    """Download the GPT4ALL model if it doesn't exist
+
+    Downloads resume from a .part file, fetch byte ranges in parallel,
+    verify the SHA-256 (from the argument, the manifest, or the server's
+    published hash) while downloading, and only move the file into place
+    once it is complete and verified.
+    """
+    settings = get_settings()
+    model_path = dest or settings.MODEL_PATH
+    model_name = os.path.basename(model_path)
+    manifest = load_manifest(settings.MODEL_MANIFEST_PATH, model_name)
+    # MODEL_URL/MODEL_SHA256 describe the default model only
+    is_default = model_name == settings.MODEL_NAME
+    url = url or manifest.get("url") or (settings.MODEL_URL if is_default else None)
+    if not url:
+        raise ModelLoadError(f"No download URL configured for model {model_name}")
+    connections = connections or settings.MODEL_DOWNLOAD_CONNECTIONS
+    piece_size = piece_size or settings.MODEL_DOWNLOAD_PIECE_MB * 1024 * 1024
+    part_path = f"{model_path}.part"
+
+    # Create models directory if it doesn't exist
+    os.makedirs(os.path.dirname(model_path) or ".", exist_ok=True)
+
+    try:
+        logger.info(f"Downloading model from {url}")
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=connections)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        info = _probe(session, url)
+        size = manifest.get("size") or info["size"]
+        expected_sha256 = (sha256 or manifest.get("sha256") or (settings.MODEL_SHA256 if is_default else None) or info["sha256"] or "").lower() or None
+        logger.info(f"Expected model size: {size / 1024 / 1024:.2f} MB")
+
+        if info["ranges"] and size:
+            actual_sha256 = _download_ranges(session, url, part_path, size, piece_size, connections)
+        else:
+            logger.info("Server does not support range requests; downloading on a single connection")
+            actual_sha256 = _download_single(session, url, part_path)
 
         # Verify the downloaded file
-        actual_size = os.path.getsize(model_path)
+        actual_size = os.path.getsize(part_path)
         logger.info(f"Downloaded size: {actual_size / 1024 / 1024:.2f} MB")
-
-        if actual_size != total_size:
+        if size and actual_size != size:
             raise ModelLoadError(
-                f"Downloaded file size ({actual_size}) does not match expected size ({total_size})"
+                f"Downloaded file size ({actual_size}) does not match expected size ({size})"
             )
+        if expected_sha256 is None:
+            logger.warning(f"No SHA-256 available for {url}; skipping checksum verification")
+        elif actual_sha256 != expected_sha256:
+            # A corrupt file cannot be resumed into a good one
+            os.remove(part_path)
+            raise ModelLoadError(f"SHA-256 mismatch: expected {expected_sha256}, got {actual_sha256}")
+
+        os.replace(part_path, model_path)
+        state_path = f"{part_path}.json"
+        if os.path.exists(state_path):
+            os.remove(state_path)
 
         logger.info(f"Model downloaded and verified successfully at {model_path}")
         return True
 
     except requests.exceptions.RequestException as e:
+        # Keep the .part file and checkpoint so the next attempt resumes
         logger.error(f"Network error downloading model: {str(e)}")
-        if os.path.exists(model_path):
-            os.remove(model_path)
         raise ModelLoadError(f"Failed to download model: {str(e)}")
+    except ModelLoadError as e:
+        logger.error(f"Error downloading model: {str(e)}")
+        raise
     except Exception as e:
         logger.error(f"Unexpected error during model download: {str(e)}")
-        if os.path.exists(model_path):
-            os.remove(model_path)
-        raise ModelLoadError(f"Unexpected error during model download: {str(e)}")
\ No newline at end of file
+        raise ModelLoadError(f"Unexpected error during model download: {str(e)}")
@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture
+def anyio_backend():
+    """Run async tests (marked anyio) on asyncio only"""
+    return "asyncio"
@@ -0,0 +1,104 @@
+"""The fake model backend, and the service and routes driven by it"""
+import time
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from scripts.fake_model import FakeGPT4All
+from src.config import get_settings
+from src.services import service_container
+from src.services.gpt4all_service import GPT4ALLService
+
+
+@pytest.fixture
+def fake_settings(tmp_path, monkeypatch):
+    """Settings for a service running FakeGPT4All out of tmp_path"""
+    (tmp_path / "fake.gguf").touch()
+    env = {
+        "MODEL_DIR": str(tmp_path),
+        "MODEL_NAME": "fake.gguf",
+        "MODEL_MANIFEST_PATH": str(tmp_path / "manifest.json"),
+        "MODEL_FACTORY": "scripts.fake_model:FakeGPT4All",
+        "CACHE_DISK_ENABLED": "false",
+        "PROJECTS_DIR": str(tmp_path / "projects"),
+        "WARMUP_ENABLED": "false",
+        "SANDBOX_POOL_SIZE": "1",
+        "FAKE_MODEL_TOKENS_PER_SECOND": "200",
+        "FAKE_MODEL_OUTPUT_TOKENS": "16",
+    }
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    get_settings.cache_clear()
+    monkeypatch.setattr(GPT4ALLService, "_instance", None)
+    monkeypatch.setattr(service_container, "gpt_service", None)
+    yield
+    get_settings.cache_clear()
+
+
+@pytest.fixture
+async def service(fake_settings):
+    service = GPT4ALLService()
+    await service.ensure_initialized()
+    yield service
+    await service.shutdown()
+
+
+def test_fake_model_is_deterministic_and_honours_max_tokens(monkeypatch):
+    monkeypatch.setenv("FAKE_MODEL_TOKENS_PER_SECOND", "1000")
+    monkeypatch.setenv("FAKE_MODEL_OUTPUT_TOKENS", "64")
+    model = FakeGPT4All("fake.gguf")
+
+    assert model.generate("def add(a, b):", max_tokens=10) == FakeGPT4All("fake.gguf").generate("def add(a, b):", max_tokens=10)
+    assert model.generate("def add(a, b):", max_tokens=10) != model.generate("def sub(a, b):", max_tokens=10)
+    tokens = []
+    model.generate("count", max_tokens=10, callback=lambda i, token: tokens.append(token) is None)
+    assert len(tokens) == 10
+    stopped = []
+    model.generate("count", max_tokens=10, callback=lambda i, token: stopped.append(token) or len(stopped) < 3)
+    assert stopped == tokens[:3]
+
+
+def test_fake_model_follows_its_latency_profile(monkeypatch):
+    monkeypatch.setenv("FAKE_MODEL_TOKENS_PER_SECOND", "100")
+    monkeypatch.setenv("FAKE_MODEL_PROMPT_TPS", "1000000")
+    model = FakeGPT4All("fake.gguf")
+
+    started = time.perf_counter()
+    model.generate("timed", max_tokens=10)
+    assert time.perf_counter() - started >= 0.09
+
+
+@pytest.mark.anyio
+async def test_service_caches_and_coalesces_generations(service):
+    first = await service.generate("def add(a, b):", max_tokens=8)
+    assert first and await service.generate("def add(a, b):", max_tokens=8) == first
+    assert service.cache_stats()["memory_hits"] == 1
+
+    results = await asyncio.gather(*(service.generate("def mul(a, b):", max_tokens=8) for _ in range(4)))
+    assert len(set(results)) == 1
+    assert service.coalescing_stats()["coalesced"] == 3
+
+
+@pytest.mark.anyio
+async def test_service_streams_tokens_then_a_summary(service):
+    events = [event async for event in service.generate_stream("def sub(a, b):", max_tokens=6)]
+
+    tokens = [event["token"] for event in events if "token" in event]
+    assert len(tokens) == 6 and events[-1]["done"] is True
+    # A finished stream fills the cache for the same request
+    assert await service.generate("def sub(a, b):", max_tokens=6) == "".join(tokens).strip()
+    assert service.cache_stats()["memory_hits"] == 1
+
+
+def test_routes_serve_the_fake_model(fake_settings):
+    from src.main import app
+
+    with TestClient(app) as client:
+        deadline = time.monotonic() + 30
+        while not client.get("/ready").json().get("ready") and time.monotonic() < deadline:
+            time.sleep(0.05)
+        response = client.post("/generate", json={"prompt": "def add(a, b):", "max_tokens": 8})
+        assert response.status_code == 200
+        assert response.json()["status"] == "success"
+        assert client.post("/generate", json={"prompt": "def add(a, b):", "max_tokens": 0}).status_code == 422
@@ -0,0 +1,22 @@
+"""Summary statistics of the load generator"""
+import sys
+from pathlib import Path
+
+import pytest
+
+# load_test imports its sibling scripts as top-level modules
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+from load_test import percentile  # noqa: E402
+
+
+@pytest.mark.parametrize(
+    "count,q,expected",
+    [(10, 50, 5), (10, 90, 9), (10, 100, 10), (100, 95, 95), (100, 99, 99), (1, 50, 1), (4, 0, 1)],
+)
+def test_percentile_is_nearest_rank(count, q, expected):
+    values = list(range(count, 0, -1))  # unsorted input
+    assert percentile(values, q) == expected
+
+
+def test_percentile_of_nothing():
+    assert percentile([], 50) is None
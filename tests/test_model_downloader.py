@@ -0,0 +1,123 @@
+"""Resumable, checksum-verified model downloads against a local HTTP server"""
+import os
+import re
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.utils import model_downloader
+from src.utils.model_downloader import download_model
+from src.utils.exceptions import ModelLoadError
+
+PIECE = 64 * 1024
+DATA = os.urandom(10 * PIECE + 123)
+SHA256 = hashlib.sha256(DATA).hexdigest()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _headers(self, status: int, length: int, extra=()):
+        self.send_response(status)
+        self.send_header("Content-Length", str(length))
+        if self.server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        if self.server.published_sha256:
+            self.send_header("X-Linked-Etag", f'"{self.server.published_sha256}"')
+        for name, value in extra:
+            self.send_header(name, value)
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._headers(200, len(DATA))
+
+    def do_GET(self):
+        match = re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+        if not (match and self.server.ranges):
+            self.server.requests.append(None)
+            self._headers(200, len(DATA))
+            self.wfile.write(DATA)
+            return
+        start, end = int(match[1]), int(match[2])
+        self.server.requests.append(start)
+        if self.server.fail_from is not None and start >= self.server.fail_from:
+            self._headers(503, 0)
+            return
+        self._headers(206, end - start + 1, [("Content-Range", f"bytes {start}-{end}/{len(DATA)}")])
+        self.wfile.write(DATA[start:end + 1])
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.ranges = True
+    httpd.published_sha256 = None
+    httpd.fail_from = None
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/model.gguf"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(model_downloader, "PIECE_RETRIES", 1)
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_parallel_range_download_is_verified_and_moved_into_place(server, tmp_path):
+    dest = str(tmp_path / "model.gguf")
+    assert download_model(url=server.url, dest=dest, sha256=SHA256, connections=4, piece_size=PIECE)
+
+    assert _read(dest) == DATA
+    assert sorted(server.requests) == [i * PIECE for i in range(11)]
+    assert not os.path.exists(dest + ".part") and not os.path.exists(dest + ".part.json")
+
+
+def test_interrupted_download_resumes_only_missing_pieces(server, tmp_path):
+    dest = str(tmp_path / "model.gguf")
+    server.fail_from = 6 * PIECE
+    with pytest.raises(ModelLoadError):
+        download_model(url=server.url, dest=dest, sha256=SHA256, connections=2, piece_size=PIECE)
+    assert not os.path.exists(dest)
+    assert os.path.exists(dest + ".part") and os.path.exists(dest + ".part.json")
+
+    server.fail_from = None
+    server.requests.clear()
+    assert download_model(url=server.url, dest=dest, sha256=SHA256, connections=2, piece_size=PIECE)
+
+    assert _read(dest) == DATA
+    assert sorted(server.requests) == [i * PIECE for i in range(6, 11)]
+
+
+def test_checksum_mismatch_discards_the_download(server, tmp_path):
+    dest = str(tmp_path / "model.gguf")
+    with pytest.raises(ModelLoadError, match="SHA-256 mismatch"):
+        download_model(url=server.url, dest=dest, sha256="0" * 64, connections=4, piece_size=PIECE)
+
+    assert not os.path.exists(dest) and not os.path.exists(dest + ".part")
+
+
+def test_server_without_ranges_is_verified_against_its_published_hash(server, tmp_path):
+    dest = str(tmp_path / "model.gguf")
+    server.ranges = False
+    server.published_sha256 = SHA256
+    assert download_model(url=server.url, dest=dest, connections=4, piece_size=PIECE)
+
+    assert _read(dest) == DATA
+    assert server.requests == [None]
+
+    server.published_sha256 = "f" * 64
+    os.remove(dest)
+    with pytest.raises(ModelLoadError, match="SHA-256 mismatch"):
+        download_model(url=server.url, dest=dest, connections=4, piece_size=PIECE)
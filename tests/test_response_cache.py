@@ -0,0 +1,86 @@
+"""Response cache tiers: hits, misses and expiry"""
+import time
+
+import numpy as np
+import pytest
+
+from src.services.response_cache import DiskCache, ResponseCache, make_cache_key
+from src.services.semantic_cache import HashingEmbedder, SemanticCache
+
+pytestmark = pytest.mark.anyio
+
+PARAMS = {"model": "fake.gguf", "max_tokens": 16, "temperature": 0.0}
+
+
+def test_cache_key_normalizes_whitespace_and_keeps_params_apart():
+    assert make_cache_key("def add(a, b):", PARAMS) == make_cache_key("  def add(a,\n b):  ", PARAMS)
+    assert make_cache_key("def add(a, b):", PARAMS) != make_cache_key("def add(a, b):", {**PARAMS, "max_tokens": 32})
+
+
+async def test_memory_hit_miss_and_ttl():
+    cache = ResponseCache(max_entries=8, ttl_seconds=0.2)
+    key = make_cache_key("print(1)", PARAMS)
+
+    assert await cache.lookup(key) is None
+    await cache.store(key, "print(1)\n")
+    assert await cache.lookup(key) == "print(1)\n"
+
+    time.sleep(0.3)
+    assert await cache.lookup(key) is None
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["misses"], stats["expirations"]) == (1, 2, 1)
+
+
+async def test_memory_tier_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2, ttl_seconds=60)
+    for key in ("a", "b"):
+        await cache.store(key, key.upper())
+    assert await cache.lookup("a") == "A"  # "b" is now the least recently used
+    await cache.store("c", "C")
+
+    assert await cache.lookup("b") is None
+    assert await cache.lookup("a") == "A"
+    assert cache.stats()["evictions"] == 1
+
+
+async def test_disk_tier_survives_a_new_memory_tier_until_it_expires(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first = ResponseCache(max_entries=8, ttl_seconds=60, disk=DiskCache(path, max_entries=100, ttl_seconds=0.5))
+    await first.store("key", "value")
+    first.close()
+
+    second = ResponseCache(max_entries=8, ttl_seconds=60, disk=DiskCache(path, max_entries=100, ttl_seconds=0.5))
+    assert await second.lookup("key") == "value"  # from disk, then promoted
+    assert await second.lookup("key") == "value"
+    assert (second.stats()["disk_hits"], second.stats()["memory_hits"]) == (1, 1)
+
+    assert second.disk.get("key") == "value"
+    time.sleep(0.6)
+    assert second.disk.get("key") is None
+    second.close()
+
+
+async def test_semantic_cache_matches_near_duplicates_within_a_params_group():
+    cache = SemanticCache(HashingEmbedder(dim=1024), max_entries=4, threshold=0.8)
+    group = make_cache_key("", PARAMS)
+    other_group = make_cache_key("", {**PARAMS, "temperature": 0.9})
+
+    await cache.store("Write a Python function that reverses a string", group, "def rev(s): return s[::-1]")
+    assert await cache.lookup("write a python function that reverses a string!", group) == "def rev(s): return s[::-1]"
+    assert await cache.lookup("write a python function that reverses a string!", other_group) is None
+    assert await cache.lookup("Compute the SHA-256 of a file in Go", group) is None
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 2)
+
+
+def test_semantic_cache_overwrites_least_recently_used_row_when_full():
+    cache = SemanticCache(HashingEmbedder(dim=8), max_entries=2, threshold=0.99)
+    vectors = np.eye(3, 8, dtype=np.float32)
+    cache.add(vectors[0], 1, "zero")
+    cache.add(vectors[1], 1, "one")
+    assert cache.search(vectors[0], 1) == "zero"  # "one" becomes the oldest
+    cache.add(vectors[2], 1, "two")
+
+    assert cache.search(vectors[1], 1) is None
+    assert cache.search(vectors[0], 1) == "zero"
+    assert cache.search(vectors[2], 1) == "two"
+    assert cache.stats()["evictions"] == 1
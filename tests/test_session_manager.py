@@ -0,0 +1,98 @@
+"""Session contexts against the fake backend: the live-context cap and cancelled turns"""
+import asyncio
+import threading
+
+import pytest
+
+from scripts.fake_model import FakeGPT4All
+from src.services.prompt_manager import PromptManager, create_tokenizer
+from src.services.session_manager import SessionManager
+
+
+class TrackedModel(FakeGPT4All):
+    """Records whether a generation is running and how many tokens it produced"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.generating = threading.Event()
+        self.produced = 0
+
+    def generate(self, prompt, max_tokens=200, callback=None, **kwargs):
+        def counting(token_id, token):
+            self.produced += 1
+            return callback(token_id, token) if callback is not None else True
+
+        self.generating.set()
+        try:
+            return super().generate(prompt, max_tokens=max_tokens, callback=counting, **kwargs)
+        finally:
+            self.generating.clear()
+
+
+@pytest.fixture
+def fake_env(monkeypatch):
+    monkeypatch.setenv("FAKE_MODEL_PROMPT_TPS", "100000")
+    monkeypatch.setenv("FAKE_MODEL_TOKENS_PER_SECOND", "200")
+    monkeypatch.setenv("FAKE_MODEL_OUTPUT_TOKENS", "400")
+
+
+@pytest.fixture
+def make_manager(fake_env):
+    def make(max_live: int):
+        opened, released = [], []
+
+        async def open_model():
+            model = TrackedModel("fake.gguf")
+            opened.append(model)
+            return model
+
+        def release_model():
+            # A context must never be released while its model is still generating
+            released.append(any(model.generating.is_set() for model in opened))
+
+        prompts = PromptManager(create_tokenizer("estimate"), "reject", 16, 128)
+        manager = SessionManager(
+            open_model, release_model, prompts, context_length=4096, max_sessions=8,
+            max_live=max_live, idle_timeout=3600.0, session_ttl=3600.0, max_tokens=400,
+        )
+        return manager, opened, released
+
+    return make
+
+
+def submit(fn, on_cancel):
+    return asyncio.to_thread(fn, None)
+
+
+@pytest.mark.anyio
+async def test_busy_sessions_count_towards_live_cap(make_manager):
+    manager, opened, released = make_manager(max_live=2)
+    busy, idle, new = (manager.create("You write Python.") for _ in range(3))
+    await manager.generate(busy.id, "first", submit, max_tokens=1)
+    await manager.generate(idle.id, "second", submit, max_tokens=1)
+
+    async with busy.lock:  # mid-turn: cannot be closed, but still holds a context
+        manager._make_room(new)
+
+    assert busy.live and not idle.live
+    assert manager.context_evictions == 1
+
+
+@pytest.mark.anyio
+async def test_cancelled_turn_stops_model_before_closing_context(make_manager):
+    manager, opened, released = make_manager(max_live=2)
+    session = manager.create("You write Python.")
+    turn = asyncio.ensure_future(manager.generate(session.id, "def add(a, b):", submit))
+    while not opened or not opened[0].generating.is_set():
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.05)
+
+    turn.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await turn
+
+    model = opened[0]
+    assert not model.generating.is_set()
+    assert model.produced < model.output_tokens  # stopped at the next token, not at the end
+    assert released == [False]
+    assert not session.live and session.turns == []
@@ -0,0 +1,88 @@
+"""Model worker pool round trips against the fake backend"""
+import os
+import signal
+
+import pytest
+
+from scripts.fake_model import FakeGPT4All
+from src.services.worker_pool import ModelWorkerPool
+from src.utils.exceptions import ModelLoadError
+
+FACTORY = "scripts.fake_model:FakeGPT4All"
+
+
+@pytest.fixture
+def fake_env(monkeypatch):
+    # Spawned workers inherit the environment, so the fake's latency profile applies there too
+    monkeypatch.setenv("FAKE_MODEL_TOKENS_PER_SECOND", "500")
+    monkeypatch.setenv("FAKE_MODEL_PROMPT_TPS", "100000")
+    monkeypatch.setenv("FAKE_MODEL_OUTPUT_TOKENS", "32")
+
+
+@pytest.fixture
+def make_pool(fake_env):
+    pools = []
+
+    def make(**kwargs) -> ModelWorkerPool:
+        options = {"size": 1, "health_interval": 3600.0, "start_timeout": 60.0, **kwargs}
+        pool = ModelWorkerPool(FACTORY, {"model_name": "fake.gguf"}, **options)
+        pools.append(pool)
+        pool.start()
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+def test_generate_matches_in_process_model(make_pool):
+    pool = make_pool()
+    expected = FakeGPT4All("fake.gguf").generate("def add(a, b):", max_tokens=8)
+
+    assert pool.generate("def add(a, b):", max_tokens=8) == expected
+    streamed = []
+    assert pool.generate("def add(a, b):", callback=lambda i, token: streamed.append(token) is None, max_tokens=8) == expected
+    assert "".join(streamed) == expected
+    assert pool.stats()[0]["requests"] == 2
+
+
+def test_cancel_stops_generation_and_keeps_the_worker_usable(make_pool):
+    pool = make_pool()
+    full = pool.generate("cancel me", max_tokens=32)
+
+    seen = []
+    partial = pool.generate("cancel me", callback=lambda i, token: seen.append(token) or len(seen) < 3, max_tokens=32)
+    assert len(seen) < 32 and full.startswith(partial)
+    # Tokens sent before the cancel arrived must not leak into the next request
+    assert pool.generate("cancel me", max_tokens=32) == full
+    assert pool.stats()[0]["restarts"] == 0
+
+
+def test_worker_is_recycled_after_max_requests(make_pool):
+    pool = make_pool(max_requests=2)
+    first_pid = pool.stats()[0]["pid"]
+
+    pool.generate("one", max_tokens=4)
+    assert pool.stats()[0]["pid"] == first_pid
+    pool.generate("two", max_tokens=4)
+    stats = pool.stats()[0]
+    assert (stats["restarts"], stats["alive"]) == (1, True)
+    assert stats["pid"] != first_pid
+    assert pool.generate("three", max_tokens=4) == FakeGPT4All("fake.gguf").generate("three", max_tokens=4)
+
+
+def test_dead_worker_is_restarted_on_the_next_request(make_pool):
+    pool = make_pool()
+    pid = pool.stats()[0]["pid"]
+    os.kill(pid, signal.SIGKILL)
+    pool._workers[0].process.join(5)
+
+    assert pool.generate("after crash", max_tokens=4) == FakeGPT4All("fake.gguf").generate("after crash", max_tokens=4)
+    assert pool.stats()[0]["restarts"] == 1
+    assert pool.stats()[0]["pid"] != pid
+
+
+def test_start_fails_when_the_model_cannot_load(fake_env):
+    pool = ModelWorkerPool("scripts.fake_model:Missing", {"model_name": "fake.gguf"}, size=1, start_timeout=60.0)
+    with pytest.raises(ModelLoadError):
+        pool.start()